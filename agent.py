@@ -0,0 +1,294 @@
+"""
+Locka エージェント（解錠済みの保管庫をメモリに置き、Unix ドメインソケットで検索・取り出しに答える）。
+
+    python agent.py                 # マスターパスワードを1回だけ聞いて待ち受ける（Ctrl+C で終了）
+    python locka.py get github      # エージェントが動いていれば KDF なしで答えが返る
+
+- ソケットは本人だけが入れるディレクトリ（0700）に置き、ソケット自体も 0600 にする
+- 接続ごとに相手のプロセスのユーザー（SO_PEERCRED）を確かめ、本人以外は断る（取れない環境でも断る）
+- IDLE_TIMEOUT_SEC のあいだ要求がなければ、GUI の自動ロックと同じく復号済みのデータを捨てて終了する
+  （エージェントはパスワードを聞き直せないので、ロック＝終了）
+- 読み取り専用。ほかのプロセス（GUI・CLI）が保存したら、答える前に変わった分だけ読み直す（Vault.refresh）
+
+要求・応答は1行1つの JSON:
+    {"op": "get", "query": "github", "tags": null, "field": "pw"}  -> {"ok": true, "result": {"matches": [...], "value": "..."}}
+    {"op": "search", "keyword": "git", "fuzzy": false, "tags": null, "order": "name_asc"}
+    {"op": "ping"} / {"op": "stop"}
+    失敗は {"ok": false, "error": "..."}
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import getpass
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from metrics import METRICS
+
+
+AGENT_ENV = "LOCKA_AGENT_SOCKET"  # ソケットのパスを変えるときの環境変数
+AGENT_CACHE_LIMIT = 256  # 検索結果を覚えておく件数（同じ問い合わせは検索し直さない）
+AGENT_IDLE_CHECK_SEC = 1.0  # 無操作チェック間隔（秒）
+AGENT_CLIENT_TIMEOUT = 5.0  # クライアントが応答を待つ上限（秒）
+_PEERCRED = struct.Struct("3i")  # struct ucred（pid, uid, gid）
+
+
+def available() -> bool:
+    """このOSでエージェントを使えるか（Unix ドメインソケットと、相手のユーザーを確かめる SO_PEERCRED が要る）"""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "SO_PEERCRED") and hasattr(os, "getuid")
+
+
+def default_socket_path() -> Path:
+    """$XDG_RUNTIME_DIR/locka/agent.sock（なければ一時ディレクトリの下のユーザーごとのディレクトリ）"""
+    env = os.environ.get(AGENT_ENV, "").strip()
+    if env:
+        return Path(env)
+    runtime = os.environ.get("XDG_RUNTIME_DIR", "").strip()
+    base = Path(runtime) / "locka" if runtime else Path(tempfile.gettempdir()) / f"locka-{os.getuid()}"
+    return base / "agent.sock"
+
+
+def peer_uid(sock: socket.socket) -> int | None:
+    """ソケットの相手のユーザーID（SO_PEERCRED が使えない環境では None）"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    _, uid, _ = _PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+    return uid
+
+
+def _prepare_dir(path: Path):
+    """ソケットを置くディレクトリを本人専用（0700）で用意する。他人の持ち物や緩い権限なら使わない"""
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    st = path.parent.stat()
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ValueError(f"ソケットのディレクトリの所有者か権限が不正です: {path.parent}")
+
+
+class Agent:
+    """解錠済みの Vault を持って要求に答える（要求の処理は1スレッドで順に行う）"""
+
+    def __init__(self, vault, socket_path: Path, idle_timeout: float):
+        self.vault = vault
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self._cache: dict[tuple, list] = {}  # 問い合わせ -> 該当 record（保管庫が更新されたら捨てる）
+        self._vault_path = vault.store.path.resolve()
+        self._stopped: asyncio.Event | None = None
+        self._last_request = 0.0
+
+    # ---- 待ち受け ----
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._last_request = loop.time()
+
+        _prepare_dir(self.socket_path)
+        if self.socket_path.exists():
+            if _agent_running(self.socket_path):
+                raise ValueError(f"エージェントはすでに動いています: {self.socket_path}")
+            self.socket_path.unlink()  # 前回落ちたときの残り
+        old_umask = os.umask(0o177)  # 作った瞬間から 0600
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+        finally:
+            os.umask(old_umask)
+
+        idle = asyncio.create_task(self._watch_idle())
+        try:
+            await self._stopped.wait()
+        finally:
+            idle.cancel()
+            server.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+            self.lock()
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def lock(self):
+        """復号済みのデータと鍵を捨てる"""
+        self._cache.clear()
+        self.vault.lock()
+        self.vault.secrets = None
+        self.vault.store.session = None
+
+    async def _watch_idle(self):
+        loop = asyncio.get_running_loop()
+        while loop.time() - self._last_request < self.idle_timeout:
+            await asyncio.sleep(AGENT_IDLE_CHECK_SEC)
+        self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if peer_uid(writer.get_extra_info("socket")) != os.getuid():
+                writer.write(_encode({"ok": False, "error": "このユーザーからの接続は受け付けません。"}))
+                return
+            while not self._stopped.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                self._last_request = asyncio.get_running_loop().time()
+                writer.write(_encode(self.dispatch(line)))
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass  # 相手が切った・行が長すぎる
+        finally:
+            writer.close()
+
+    # ---- 要求の処理 ----
+    def dispatch(self, line: bytes) -> dict:
+        with METRICS.span("agent_request"):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("要求は JSON のオブジェクトで送ってください。")
+                wanted = request.get("vault")
+                if wanted and Path(str(wanted)).resolve() != self._vault_path:
+                    # 別の保管庫についての問い合わせ（クライアントは自分で解錠し直す）
+                    return {"ok": False, "error": "エージェントが開いている保管庫と異なります。", "vault": str(self._vault_path)}
+                if self.vault.refresh():
+                    # 別のプロセス（GUI など）が保存した。変わった record だけ読み直したので、覚えた結果は捨てる
+                    self._cache.clear()
+                return {"ok": True, "result": self._run(request)}
+            except (OSError, ValueError) as e:
+                return {"ok": False, "error": str(e)}
+
+    def _run(self, request: dict) -> Any:
+        op = request.get("op")
+        if op == "get":
+            query = str(request.get("query", ""))
+            tags = _tags_of(request)
+            field = request.get("field", "pw")
+            key = ("get", query, tags)
+            matches = self._cache.get(key)
+            if matches is None:
+                matches = self._remember(key, self.vault.find(query, tags))
+            return self.vault.lookup(query, tags, field, matches)
+        if op == "search":
+            from orders import ORDERS
+            from vault import DEFAULT_ORDER, summarize
+
+            order = request.get("order") or DEFAULT_ORDER
+            if order not in ORDERS:
+                raise ValueError(f"未知の並び順です: {order}")
+            args = (str(request.get("keyword", "")), bool(request.get("fuzzy", False)), _tags_of(request), order)
+            key = ("search", *args)
+            records = self._cache.get(key)
+            if records is None:
+                records = self._remember(key, self.vault.query(*args))
+            return [summarize(r) for r in records]
+        if op == "ping":
+            return {"items": len(self.vault.items), "idle_timeout": self.idle_timeout}
+        if op == "stop":
+            self.stop()
+            return None
+        raise ValueError(f"未知の要求です: {op}")
+
+    def _remember(self, key: tuple, records: list) -> list:
+        if len(self._cache) >= AGENT_CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[key] = records
+        return records
+
+
+def _tags_of(request: dict) -> str | None:
+    tags = request.get("tags")
+    return str(tags) if tags else None
+
+
+def _encode(response: dict) -> bytes:
+    return json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+# ---- クライアント ----
+def request(payload: dict, path: Path | None = None, timeout: float = AGENT_CLIENT_TIMEOUT) -> Any:
+    """
+    エージェントに1回問い合わせて result を返す。
+    エージェントがいない・別の保管庫を開いているなら OSError、エラーの応答なら ValueError。
+    相手が本人のプロセスでなければ（なりすましのソケット）何も送らずに OSError にする。
+    """
+    if not available():
+        raise OSError("このOSではエージェントを使えません。")
+    path = path or default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        if peer_uid(sock) != os.getuid():
+            raise OSError(f"ソケットの持ち主が本人ではありません: {path}")
+        sock.sendall(_encode(payload))
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    if not data:
+        raise OSError("エージェントから応答がありません。")
+    response = json.loads(data)
+    if "vault" in response:
+        raise OSError(response.get("error", ""))
+    if not response.get("ok"):
+        raise ValueError(response.get("error", "エージェントでエラーが起きました。"))
+    return response.get("result")
+
+
+def _agent_running(path: Path) -> bool:
+    try:
+        request({"op": "ping"}, path, timeout=1.0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def main(argv: list[str] | None = None) -> int:
+    from vault import IDLE_TIMEOUT_SEC, VAULT_PATH, Vault
+
+    if not available():
+        # 相手のユーザーを確かめられない環境では動かさない（既定のソケットのパスも決められない）
+        print("このOSではエージェントを使えません（Unix ドメインソケットの SO_PEERCRED が必要）。", file=sys.stderr)
+        return 1
+
+    parser = argparse.ArgumentParser(prog="locka-agent", description="Locka エージェント（解錠済みの保管庫で問い合わせに答える）")
+    parser.add_argument("--vault", default=str(VAULT_PATH), help="暗号化データのパス")
+    parser.add_argument("--socket", default=None, help=f"ソケットのパス（既定: {default_socket_path()}）")
+    parser.add_argument("--idle", type=float, default=IDLE_TIMEOUT_SEC, help="この秒数だけ要求がなければロックして終了する")
+    args = parser.parse_args(argv)
+
+    vault = Vault(Path(args.vault))
+    if not vault.exists():
+        print(f"保管庫が見つかりません: {args.vault}", file=sys.stderr)
+        return 1
+    try:
+        vault.unlock(getpass.getpass("マスターパスワード: "))
+    except ValueError:
+        print("パスワードが異なるか、データが壊れています。", file=sys.stderr)
+        return 1
+    vault.warm()  # 最初の検索を待たせないよう、待ち受ける前に索引を作っておく
+
+    socket_path = Path(args.socket) if args.socket else default_socket_path()
+    agent = Agent(vault, socket_path, args.idle)
+    print(f"待ち受けています: {socket_path}（{args.idle:g} 秒操作がなければ終了）", file=sys.stderr)
+    try:
+        asyncio.run(agent.serve())
+    except KeyboardInterrupt:
+        agent.lock()
+    except ValueError as e:
+        agent.lock()
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,40 @@
 import tkinter as tk
 from tkinter import simpledialog, messagebox, ttk
 import json
+import queue
 from pathlib import Path
 from datetime import datetime
-from security import encrypt_items, decrypt_items
+from audit import AUDIT_VIEWS, strength_label
+from breach import BreachIndex
+from listview import VirtualList
+from metrics import METRICS, export_path
+from records import Record
+from search import SearchScheduler
+from storage import SaveWriter
+from vault import IDLE_TIMEOUT_SEC, Vault, format_record, parse_tags
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 class Application(tk.Frame):
     MASK = "********"  # パスワード非表示設定時の表示文字列
-    IDLE_TIMEOUT_SEC = 60  # 自動ロックまでの無操作時間（秒）
+    IDLE_TIMEOUT_SEC = IDLE_TIMEOUT_SEC  # 自動ロックまでの無操作時間（秒。エージェントと共通）
     IDLE_CHECK_MS = 1000  # 無操作チェック間隔（ミリ秒）
+    SAVE_DEBOUNCE_SEC = 0.3  # 連続した変更をまとめて保存するまでの待ち時間（秒）
+    SAVE_POLL_MS = 200  # 保存エラーの確認間隔（ミリ秒）
+    SYNC_POLL_MS = 1000  # ほかのウィンドウ・CLI の保存を確かめる間隔（ミリ秒）
+    STATUS_POLL_MS = 500  # 処理時間のステータス行の更新間隔（ミリ秒）
+    METRICS_EXPORT_MS = 10_000  # 計測結果を書き出す間隔（ミリ秒。LOCKA_METRICS を設定したときだけ）
     
     def __init__(self, root=None, master_password: str = ""):
         super().__init__(root)
         self.root = root
         self.master_password = master_password
+        self.vault: Vault | None = None  # 解錠済みの保管庫（データ・索引・保存先はすべてこちら）
         self.sort_var = tk.StringVar(value="name_asc")  # 初期:名前昇順
         self.sort_label_var = tk.StringVar()  # コンボ表示用（日本語ラベル）
         
         # ウィンドウサイズ設定
-        self.root.geometry("600x300")
+        self.root.geometry("760x300")  # 下の操作列（ボタン・監査・チェック）が1行に収まる幅
         self.root.minsize(600, 300)
 
         self.pack(fill="both", expand=True)
@@ -89,19 +104,50 @@ class Application(tk.Frame):
         # フォント統一
         self.root.option_add("*Font", ("Segoe UI", 10))
 
-        self.items: list[dict[str, str]] = []
+        self.search_jobs = SearchScheduler(self.root)  # 絞り込みは after() で少しずつ進める
+        self.tag_filter: dict[str, str] = {}  # タグ -> "+"（含む）/ "-"（除く）
+        self.tag_mode = tk.StringVar(value="and")  # 「含む」タグの組み合わせ方
         self.search_var = tk.StringVar(value="")
-        self.search_var.trace_add("write", lambda *_: self.refresh_listbox())
+        self.search_var.trace_add("write", lambda *_: self.refresh_listbox(debounce=True))
         self.show_pw = tk.BooleanVar(value=True)  # パスワード表示/非表示の切り替え用
+        self.fuzzy_var = tk.BooleanVar(value=False)  # あいまい検索（点数順に表示）
+        self.show_timing = tk.BooleanVar(value=False)  # 直近の処理時間をステータス行に出す
+        self.audit_var = tk.StringVar(value="")  # 監査の表示（"" ならすべて、"reuse" / "weak"）
+        self.status_var = tk.StringVar(value="")
+        self.metrics_path = export_path()  # 計測結果の書き出し先（未設定なら書き出さない）
+        self.breach: BreachIndex | None = None  # 流出パスワードの一覧（変換していなければ照合しない）
         
         self.locked = False
         self.unlocking = False
         self.last_activity = time.monotonic()
         
         self.create_widgets()
-        self.load_items()
+
+    def start_session(self, vault: Vault, migrated: bool):
+        """解錠済みの保管庫を受け取って表示する（migrated なら補完・移行した内容を保存し直す）。"""
+        self.vault = vault
+        try:
+            self.breach = BreachIndex.open_if_exists()
+        except (OSError, ValueError):
+            self.breach = None  # 一覧が壊れていても、照合しないだけで使える
+        self.show_pw.set(vault.settings["show_pw"])
+        self.show_timing.set(vault.settings["show_timing"])
+        self._apply_status_line()
         self.refresh_listbox()
-        
+
+        # 保存は書き込みスレッドでまとめて行う
+        self.writer = SaveWriter(vault.store.commit, committed=vault.payload(), debounce=self.SAVE_DEBOUNCE_SEC)
+        if migrated:
+            # 過去データを補完・移行した場合は、スナップショットごと保存し直す
+            self.commit_change("データ移行")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._poll_save_errors()
+        self._poll_status()
+        self.root.after(self.SYNC_POLL_MS, self._poll_external_changes)
+        if self.metrics_path is not None:
+            self.root.after(self.METRICS_EXPORT_MS, self._export_metrics_tick)
+
+        self.last_activity = time.monotonic()
         self._setup_activity_hooks()
         self._start_idle_watch()
             
@@ -145,7 +191,6 @@ class Application(tk.Frame):
         def on_sort_change(_=None):
             self.sort_var.set(self._sort_map[self.sort_combo.get()])
             self.refresh_listbox()
-            self.commit_change("ソート変更")
 
         self.sort_combo.bind("<<ComboboxSelected>>", on_sort_change)
         self.sort_combo.grid(row=0, column=1, sticky="w")
@@ -159,6 +204,9 @@ class Application(tk.Frame):
         self.clear_btn = ttk.Button(top_frame, text="×", command=self.clear_search, width=3, style="Clear.TButton")
         self.clear_btn.grid(row=0, column=4, padx=(6, 0))
 
+        self.check_fuzzy = ttk.Checkbutton(top_frame, text="あいまい", variable=self.fuzzy_var, command=self.refresh_listbox)
+        self.check_fuzzy.grid(row=0, column=5, padx=(6, 0))
+
     # 区切り線
         ttk.Separator(self, orient="horizontal").grid(row=1, column=0, sticky="ew")
 
@@ -168,15 +216,30 @@ class Application(tk.Frame):
         list_frame.grid_rowconfigure(0, weight=1)
         list_frame.grid_columnconfigure(0, weight=1)
 
-        scrollbar = ttk.Scrollbar(list_frame)
-        scrollbar.grid(row=0, column=1, sticky="ns")
-
-        self.listbox = tk.Listbox(list_frame, yscrollcommand=scrollbar.set, activestyle="none", height=12,
+        # 見えている行だけを描く仮想リスト（全件を Listbox に入れない）
+        self.listbox = VirtualList(list_frame, activestyle="none", height=12,
                                    background=self.BG, foreground=self.TEXT,
                                    selectbackground=self.ACCENT, selectforeground=self.BG,
                                    borderwidth=1, relief="solid", bd=1)
         self.listbox.grid(row=0, column=0, sticky="nsew")
-        scrollbar.config(command=self.listbox.yview)
+
+        # 右：タグで絞り込み（クリックで 含む → 除く → 解除 と切り替わる）
+        tag_frame = ttk.LabelFrame(list_frame, text="タグ", padding=(6, 4))
+        tag_frame.grid(row=0, column=2, sticky="ns", padx=(10, 0))
+        tag_frame.grid_rowconfigure(1, weight=1)
+
+        self.radio_tag_and = ttk.Radiobutton(tag_frame, text="すべて", value="and", variable=self.tag_mode, command=self.refresh_listbox)
+        self.radio_tag_and.grid(row=0, column=0, sticky="w")
+        self.radio_tag_or = ttk.Radiobutton(tag_frame, text="いずれか", value="or", variable=self.tag_mode, command=self.refresh_listbox)
+        self.radio_tag_or.grid(row=0, column=1, sticky="w")
+
+        self.tag_listbox = tk.Listbox(tag_frame, activestyle="none", width=18, exportselection=False,
+                                      background=self.BG, foreground=self.TEXT,
+                                      selectbackground=self.BG, selectforeground=self.TEXT,
+                                      borderwidth=1, relief="solid", bd=1)
+        self.tag_listbox.grid(row=1, column=0, columnspan=2, sticky="nsew", pady=(4, 0))
+        self.tag_listbox.bind("<ButtonRelease-1>", self.on_click_tag)
+        self._tag_rows: list[str] = []  # タグパネルの行 -> タグ
 
     # ---- 下：操作ボタン群 ----
         btn_frame = ttk.Frame(self, padding=(10, 0, 10, 10))
@@ -196,16 +259,35 @@ class Application(tk.Frame):
         self.btn_edit = ttk.Button(btn_frame, text="編集", command=self.edit_item, width=btn_w)
         self.btn_edit.grid(row=0, column=4, padx=(0, 6))
 
+        # 監査：使い回しのグループ・弱いパスワードだけを表示する（検索・タグの絞り込みと組み合わせられる）
+        audit_values = [("すべて", "")] + [(label, key) for key, label in AUDIT_VIEWS.items()]
+        self._audit_map = {label: key for label, key in audit_values}
+        self.audit_combo = ttk.Combobox(btn_frame, values=[label for label, _ in audit_values], state="readonly", width=14, style="TCombobox")
+        self.audit_combo.set(audit_values[0][0])
+        self.audit_combo.bind("<<ComboboxSelected>>", lambda e: self.on_audit_change())
+        self.audit_combo.grid(row=0, column=5, padx=(0, 6))
+
         self.check_show_pw = ttk.Checkbutton(btn_frame,text="パスワード表示",variable=self.show_pw,command=self.on_toggle_show_pw)
         self.check_show_pw.grid(row=0, column=11, sticky="e")    
+        self.check_show_timing = ttk.Checkbutton(btn_frame, text="処理時間", variable=self.show_timing, command=self.on_toggle_show_timing)
+        self.check_show_timing.grid(row=0, column=12, sticky="e", padx=(6, 0))
+
+    # ---- 最下段：直近の処理時間（設定で表示したときだけ） ----
+        self.status_label = ttk.Label(self, textvariable=self.status_var, padding=(10, 0, 10, 6))
+        self.status_label.grid(row=4, column=0, sticky="ew")
+        self.status_label.grid_remove()
+
+    def selected_item(self) -> Record | None:
+        """選択中の行の item（行 → uid → item とたどる。絞り込み・並び替えの影響を受けない）"""
+        uid = self.listbox.selected_key()
+        return self.vault.get(uid) if uid is not None else None
 
     def delete_item(self):
-        selected=self.listbox.curselection()
-        if not selected:
+        item = self.selected_item()
+        if item is None:
             return
         
-        index=selected[0]
-        del self.items[index]
+        self.vault.delete(item["uid"])
         self.commit_change("削除")
         
 
@@ -233,7 +315,7 @@ class Application(tk.Frame):
             "パスワードを入力してください。",
             parent=self.root,
         )
-        if pw is None:
+        if pw is None or not self.confirm_password(pw):
             return
 
         # tags（カンマ区切り）
@@ -244,151 +326,163 @@ class Application(tk.Frame):
         )
         if tag_text is None:
             return
-        tags = [t.strip() for t in tag_text.split(",") if t.strip()]
-
         # 追加
-        now = time.time()
-        self.items.append({
-            "site": site,
-            "id": user_id,
-            "pw": pw,
-            "tags": tags,
-            "created_at": now,
-            "updated_at": now,
-        })
-
-        self.refresh_listbox()
+        self.vault.add(site, user_id, pw, parse_tags(tag_text))
         self.commit_change("追加")
 
 
+    def confirm_password(self, pw: str) -> bool:
+        """流出パスワードの一覧にあれば、このまま使うか確かめる（一覧がなければ照合しない）"""
+        if self.breach is None or not self.breach.contains(pw):
+            return True
+        return messagebox.askyesno(
+            "流出したパスワード",
+            "このパスワードは流出したパスワードの一覧にあります。\n"
+            "別のパスワードにすることをおすすめします。\n\n"
+            "このまま保存しますか？",
+            parent=self.root,
+        )
+
     def copy_id(self):
-        selected = self.listbox.curselection()
-        if not selected:
+        item = self.selected_item()
+        if item is None:
             return
         
-        index = selected[0]
-        user_id = self.items[index]['id']
+        user_id = item['id']
 
         self.root.clipboard_clear()
         self.root.clipboard_append(user_id)
         self.root.update()
 
     def copy_pw(self):
-        selected = self.listbox.curselection()
-        if not selected:
+        item = self.selected_item()
+        if item is None:
             return
         
-        index = selected[0]
-        pw = self.items[index]['pw']
+        pw = self.vault.reveal(item)
 
         self.root.clipboard_clear()
         self.root.clipboard_append(pw)
         self.root.update()
 
-    def save_items(self):
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        path = data_dir / "locka.enc"
-
-        payload = {"items": self.items,"settings": {"show_pw": self.show_pw.get()},}
-
-        blob = encrypt_items(payload, master_password=self.master_password)
-
-        with path.open("wb") as f:
-            f.write(blob)
-        
-    def load_items(self):
-        path = Path("data") / "locka.enc"
-        if not path.exists():
-            self.items = []
-            self.show_pw.set(True)
-            return
-        blob = path.read_bytes()
-        try:
-            payload = decrypt_items(blob, master_password=self.master_password)
-        except ValueError as e:
-            messagebox.showerror("復号エラー", str(e))
-            self.items = []
-            self.show_pw.set(True)
-            return
-        # payload形式の安全策
-        if isinstance(payload, dict):
-            self.items = payload.get("items", []) or []
-            settings = payload.get("settings", {}) or {}
-            self.show_pw.set(bool(settings.get("show_pw", True)))
-        else:
-            # 旧形式（listだけ保存してた場合）への保険
-            self.items = payload if isinstance(payload, list) else []
-            self.show_pw.set(True)
-        # ---tags補完(過去データ互換) ---
-        for item in self.items:
-            tags = item.get("tags", [])
-            if isinstance(tags, list):
-                item["tags"] = [str(t).strip() for t in tags if str(t).strip()]
-            else:
-                item["tags"] = []
-
-        # 時刻データを持たない過去データがあった場合の対策
-        now = time.time()
-        for item in self.items:
-            if "created_at" not in item:
-                item["created_at"] = now
-            if "updated_at" not in item:
-                item["updated_at"] = now
-            
-    def format_item(self, item: dict) -> str:
-        pw_text = item.get("pw", "") if self.show_pw.get() else self.MASK
-        tags = item.get("tags", [])
-        tag_text = f" [{', '.join(tags)}]" if tags else ""
-        return f"{item.get('site','')} | ID: {item.get('id','')} | PW: {pw_text}{tag_text}"
+    def format_item(self, item: Record) -> str:
+        pw_text = self.vault.reveal(item) if self.show_pw.get() else self.MASK
+        text = format_record(item, pw_text)
+        audit = self.audit_var.get()
+        if audit == "reuse":
+            text += f"  ⚠ 同じパスワード {self.vault.audit_index.reuse_count(item)} 件"
+        elif audit == "weak":
+            bits = self.vault.audit_index.strength(item)
+            text += f"  ⚠ {strength_label(bits)}（約 {bits} ビット）"
+        return text
+
+    def on_audit_change(self):
+        self.audit_var.set(self._audit_map[self.audit_combo.get()])
+        self.refresh_listbox()
 
     
-    def refresh_listbox(self):
+    def refresh_listbox(self, debounce: bool = False):
+        """
+        絞り込み・並び替えをやり直して表示する。計算は SearchScheduler が少しずつ進め、
+        最新の検索の結果だけを反映する（入力中は debounce=True で打ち終わりを待つ）。
+        """
         if getattr(self, "locked", False):
             return
 
-        self.listbox.delete(0, tk.END)
-
         keyword = self.search_var.get().strip().lower()
-        sort_key = self.sort_var.get()
+        audit = self.audit_var.get() or None
+        job = self._filter_job(keyword, self.fuzzy_var.get(), self.current_tag_mask(), self.sort_var.get(), audit)
+        self.search_jobs.submit(job, self._show_rows, debounce=debounce)
 
-        filtered_items = []
-        
-        for item in self.items:
-            site = str(item.get("site", "")).lower()
-            tags = item.get("tags", [])
-            tag_join = " ".join(str(t).lower() for t in tags)
-
-            # 検索対象：site + tags
-            haystack = f"{site} {tag_join}".strip()
-
-            if keyword and keyword not in haystack:
-                continue
-
-            filtered_items.append(item)
-
-        # --- ソート処理 ---
-        if sort_key == "name_asc":
-            filtered_items.sort(key=lambda x: str(x.get("site", "")).lower())
-        elif sort_key == "name_desc":
-            filtered_items.sort(key=lambda x: str(x.get("site", "")).lower(), reverse=True)
-        elif sort_key == "created_asc":
-            filtered_items.sort(key=lambda x: x.get("created_at", 0))
-        elif sort_key == "created_desc":
-            filtered_items.sort(key=lambda x: x.get("created_at", 0), reverse=True)
-        elif sort_key == "updated_asc":
-            filtered_items.sort(key=lambda x: x.get("updated_at", 0))
-        elif sort_key == "updated_desc":
-            filtered_items.sort(key=lambda x: x.get("updated_at", 0), reverse=True)
-
-        # --- 表示 ---
-        for item in filtered_items:
-            self.listbox.insert(tk.END, self.format_item(item))
+    def _filter_job(self, keyword: str, fuzzy: bool, tag_mask: int | None, sort_key: str | None, audit: str | None = None):
+        """絞り込み→並び替えのジョブ（先に1画面分だけ並べて出し、残りは次の区切りで）"""
+        return self.vault.filter_steps(keyword, fuzzy, tag_mask, sort_key, page_size=self.listbox.page_size(), audit=audit)
 
-    def on_toggle_show_pw(self):
+    def _show_rows(self, rows: list[Record], done: bool):
+        if self.locked:
+            return
+        # --- 表示（見えている行だけ整形し、変わった行だけ差し替える） ---
+        # 行 -> uid の配列も渡し、選択は uid で覚えておく（再描画しても同じ item を選んだまま）
+        row_uids = [item["uid"] for item in rows]
+        # 監査の表示では、ほかの record の変更でも件数の注記が変わるので、索引が変わったら描き直す
+        audit = self.audit_var.get()
+        variant = (self.show_pw.get(), audit, self.vault.audit_index.generation if audit else None)
+        self.listbox.set_rows(rows, self.format_item, variant=variant, keys=row_uids)
+        if done:
+            self.refresh_tag_panel()
+
+    def current_tag_mask(self) -> int | None:
+        """タグパネルの指定をビット集合にする（指定がなければ None）"""
+        # 消えたタグの指定は捨てる
+        counts = self.vault.tag_index.counts()
+        self.tag_filter = {t: s for t, s in self.tag_filter.items() if t in counts}
+        if not self.tag_filter:
+            return None
+        include = [t for t, s in self.tag_filter.items() if s == "+"]
+        exclude = [t for t, s in self.tag_filter.items() if s == "-"]
+        return self.vault.tag_index.mask(include, exclude, self.tag_mode.get())
+
+    def refresh_tag_panel(self):
+        """タグ一覧を件数つきで描き直す"""
+        top = self.tag_listbox.yview()[0]
+        self.tag_listbox.delete(0, tk.END)
+        self._tag_rows = []
+        marks = {"+": "＋", "-": "－"}
+        for tag, count in self.vault.tag_index.counts().items():
+            mark = marks.get(self.tag_filter.get(tag), "　")
+            self.tag_listbox.insert(tk.END, f"{mark} {tag} ({count})")
+            self._tag_rows.append(tag)
+        self.tag_listbox.yview_moveto(top)
+
+    def on_click_tag(self, event):
+        if self.locked or not self._tag_rows:
+            return
+        row = self.tag_listbox.nearest(event.y)
+        if not 0 <= row < len(self._tag_rows):
+            return
+        tag = self._tag_rows[row]
+        state = {None: "+", "+": "-"}.get(self.tag_filter.get(tag))
+        if state is None:
+            self.tag_filter.pop(tag, None)
+        else:
+            self.tag_filter[tag] = state
         self.refresh_listbox()
+
+    def on_toggle_show_pw(self):
+        self.vault.set_setting("show_pw", self.show_pw.get())
         self.commit_change("パスワード表示切り替え")
                 
+    def on_toggle_show_timing(self):
+        self.vault.set_setting("show_timing", self.show_timing.get())
+        self._apply_status_line()
+        self.commit_change("処理時間表示切り替え")
+
+    def _apply_status_line(self):
+        if self.show_timing.get():
+            self.status_label.grid()
+            self.status_var.set(METRICS.status_text())
+        else:
+            self.status_label.grid_remove()
+
+    def _poll_status(self):
+        # 保存は書き込みスレッドで終わるので、UIスレッドから定期的に読みに行く
+        if self.show_timing.get():
+            self.status_var.set(METRICS.status_text())
+        self.root.after(self.STATUS_POLL_MS, self._poll_status)
+
+    def _export_metrics_tick(self):
+        self.export_metrics()
+        self.root.after(self.METRICS_EXPORT_MS, self._export_metrics_tick)
+
+    def export_metrics(self):
+        """計測結果（区間名と時間のみ）を LOCKA_METRICS のパスへ書き出す"""
+        if self.metrics_path is None:
+            return
+        try:
+            METRICS.export(self.metrics_path)
+        except OSError:
+            pass  # 書き出せなくても本体の動作には影響させない
+
     def write_unsaved_backup(self, payload: dict) -> Path:
         """保存に失敗した際、現在のメモリ上の状態をバックアップに保存する。"""
         data_dir = Path("data")
@@ -397,56 +491,108 @@ class Application(tk.Frame):
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = data_dir / f"locka_unsaved_{ts}.json"
         
+        # 封印したままだと単体で読めないので、従来どおり平文のpwで書き出す
         with backup_path.open("w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+            json.dump(self.vault.export_plain(payload), f, ensure_ascii=False, indent=2)
             
         return backup_path
     
     def commit_change(self, action_label: str):
         """
-        変更後に保存を試みる。
-        失敗した場合:
+        保管庫に溜まった変更を保存キューに積む（自動保存なのでメッセージは出さない）。
+        変更内容（ジャーナルに追記する操作）は保管庫が覚えている。
+        実際の書き込みは書き込みスレッドが debounce 後にまとめて行う。
+        """
+        self.writer.submit(self.vault.payload(), action_label, self.vault.take_ops())
+        self.refresh_listbox()
+
+    def _poll_save_errors(self):
+        self._report_save_errors()
+        self.root.after(self.SAVE_POLL_MS, self._poll_save_errors)
+
+    def _poll_external_changes(self):
+        """
+        ほかのウィンドウ・CLI が保存した変更を、変わった分だけ取り込んで表示し直す。
+        保存待ちの変更があるあいだは取り込まない（保存するときに record 単位で合わせる）。
+        """
+        if not self.locked and not self.writer.dirty:
+            try:
+                changed = self.vault.refresh()
+            except (OSError, ValueError) as e:
+                messagebox.showerror(
+                    "読み込みエラー",
+                    "ほかのウィンドウ・CLI で保存された変更を読み込めませんでした。開き直してください。\n\n"
+                    f"エラー詳細: {e}",
+                )
+                return  # 毎回同じエラーを出さないよう、以後は確かめない
+            if changed:
+                self.show_pw.set(self.vault.settings["show_pw"])
+                self.show_timing.set(self.vault.settings["show_timing"])
+                self._apply_status_line()
+                self.refresh_listbox()
+        self.root.after(self.SYNC_POLL_MS, self._poll_external_changes)
+
+    def _report_save_errors(self, rollback: bool = True):
+        """
+        書き込みスレッドで保存に失敗していた場合:
             - unsavedバックアップ作成
             - エラー通知
-            - JSONからデータを読み直してロールバック
+            - 最後に保存できたスナップショット（メモリ上）へロールバック（終了時は不要）
         """
-        payload = {
-            "items": self.items,
-            "settings": {"show_pw": self.show_pw.get()}
-        }
-        
+        failed = self._drain_save_errors()
+        if failed is None:
+            return
+
+        action_label, payload, e = failed
+        # 失敗した状態を退避
         try:
-            # 自動保存なのでメッセージは出さない
-            self.save_items()
+            backup_path = self.write_unsaved_backup(payload)
+            backup_msg = f"\nバックアップファイル: {backup_path}"
+        except Exception:
+            backup_msg = "\nバックアップファイルの作成に失敗しました。"
             
-        except Exception as e:
-            # 失敗した状態を退避
-            try:
-                backup_path = self.write_unsaved_backup(payload)
-                backup_msg = f"\nバックアップファイル: {backup_path}"
-            except Exception:
-                backup_msg = "\nバックアップファイルの作成に失敗しました。"
-                
-            messagebox.showerror(
-                "保存エラー",
-                f"{action_label}後の保存に失敗しました。\n"
-                "最後に保存された状態にロールバックします。"
-                f"{backup_msg}\n\n"
-                f"エラー詳細: {e}"
-            )
-            
-            self.load_items()
-
-        finally:
+        messagebox.showerror(
+            "保存エラー",
+            f"{action_label}後の保存に失敗しました。\n"
+            + ("最後に保存された状態にロールバックします。" if rollback else "")
+            + f"{backup_msg}\n\n"
+            f"エラー詳細: {e}"
+        )
+        
+        if rollback:
+            # 書き込み待ちの変更を片付けてから、最後に保存された状態へ戻す
+            # （ファイルの読み直し・KDFは不要）
+            self.writer.flush()
+            self._drain_save_errors()
+            self.vault.restore(self.writer.committed)
+            self.show_pw.set(self.vault.settings["show_pw"])
+            self.show_timing.set(self.vault.settings["show_timing"])
+            self._apply_status_line()
             self.refresh_listbox()
+
+    def _drain_save_errors(self):
+        """溜まっている保存エラーを取り出し、最後の1件を返す"""
+        failed = None
+        while True:
+            try:
+                failed = self.writer.errors.get_nowait()
+            except queue.Empty:
+                return failed
+
+    def on_close(self):
+        """終了時は未保存の変更を必ず書き切ってから閉じる"""
+        self.writer.close()
+        self._report_save_errors(rollback=False)
+        if self.breach is not None:
+            self.breach.close()
+        self.export_metrics()
+        self.root.destroy()
             
     def edit_item(self):
-        selected = self.listbox.curselection()
-        if not selected:
+        current = self.selected_item()
+        if current is None:
             return
 
-        index = selected[0]
-        current = self.items[index]
         # site
         site = simpledialog.askstring(
             "編集",
@@ -470,11 +616,13 @@ class Application(tk.Frame):
         pw = simpledialog.askstring(
             "編集",
             "パスワードを入力してください。",
-            initialvalue=current.get("pw", ""),
+            initialvalue=self.vault.reveal(current),
             parent=self.root,
         )
         if pw is None:
             return
+        if pw != self.vault.reveal(current) and not self.confirm_password(pw):
+            return
 
         # tags（カンマ区切り）
         tags_initial = ", ".join(current.get("tags", []))
@@ -486,12 +634,8 @@ class Application(tk.Frame):
         )
         if tag_text is None:
             return
-        tags = [t.strip() for t in tag_text.split(",") if t.strip()]
-
-        # 上書き
-        now = time.time()
-        self.items[index] = {"site": site, "id": user_id, "pw": pw, "tags": tags, "updated_at": now}
-        self.refresh_listbox()
+        # 上書き（uid と作成日時は引き継ぐ）
+        self.vault.update(current["uid"], site=site, user_id=user_id, pw=pw, tags=parse_tags(tag_text))
         self.commit_change("編集")
     
     def clear_search(self):
@@ -521,10 +665,19 @@ class Application(tk.Frame):
             
     def _lock(self):
         self.locked = True
+        self.search_jobs.cancel()
+        
+        # ロック前に未保存の変更を書き切る
+        self.writer.flush()
+        self._report_save_errors()
+        
+        # 復号済みのパスワードを捨てる
+        self.vault.lock()
         
         # 表示を隠す
-        self.listbox.delete(0, tk.END)
-        self.listbox.insert(tk.END, "🔒 Locked")
+        # 表示の切り替えで、整形済みの行（平文のパスワードを含む）のキャッシュも捨てる
+        self.listbox.set_rows(["🔒 Locked"], str, variant="locked")
+        self.tag_listbox.delete(0, tk.END)
         
         # 操作系ボタン無効化
         for b in (self.btn_add, self.btn_delete, self.btn_copy_id, self.btn_copy_pw, self.btn_edit):
@@ -533,7 +686,13 @@ class Application(tk.Frame):
         # 検索とチェックボックスも無効化
         self.search_entry.state(['disabled'])
         self.clear_btn.state(['disabled'])
+        self.check_fuzzy.state(['disabled'])
+        self.audit_combo.state(['disabled'])
+        self.radio_tag_and.state(['disabled'])
+        self.radio_tag_or.state(['disabled'])
+        self.tag_listbox.config(state="disabled")
         self.check_show_pw.state(['disabled'])
+        self.check_show_timing.state(['disabled'])
             
         self.root.after(100, self._unlock_prompt)
             
@@ -547,7 +706,7 @@ class Application(tk.Frame):
                 parent=self.root,
             )
             if pw is None:
-                self.root.destroy()
+                self.on_close()
                 return
             
             if pw != self.master_password:
@@ -560,6 +719,7 @@ class Application(tk.Frame):
             self.last_activity = time.monotonic()
             
             # UI復帰
+            self.tag_listbox.config(state="normal")
             self.refresh_listbox()
             for b in (self.btn_add, self.btn_delete, self.btn_copy_id, self.btn_copy_pw, self.btn_edit):
                 b.state(['!disabled'])
@@ -567,76 +727,112 @@ class Application(tk.Frame):
             # 検索とチェックボックスも有効化
             self.search_entry.state(['!disabled'])
             self.clear_btn.state(['!disabled'])
+            self.check_fuzzy.state(['!disabled'])
+            self.audit_combo.state(['!disabled'])
+            self.radio_tag_and.state(['!disabled'])
+            self.radio_tag_or.state(['!disabled'])
             self.check_show_pw.state(['!disabled'])
+            self.check_show_timing.state(['!disabled'])
                 
         finally:
             self.unlocking = False
                 
 
-def prompt_master_password(root: tk.Tk) -> str | None:
+def prompt_master_password(root: tk.Tk, exists: bool) -> str | None:
     """
-    既存encがあれば「復号できるパス」を求める。
+    既存encがあれば「マスターパスワード」を1回求める（検証は復号時に行う）。
     なければ「新規パス作成（2回確認）」を行う。
     """
-    enc_path = Path("data") / "locka.enc"
+    if exists:
+        return simpledialog.askstring(
+            "Locka 認証",
+            "マスターパスワードを入力してください。",
+            show="*",
+            parent=root,
+        )
+
+    # 初回 → 新規作成（2回入力）
+    while True:
+        pw1 = simpledialog.askstring(
+            "Locka",
+            "新しいマスターパスワードを設定してください。",
+            show="*",
+            parent=root,
+        )
+        if pw1 is None:
+            return None
+        if pw1.strip() == "":
+            messagebox.showwarning("入力エラー", "空のパスワードは設定できません。")
+            continue
+        pw2 = simpledialog.askstring(
+            "Locka",
+            "確認のためもう一度入力してください。",
+            show="*",
+            parent=root,
+        )
+        if pw2 is None:
+            return None
+        if pw1 != pw2:
+            messagebox.showerror("確認エラー", "パスワードが一致しません。もう一度設定してください。")
+            continue
+        return pw1
+
+
+def unlock_vault(root: tk.Tk) -> tuple[Application, Vault, bool] | None:
+    """
+    起動時のアンロック処理。
+    ファイル読込はパス入力中に、KDF＋復号＋JSON解析はウィジェット構築と並行して行い、
+    解錠済みの保管庫をそのままApplicationへ渡す（復号は1回だけ）。
+    """
     root.withdraw()  # 先にメイン窓を隠す
+    vault = Vault()
 
-    if enc_path.exists():
-        # 既存データ → 正しいパスが入るまでループ（キャンセルで終了）
-        while True:
-            pw = simpledialog.askstring(
-                "Locka 認証",
-                "マスターパスワードを入力してください。",
-                show="*",
-                parent=root,
-            )
-            if pw is None:
-                return None
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        raw_future = pool.submit(vault.read)  # ダイアログ表示中に読み込んでおく
+        exists = vault.exists()
+
+        pw = prompt_master_password(root, exists)
+        if pw is None:
+            return None
+        pending = pool.submit(lambda p=pw: vault.unlock(p, raw_future.result()))
+
+        # 復号を待つ間にスタイル・ウィジェットを組み立てる
+        app = Application(root, master_password=pw)
 
+        while True:
             try:
-                blob = enc_path.read_bytes()
-                decrypt_items(blob, master_password=pw)  # 復号できるかチェック
-                return pw
-            except Exception:
+                migrated = pending.result()
+                return app, vault, migrated
+            except ValueError:
                 messagebox.showerror("認証エラー", "パスワードが異なるか、データが壊れています。")
-    else:
-        # 初回 → 新規作成（2回入力）
-        while True:
-            pw1 = simpledialog.askstring(
-                "Locka",
-                "新しいマスターパスワードを設定してください。",
-                show="*",
-                parent=root,
-            )
-            if pw1 is None:
-                return None
-            if pw1.strip() == "":
-                messagebox.showwarning("入力エラー", "空のパスワードは設定できません。")
-                continue
-            pw2 = simpledialog.askstring(
-                "Locka",
-                "確認のためもう一度入力してください。",
-                show="*",
-                parent=root,
-            )
-            if pw2 is None:
+            except Exception as e:
+                # 読み込めない・容器が壊れているなど（起動を落とさず、入力し直せるようにする）
+                messagebox.showerror("認証エラー", f"保管庫を開けませんでした。\n{e}")
+
+            # 既存データ → 正しいパスが入るまでループ（キャンセルで終了）
+            pw = prompt_master_password(root, exists)
+            if pw is None:
                 return None
-            if pw1 != pw2:
-                messagebox.showerror("確認エラー", "パスワードが一致しません。もう一度設定してください。")
-                continue
-            return pw1
+            app.master_password = pw
+            pending = pool.submit(lambda p=pw: vault.unlock(p, raw_future.result()))
+
+
+def main():
+    root = tk.Tk()
+    root.title("Locka")
+    root.geometry("800x600")
 
+    unlocked = unlock_vault(root)
+    if unlocked is None:
+        root.destroy()
+        return
 
-root = tk.Tk()
-root.title("Locka")
-root.geometry("800x600")
+    app, vault, migrated = unlocked
+    app.start_session(vault, migrated)
 
-master = prompt_master_password(root)
-if master is None:
-    root.destroy()
-    raise SystemExit
+    root.deiconify()   # 認証できたら表示
+    root.mainloop()
 
-app = Application(root, master_password=master)
 
-root.deiconify()   # 認証できたら表示
-root.mainloop()
+if __name__ == "__main__":
+    main()
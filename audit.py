@@ -0,0 +1,177 @@
+"""
+パスワードの使い回し・強さの監査。
+
+    python locka.py audit            # 使い回しのグループと弱いパスワードを一覧する
+
+AuditIndex は検索・タグ・並び順の索引と同じく、Vault の変更（追加・差し替え・削除）で差分だけ更新する。
+    - パスワードの指紋（鍵つきハッシュ。BLAKE2b の鍵つきモード）→ uid の集合。同じ指紋が2件以上なら使い回し（1件ごとに O(1)）
+    - record ごとに強さの見積もり（ビット数）を覚えておく
+指紋と強さは封印済みのパスワード（pw_sealed）と組にして覚え、pw_sealed が変わったときだけ計算し直す
+（サイト名やタグだけの編集・ほかのプロセスからの取り込みでは、復号もハッシュもしない）。
+指紋の鍵は索引ごとに乱数で作り、保存しない（メモリの外に出ないので、平文を推測する手がかりにならない）。
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import string
+from typing import Callable, Iterable
+
+from metrics import METRICS
+
+
+WEAK_BITS = 50  # これ未満の見積もりを「弱い」とする（ビット）
+STRENGTH_LABELS = ((28, "とても弱い"), (WEAK_BITS, "弱い"), (80, "普通"))  # (未満, 表示)。それ以上は「強い」
+AUDIT_VIEWS = {"reuse": "使い回し", "weak": "弱いパスワード"}  # 監査の表示 -> 表示名
+_FINGERPRINT_SIZE = 16  # 指紋の長さ（bytes）
+_LOWER = frozenset(string.ascii_lowercase)
+_UPPER = frozenset(string.ascii_uppercase)
+_DIGITS = frozenset(string.digits)
+_SYMBOLS = frozenset(string.punctuation + " ")
+_COMMON = (
+    "password", "passwd", "qwerty", "asdf", "zxcv", "letmein", "welcome", "admin",
+    "login", "iloveyou", "monkey", "dragon", "master", "abc", "123", "111", "000",
+)  # よくある語・並び（含まれていれば、その分は1文字ぶんとしか数えない）
+
+
+def password_strength(pw: str) -> int:
+    """
+    パスワードの強さのおおよその見積もり（ビット数）。
+    使っている文字種の大きさ ^ 実質の長さ。同じ文字の繰り返し・連番・よくある語は割り引く。
+    """
+    if not pw:
+        return 0
+    # 1件あたり数マイクロ秒に収める（10万件の索引を作るときに効く）
+    chars = set(pw)
+    pool = (
+        (26 if not _LOWER.isdisjoint(chars) else 0)
+        + (26 if not _UPPER.isdisjoint(chars) else 0)
+        + (10 if not _DIGITS.isdisjoint(chars) else 0)
+        + (33 if not _SYMBOLS.isdisjoint(chars) else 0)
+    )
+    if pw.isascii():
+        codes = pw.encode("ascii")
+    else:
+        codes = list(map(ord, pw))
+        pool += 100  # かな・漢字など
+    pool = max(pool, 10)  # 制御文字だけなど
+
+    # 直前と同じ文字・1つ違いの文字（aaaa, abcd, 4321）はほとんど手がかりを増やさない
+    near = len([1 for a, b in zip(codes, codes[1:]) if -2 < a - b < 2])
+    length = len(pw) - 0.75 * near
+    lowered = pw.lower()
+    for word in _COMMON:
+        if word in lowered:
+            length -= len(word) - 1
+    return int(max(length, 1.0) * math.log2(pool))
+
+
+def strength_label(bits: int) -> str:
+    for limit, label in STRENGTH_LABELS:
+        if bits < limit:
+            return label
+    return "強い"
+
+
+class AuditIndex:
+    """
+    使い回し・強さの索引。reveal(record) で平文を取り出せるようにして渡す（LRU に残さないもの）。
+    record ごとに (pw_sealed, 指紋, 強さ) を覚え、追加・差し替え・削除のたびに差分だけ更新する。
+    """
+
+    def __init__(self, items: Iterable[dict] = (), reveal: Callable[[dict], str] = str):
+        self._reveal = reveal
+        self._key = os.urandom(32)  # 指紋の鍵（この索引の中だけで使う）
+        self._items: dict[str, dict] = {}  # uid -> item（追加順）
+        self._entries: dict[str, tuple[str, bytes | None, int]] = {}  # uid -> (pw_sealed, 指紋, 強さ)
+        self._groups: dict[bytes, dict[str, None]] = {}  # 指紋 -> uid（追加順の集合）
+        self._reused: set[bytes] = set()  # 2件以上で共有されている指紋
+        self.generation = 0  # 変わるたびに増える（表示のキャッシュを捨てる目安）
+        self.rebuild(items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def rebuild(self, items: Iterable[dict]):
+        self._items.clear()
+        self._entries.clear()
+        self._groups.clear()
+        self._reused.clear()
+        with METRICS.span("audit_index"):
+            for item in items:
+                self.add(item)
+
+    def _measure(self, item: dict) -> tuple[str, bytes | None, int]:
+        sealed = item.get("pw_sealed", "")
+        pw = self._reveal(item) if sealed else ""
+        if not pw:
+            return sealed, None, 0  # 空のパスワードは使い回しには数えない（弱いほうに出る）
+        digest = hashlib.blake2b(pw.encode("utf-8"), key=self._key, digest_size=_FINGERPRINT_SIZE).digest()
+        return sealed, digest, password_strength(pw)
+
+    def add(self, item: dict, entry: tuple[str, bytes | None, int] | None = None):
+        uid = item["uid"]
+        if entry is None:
+            entry = self._measure(item)
+        self._items[uid] = item
+        self._entries[uid] = entry
+        fingerprint = entry[1]
+        if fingerprint is not None:
+            group = self._groups.setdefault(fingerprint, {})
+            group[uid] = None
+            if len(group) == 2:
+                self._reused.add(fingerprint)
+        self.generation += 1
+
+    def remove(self, item: dict) -> tuple[str, bytes | None, int] | None:
+        uid = item["uid"]
+        if self._items.pop(uid, None) is None:
+            return None
+        entry = self._entries.pop(uid)
+        fingerprint = entry[1]
+        if fingerprint is not None:
+            group = self._groups[fingerprint]
+            del group[uid]
+            if not group:
+                del self._groups[fingerprint]
+            if len(group) < 2:
+                self._reused.discard(fingerprint)
+        self.generation += 1
+        return entry
+
+    def replace(self, old: dict, new: dict):
+        entry = self.remove(old)
+        if entry is not None and entry[0] != new.get("pw_sealed", ""):
+            entry = None  # パスワードが変わったときだけ測り直す
+        self.add(new, entry)
+
+    # ---- 問い合わせ ----
+    def strength(self, item: dict) -> int:
+        return self._entries[item["uid"]][2]
+
+    def reuse_count(self, item: dict) -> int:
+        """同じパスワードを使っている件数（自分を含む。使い回していなければ 1、空なら 0）"""
+        fingerprint = self._entries[item["uid"]][1]
+        return len(self._groups[fingerprint]) if fingerprint is not None else 0
+
+    def reuse_groups(self) -> list[list[dict]]:
+        """使い回しのグループ（件数の多い順。グループの中は追加順）。共有されている指紋だけを見る"""
+        groups = [[self._items[uid] for uid in self._groups[fp]] for fp in self._reused]
+        groups.sort(key=lambda g: (-len(g), str(g[0].get("site", "")).lower()))
+        return groups
+
+    def weak(self, limit: int = WEAK_BITS) -> list[dict]:
+        """強さの見積もりが limit 未満の item（弱い順）"""
+        entries = self._entries
+        found = [uid for uid, entry in entries.items() if entry[2] < limit]
+        found.sort(key=lambda uid: entries[uid][2])
+        return [self._items[uid] for uid in found]
+
+    def summary(self) -> dict[str, int]:
+        """件数のまとめ（使い回しのグループ数・その件数・弱い件数）"""
+        return {
+            "groups": len(self._reused),
+            "reused": sum(len(self._groups[fp]) for fp in self._reused),
+            "weak": sum(1 for entry in self._entries.values() if entry[2] < WEAK_BITS),
+        }
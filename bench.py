@@ -0,0 +1,389 @@
+"""
+Locka のベンチマーク（GUIなし）。
+
+シードつきで合成の保管庫（1k / 10k / 100k / 1M 件）を作り、
+解錠・保存・入力しながらの検索・並び替えの切り替えなどを計測して JSON で出力する。
+
+    python bench.py                          # 1k, 10k, 100k
+    python bench.py --sizes 1k,1m --repeat 1 -o bench.json
+    python bench.py --compare old.json       # 前回の結果より遅くなった項目があれば終了コード 1
+    python bench.py generate 10k /tmp/bench/locka.enc   # 合成データの保管庫を書き出す（GUI/CLIで開ける）
+
+数値の読み方: 各項目は repeat 回計測した min / median / max（ミリ秒）。
+比較には median を使う（min は環境のゆらぎに強いが、GC や I/O の遅さを隠すため）。
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable
+
+from metrics import METRICS
+from orders import ORDERS
+from records import migrate_items
+from security import MIN_PBKDF2_ITERS, ChunkCache, KdfParams, KdfPolicy
+from vault import Vault, format_record
+
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}  # 計測できる件数
+DEFAULT_SIZES = ("1k", "10k", "100k")  # 既定で計測する件数（1m は指定したときだけ）
+DEFAULT_SEED = 20240601  # 合成データのシード（同じシードなら同じデータになる）
+DEFAULT_REPEAT = 5  # 各項目の計測回数
+LARGE_REPEAT = 1  # 100k を超える件数では1回だけ計測する
+PAGE_ROWS = 60  # 1画面分の行数の目安（VirtualList.page_size() 相当）
+REGRESSION_THRESHOLD = 0.2  # 前回の median よりこの比率以上遅ければ退行とみなす
+REGRESSION_FLOOR_MS = 1.0  # これより短い項目はゆらぎが大きいので退行判定しない
+BENCH_PASSWORD = "locka-bench"  # 合成データの保管庫のマスターパスワード
+BENCH_KDF = KdfParams(iters=MIN_PBKDF2_ITERS)  # 計測はKDFを固定する（マシンごとの調整で数字が動かないように）
+
+# よく使われるサイト（全体の約3割。同じサイトに複数アカウントがある状況も作る）
+_POPULAR_SITES = (
+    "GitHub", "Google", "Amazon", "Twitter", "Facebook", "Instagram", "LINE", "Yahoo! JAPAN",
+    "楽天市場", "メルカリ", "Microsoft", "Apple ID", "Slack", "Zoom", "Netflix", "Dropbox",
+    "GitLab", "Notion", "Discord", "PayPay", "ゆうちょダイレクト", "三井住友銀行", "Steam", "YouTube",
+)
+# タグは偏りをつける（k 番目のタグの重みは 1/(k+1)。少数のタグに集中し、残りはまばら）
+_TAGS = (
+    "仕事", "個人", "SNS", "買い物", "銀行", "開発", "メール", "動画", "ゲーム", "クラウド",
+    "旅行", "家族", "学校", "趣味", "ニュース", "音楽", "健康", "保険", "行政", "サブスク",
+) + tuple(f"project-{k}" for k in range(40))
+_TAG_COUNT_WEIGHTS = (25, 40, 25, 10)  # 1件あたりのタグ数 0〜3 の割合（%）
+_SYLLABLES = ("ka", "to", "mi", "ra", "no", "su", "ke", "ha", "yo", "ri", "na", "zu", "te", "ma", "shi", "ro")
+_DOMAINS = ("com", "jp", "co.jp", "net", "io", "org")
+_EPOCH = 1_577_836_800.0  # 2020-01-01（作成日時の起点）
+_SPAN = 5 * 365 * 86_400.0  # 作成日時を散らす幅（5年）
+
+# 入力しながらの検索で打つ語（1文字ずつ打ち足す）。fuzzy は打ち間違いを含む
+_TYPED = ("github", "mail")
+_TYPED_FUZZY = ("gthub", "amzaon")
+_TAG_EXPR = "仕事 AND NOT SNS"
+
+
+# ---- 合成データ ----
+def generate_items(count: int, seed: int = DEFAULT_SEED) -> list[dict]:
+    """
+    合成のエントリを count 件作る（平文の pw を持つ過去形式の dict。migrate_items で封印する）。
+    random.Random(seed) だけを使うので、同じ count と seed なら毎回同じ内容になる（uid も含む）。
+    """
+    rng = random.Random(seed)
+    tag_weights = [1 / (k + 1) for k in range(len(_TAGS))]
+    pw_chars = string.ascii_letters + string.digits + "!#$%&-_"
+    items = []
+    for n in range(count):
+        if rng.random() < 0.3:
+            site = rng.choice(_POPULAR_SITES)
+        else:
+            name = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+            site = f"{name}.{rng.choice(_DOMAINS)}"
+        user = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3)))
+        tag_count = rng.choices(range(len(_TAG_COUNT_WEIGHTS)), weights=_TAG_COUNT_WEIGHTS)[0]
+        tags = sorted(set(rng.choices(_TAGS, weights=tag_weights, k=tag_count)))
+        created = _EPOCH + rng.random() * _SPAN
+        updated = created + rng.random() * (_EPOCH + _SPAN - created)
+        items.append({
+            "uid": f"{rng.getrandbits(128):032x}",
+            "site": site,
+            "id": f"{user}{n}@example.com",
+            "pw": "".join(rng.choice(pw_chars) for _ in range(16)),
+            "tags": tags,
+            "created_at": created,
+            "updated_at": updated,
+        })
+    return items
+
+
+def bench_policy(path: Path) -> KdfPolicy:
+    """KDFを BENCH_KDF に固定したポリシー（計測結果のキャッシュを先に書いておき、計測させない）"""
+    policy = KdfPolicy(kdf=BENCH_KDF.kdf)
+    cache = {"kdf": policy.kdf, "target_ms": policy.target_ms, "params": asdict(BENCH_KDF)}
+    path.with_name("kdf.json").write_text(json.dumps(cache), encoding="utf-8")
+    return policy
+
+
+def create_vault(path: Path, count: int, seed: int = DEFAULT_SEED) -> Vault:
+    """合成データを入れた保管庫を path に作って保存し、解錠済みの Vault を返す"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    vault = Vault(path, policy=bench_policy(path))
+    vault.unlock(BENCH_PASSWORD)
+    vault.load({"items": generate_items(count, seed), "settings": {}})
+    vault.save()
+    return vault
+
+
+# ---- 計測 ----
+def measure(fn: Callable[[], Any], repeat: int, setup: Callable[[], Any] | None = None) -> dict:
+    """fn を repeat 回計測する（setup は毎回の前に呼び、計測には含めない）"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def drain(steps) -> tuple[list, float, float]:
+    """
+    filter_steps を最後まで進める。
+    (最後の rows, 最初の行が出るまでのミリ秒, 1ステップの最長ミリ秒) を返す。
+    """
+    rows: list = []
+    first_ms = None
+    longest = 0.0
+    start = last = time.perf_counter()
+    for step in steps:
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        if step is not None:
+            rows = step[0]
+            if first_ms is None:
+                first_ms = (now - start) * 1000
+        last = time.perf_counter()
+    return rows, first_ms or 0.0, longest * 1000
+
+
+def _typing(vault: Vault, words: tuple[str, ...], fuzzy: bool) -> dict:
+    """1文字ずつ打ち足したときの、1打鍵あたりの最初の1画面までの時間と最長ステップ"""
+    first, longest = [], []
+    for word in words:
+        for end in range(1, len(word) + 1):
+            _, first_ms, step_ms = drain(vault.filter_steps(word[:end], fuzzy, page_size=PAGE_ROWS))
+            first.append(first_ms)
+            longest.append(step_ms)
+    return {
+        "keystrokes": len(first),
+        "first_page_max_ms": round(max(first), 3),
+        "step_max_ms": round(max(longest), 3),
+    }
+
+
+def run_size(label: str, count: int, seed: int, repeat: int, only: str | None, workdir: Path) -> list[dict]:
+    """count 件の合成データで各項目を計測する"""
+    results: list[dict] = []
+
+    def record(name: str, kind: str, stats: dict, **extra):
+        results.append({"name": name, "size": label, "count": count, "kind": kind, **stats, **extra})
+        print(f"  {label:>5} {name:<24} median {stats['median_ms']:>10.2f} ms", file=sys.stderr)
+
+    def wanted(name: str) -> bool:
+        return only is None or only in name
+
+    path = workdir / label / "locka.enc"
+    raw = generate_items(count, seed)
+    vault = create_vault(path, 0, seed)
+
+    # 読み込み時の補完・移行（pw の封印・Record 化）
+    if wanted("migrate"):
+        record("migrate", "micro", measure(lambda raw=raw: migrate_items(raw, vault.secrets.seal), repeat))
+    vault.load({"items": raw, "settings": {}})
+    del raw
+
+    # 保存：チャンクを全部暗号化し直す全体保存と、1件の変更をジャーナルに足す保存
+    # どれも実際の保存と同じく commit を通す（compact を直接呼ぶと、ファイルの印の更新などを飛ばしてしまう）
+    def save_full():
+        vault.store.commit(vault.payload(), None)
+    if wanted("save_full"):
+        def cold():
+            vault.store.chunks = ChunkCache()
+        record("save_full", "macro", measure(save_full, repeat, setup=cold))
+    vault.save()
+    snapshot_bytes = path.stat().st_size
+    if wanted("save_full_warm"):
+        # 1件だけ変わった状態での全体保存（変わっていないチャンクは暗号文を使い回す）
+        def touch():
+            vault.update(vault.items[len(vault.items) // 2]["uid"], pw="changed")
+            vault.take_ops()
+        record("save_full_warm", "macro", measure(save_full, repeat, setup=touch))
+    if wanted("save_journal"):
+        def edit():
+            vault.update(vault.items[0]["uid"], pw="changed")
+        record("save_journal", "macro", measure(vault.save, repeat, setup=edit))
+    save_full()
+
+    # 解錠（ファイルの読み込み・KDF・復号・Record 化）
+    if wanted("unlock"):
+        policy = bench_policy(path)
+        record(
+            "unlock", "macro",
+            measure(lambda: Vault(path, policy=policy).unlock(BENCH_PASSWORD), repeat),
+            snapshot_bytes=snapshot_bytes, kdf=asdict(BENCH_KDF),
+        )
+
+    # 秘密フィールドの封印・開封（1000件。LRUに載らない件数）
+    sample = vault.items[:1000]
+    if wanted("seal"):
+        record("seal_1000", "micro", measure(lambda: [vault.secrets.seal("p@ssw0rd", "bench") for _ in range(1000)], repeat))
+    if wanted("reveal"):
+        record("reveal_1000", "micro", measure(lambda: [vault.reveal(x) for x in sample], repeat, setup=vault.secrets.clear))
+
+    # 1画面分の行の整形（パスワードを表示する場合・隠す場合）
+    page = vault.items[:PAGE_ROWS]
+    if wanted("format"):
+        record("format_page_shown", "micro",
+               measure(lambda: [format_record(x, vault.reveal(x)) for x in page], repeat, setup=vault.secrets.clear))
+        record("format_page_masked", "micro", measure(lambda: [format_record(x, "********") for x in page], repeat))
+
+    # 索引を作る時間（最初の検索・タグ絞り込み・並び替えで払うもの）
+    def reset_indexes():
+        vault._index = vault._tag_index = vault._sort_index = vault._audit_index = None
+    if wanted("index"):
+        record("index_search", "micro",
+               measure(lambda: drain(vault.filter_steps("zz", order=None)), repeat, setup=reset_indexes))
+        record("index_tags", "micro", measure(lambda: vault.tag_index, repeat, setup=reset_indexes))
+        record("index_sort", "micro",
+               measure(lambda: vault.sort_index.ordered("name_asc", limit=PAGE_ROWS), repeat, setup=reset_indexes))
+        record("index_audit", "micro", measure(lambda: vault.audit_index, repeat, setup=reset_indexes))
+
+    # 入力しながらの検索（索引は作成済み。1打鍵ごとに最後まで進める）
+    if wanted("typing"):
+        drain(vault.filter_steps("zz", order=None))  # 索引を作り終えておく
+        stats = {}
+        record("typing", "macro",
+               measure(lambda: stats.update(_typing(vault, _TYPED, False)), repeat), **stats)
+        record("typing_fuzzy", "macro",
+               measure(lambda: stats.update(_typing(vault, _TYPED_FUZZY, True)), repeat), **stats)
+
+    # タグ式での絞り込み
+    if wanted("tag_filter"):
+        mask = vault.tag_index.query(_TAG_EXPR)
+        record("tag_filter", "macro", measure(lambda: drain(vault.filter_steps(tag_mask=mask)), repeat))
+
+    # 監査の表示（索引は作成済み。使い回しのグループ・弱い順を出すだけ。パスワードの編集1件ぶんの更新を含む）
+    if wanted("audit"):
+        vault.audit_index  # 索引を作り終えておく
+        target = vault.items[0]
+        def audit_after_edit():
+            vault.update(target["uid"], pw="p@ssw0rd")
+            drain(vault.filter_steps(audit="reuse"))
+            drain(vault.filter_steps(audit="weak"))
+        record("audit_view", "macro", measure(audit_after_edit, repeat))
+
+    # 並び替えの切り替え（全順序を一巡。最初の1画面まで / 最後まで）
+    if wanted("sort_switch"):
+        def first_pages():
+            for order in ORDERS:
+                next(step for step in vault.filter_steps(order=order, page_size=PAGE_ROWS) if step is not None)
+        def full_orders():
+            for order in ORDERS:
+                drain(vault.filter_steps(order=order))
+        record("sort_switch_first_page", "macro", measure(first_pages, repeat, setup=reset_indexes))
+        record("sort_switch_full", "macro", measure(full_orders, repeat))
+
+    return results
+
+
+# ---- 結果の比較 ----
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """baseline より median が threshold 以上遅くなった項目を返す"""
+    before = {(r["name"], r["size"]): r["median_ms"] for r in baseline.get("results", [])}
+    slower = []
+    for r in current["results"]:
+        old = before.get((r["name"], r["size"]))
+        if old is None or max(old, r["median_ms"]) < REGRESSION_FLOOR_MS:
+            continue
+        if r["median_ms"] > old * (1 + threshold):
+            slower.append(f"{r['size']} {r['name']}: {old:.2f} ms -> {r['median_ms']:.2f} ms")
+    return slower
+
+
+def _parse_sizes(text: str) -> list[str]:
+    labels = [s.strip().lower() for s in text.split(",") if s.strip()]
+    unknown = [s for s in labels if s not in SIZES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知の件数です: {', '.join(unknown)}（{', '.join(SIZES)} から選ぶ）")
+    return labels
+
+
+def cmd_run(args) -> int:
+    meta = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "page_rows": PAGE_ROWS,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    results: list[dict] = []
+    spans: dict[str, dict] = {}  # 件数 -> 区間ごとの内訳（kdf / encrypt / json_decode など）
+    workdir = Path(tempfile.mkdtemp(prefix="locka-bench-"))
+    try:
+        for label in args.sizes:
+            count = SIZES[label]
+            repeat = args.repeat if count <= SIZES["100k"] else min(args.repeat, LARGE_REPEAT)
+            METRICS.reset()
+            results += run_size(label, count, args.seed, repeat, args.only, workdir)
+            spans[label] = METRICS.snapshot()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"meta": meta, "results": results, "spans": spans}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        slower = compare(report, baseline, args.threshold)
+        for line in slower:
+            print(f"遅くなった: {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+def cmd_generate(args) -> int:
+    path = Path(args.vault)
+    if path.exists():
+        raise SystemExit(f"すでにあります: {path}")
+    create_vault(path, SIZES[args.size], args.seed)
+    print(f"{args.size} 件の保管庫を書き出しました: {path}（マスターパスワード: {BENCH_PASSWORD}）", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="bench", description="Locka のベンチマーク")
+    parser.add_argument("--sizes", type=_parse_sizes, default=list(DEFAULT_SIZES), help="例: 1k,10k,100k,1m")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", help="名前にこの文字列を含む項目だけ計測する（例: typing）")
+    parser.add_argument("-o", "--output", help="結果の JSON の書き出し先（省略時は標準出力）")
+    parser.add_argument("--compare", help="前回の結果の JSON。遅くなった項目があれば終了コード 1")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.set_defaults(func=cmd_run)
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("generate", help="合成データの保管庫を書き出す")
+    p.add_argument("size", choices=tuple(SIZES))
+    p.add_argument("vault", help="書き出し先（例: /tmp/bench/locka.enc）")
+    p.set_defaults(func=cmd_generate)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+流出パスワードの照合（オフライン）。
+
+    python locka.py breach-import pwned-passwords-sha1-ordered-by-hash.txt   # 最初に1回だけ変換する
+    python locka.py breach-check                                             # 全エントリを照合する
+
+一覧（Pwned Passwords の SHA-1 版など、数十GB）は、そのままでは引けないので一度だけ変換する:
+    - SHA-1 の先頭 PREFIX_BYTES バイトだけを整列して、固定長で並べる（重複は1つにまとめる）
+    - 先頭2バイトごとの件数の累計（ファンアウト表）を前に置き、どこから探せばよいかをすぐに引けるようにする
+照合はファイルを mmap して探すだけなので、一覧がいくら大きくてもメモリは増えない。
+ハッシュは一様に散らばっているので、ファンアウトの区間の中で位置を見積もってから、その周りだけを二分探索する
+（1件の照合で触るページは数枚）。
+
+ファイルの形式（整数はリトルエンディアン）:
+    MAGIC(4) | 版(1) | PREFIX_BYTES(1) | 予約(2) | 件数(8) | ファンアウト 65536 x 8 | 先頭バイト列 x 件数
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from metrics import METRICS
+
+
+BREACH_PATH = Path("data") / "breach.idx"  # 変換済みの一覧の置き場所
+PREFIX_BYTES = 8  # SHA-1 のうち残すバイト数（10億件でも取り違えの確率は 1e-10 程度）
+RUN_ENTRIES = 2_000_000  # 取り込み時に一度に整列する件数（1件あたり約 50 バイトのメモリ）
+MAGIC = b"LCKB"
+VERSION = 1
+FANOUT = 1 << 16  # 先頭2バイトで区切る
+_HEADER = struct.Struct("<4sBBHQ")
+_FANOUT = struct.Struct(f"<{FANOUT}Q")
+_GALLOP = 32  # 見積もった位置から広げていく最初の幅（件数）
+_READ_BLOCK = 1 << 16  # 一時ファイルを読むときにまとめて読む件数
+
+
+def password_digest(pw: str) -> bytes:
+    """一覧と同じ形のハッシュ（UTF-8 の SHA-1）"""
+    return hashlib.sha1(pw.encode("utf-8")).digest()
+
+
+# ---- 取り込み ----
+def _parse_lines(lines: Iterable[bytes], plain: bool, width: int) -> Iterator[bytes]:
+    """一覧の行をハッシュの先頭バイト列にする（読めない行は飛ばす）"""
+    for line in lines:
+        if plain:
+            pw = line.rstrip(b"\r\n")
+            if pw:
+                yield hashlib.sha1(pw).digest()[:width]
+            continue
+        text = line.split(b":", 1)[0].strip()
+        if len(text) != 40:
+            continue  # 空行・見出しなど
+        try:
+            yield bytes.fromhex(text.decode("ascii"))[:width]
+        except ValueError:
+            continue
+
+
+def _write_run(directory: Path, keys: list[bytes]) -> Path:
+    keys.sort()
+    fd, name = tempfile.mkstemp(prefix="run.", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"".join(keys))
+    return Path(name)
+
+
+def _read_run(path: Path, width: int) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            block = f.read(width * _READ_BLOCK)
+            if not block:
+                return
+            for i in range(0, len(block), width):
+                yield block[i:i + width]
+
+
+def import_corpus(
+    source: Path,
+    dest: Path = BREACH_PATH,
+    plain: bool = False,
+    width: int = PREFIX_BYTES,
+    run_entries: int = RUN_ENTRIES,
+) -> int:
+    """
+    流出パスワードの一覧を照合用のファイルに変換し、書き出したハッシュの数を返す。
+    source は "SHA1の16進:件数" の行（Pwned Passwords）。plain なら1行1パスワードの平文の一覧。
+    行の順序は問わない（run_entries 件ずつ整列して一時ファイルに書き、最後に併合する）。
+    書き終えるまで dest は置き換えない。
+    """
+    if not 2 < width <= 20:
+        raise ValueError(f"PREFIX_BYTES は 3〜20 にしてください: {width}")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with METRICS.span("breach_import"), tempfile.TemporaryDirectory(prefix=".breach.", dir=dest.parent) as tmp:
+        runs: list[Path] = []
+        keys: list[bytes] = []
+        with source.open("rb") as f:
+            for key in _parse_lines(f, plain, width):
+                keys.append(key)
+                if len(keys) >= run_entries:
+                    runs.append(_write_run(Path(tmp), keys))
+                    keys = []
+        if keys or not runs:
+            runs.append(_write_run(Path(tmp), keys))
+
+        fanout = [0] * FANOUT
+        count = 0
+        out = Path(tmp) / "breach.idx"
+        with out.open("wb") as f:
+            f.write(b"\0" * (_HEADER.size + _FANOUT.size))  # 件数・ファンアウトは書き終えてから埋める
+            previous = None
+            buffer = []
+            for key in heapq.merge(*(_read_run(run, width) for run in runs)):
+                if key == previous:
+                    continue
+                previous = key
+                buffer.append(key)
+                fanout[int.from_bytes(key[:2], "big")] += 1
+                count += 1
+                if len(buffer) >= _READ_BLOCK:
+                    f.write(b"".join(buffer))
+                    buffer = []
+            f.write(b"".join(buffer))
+
+            total = 0
+            for i, n in enumerate(fanout):
+                total += n
+                fanout[i] = total
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, width, 0, count))
+            f.write(_FANOUT.pack(*fanout))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(out, dest)
+    return count
+
+
+# ---- 照合 ----
+class _Keys:
+    """mmap 上の固定長の先頭バイト列を list のように読む（bisect 用）"""
+    __slots__ = ("_mm", "_offset", "_width", "_count")
+
+    def __init__(self, mm: mmap.mmap, offset: int, width: int, count: int):
+        self._mm = mm
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self._offset + i * self._width
+        return self._mm[start:start + self._width]
+
+
+class BreachIndex:
+    """
+    変換済みの一覧を mmap して照合する（ファイルは読み込まない。触ったページだけを OS が読む）。
+    close() するか with で使う。
+    """
+
+    def __init__(self, path: Path = BREACH_PATH):
+        self.path = path
+        with path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data_offset = _HEADER.size + _FANOUT.size
+        try:
+            if len(self._mm) < data_offset:
+                raise ValueError(f"流出パスワードの一覧が壊れています（途中で切れています）: {path}")
+            magic, version, self.width, _, self.count = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"流出パスワードの一覧の形式が異なります: {path}")
+            if len(self._mm) != data_offset + self.count * self.width:
+                raise ValueError(f"流出パスワードの一覧が壊れています（途中で切れています）: {path}")
+        except ValueError:
+            self._mm.close()
+            raise
+        self._keys = _Keys(self._mm, data_offset, self.width, self.count)
+        self._bucket_span = 1 << (8 * (self.width - 2))  # 1つの区間に入りうる値の幅
+
+    @classmethod
+    def open_if_exists(cls, path: Path = BREACH_PATH) -> BreachIndex | None:
+        """一覧を変換していなければ None（照合しない）"""
+        return cls(path) if path.exists() else None
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self) -> BreachIndex:
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _bucket(self, bucket: int) -> tuple[int, int]:
+        """先頭2バイトが bucket の区間 [lo, hi)"""
+        (hi,) = struct.unpack_from("<Q", self._mm, _HEADER.size + 8 * bucket)
+        if bucket == 0:
+            return 0, hi
+        (lo,) = struct.unpack_from("<Q", self._mm, _HEADER.size + 8 * (bucket - 1))
+        return lo, hi
+
+    def contains_digest(self, digest: bytes) -> bool:
+        key = digest[:self.width]
+        lo, hi = self._bucket(int.from_bytes(key[:2], "big"))
+        if lo >= hi:
+            return False
+        # 区間の中では一様に散らばっているので、位置を見積もってから前後に広げ、その範囲だけを二分探索する
+        guess = lo + int.from_bytes(key[2:], "big") * (hi - lo) // self._bucket_span
+        a, b = self._bracket(key, min(guess, hi - 1), lo, hi)
+        i = bisect_left(self._keys, key, a, b)
+        return i < hi and self._keys[i] == key
+
+    def _bracket(self, key: bytes, guess: int, lo: int, hi: int) -> tuple[int, int]:
+        """key が入るべき位置を含む狭い範囲 [a, b]（幅を倍々に広げて探す）"""
+        keys, step = self._keys, _GALLOP
+        if keys[guess] < key:
+            a = guess
+            while True:
+                b = a + step
+                if b >= hi:
+                    return a, hi
+                if keys[b] >= key:
+                    return a, b
+                a, step = b, step * 2
+        b = guess
+        while True:
+            a = b - step
+            if a <= lo:
+                return lo, b
+            if keys[a] < key:
+                return a, b
+            b, step = a, step * 2
+
+    def contains(self, pw: str) -> bool:
+        return self.contains_digest(password_digest(pw))
+
+    def check_many(self, digests: list[bytes]) -> list[bool]:
+        """まとめて照合する（ハッシュ順に引くので、ファイルを前から順に読むことになる）"""
+        found = [False] * len(digests)
+        for i in sorted(range(len(digests)), key=digests.__getitem__):
+            found[i] = self.contains_digest(digests[i])
+        return found
+
+
+def audit(vault, index: BreachIndex) -> list:
+    """保管庫の全エントリのパスワードを照合し、一覧にあった record を保存順に返す"""
+    with METRICS.span("breach_audit"):
+        records = list(vault.items)
+        digests = [password_digest(vault.reveal(r, remember=False)) for r in records]
+        return [r for r, hit in zip(records, index.check_many(digests)) if hit]
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from typing import Callable, Iterable, Iterator
+
+
+_AND, _OR, _NOT = "and", "or", "not"  # タグ式の演算子（大文字・小文字は問わない）
+
+
+def members(mask: int) -> Iterator[int]:
+    """ビット集合 mask に立っている doc番号を小さい順に返す"""
+    bits = bin(mask)[:1:-1]  # 下位ビットが先頭になるように反転
+    pos = bits.find("1")
+    while pos >= 0:
+        yield pos
+        pos = bits.find("1", pos + 1)
+
+
+def _mask_of(docs: Iterable[int]) -> int:
+    """doc番号の集まりからビット集合を一度に作る（1ビットずつ OR すると O(n^2) になる）"""
+    docs = list(docs)
+    if not docs:
+        return 0
+    buf = bytearray(max(docs) // 8 + 1)
+    for doc in docs:
+        buf[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(buf, "little")
+
+
+class TagIndex:
+    """
+    タグ → item集合 の索引（ファセット）。
+    item集合は doc番号をビット位置にした int で持ち、AND/OR/NOT は整数のビット演算で済ませる。
+    itemの追加・差し替え・削除のたびに差分だけ更新する。
+    """
+
+    def __init__(self, items: Iterable[dict] = ()):
+        self._docs: dict[int, dict] = {}  # doc番号 -> item
+        self._doc_of: dict[str, int] = {}  # uid -> doc番号
+        self._bits: dict[str, int] = {}  # タグ -> ビット集合
+        self._live = 0  # 現存する item のビット集合
+        self._next_doc = 0
+        self.rebuild(items)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def rebuild(self, items: Iterable[dict]):
+        self._docs.clear()
+        self._doc_of.clear()
+        self._bits.clear()
+        self._next_doc = 0
+
+        by_tag: dict[str, list[int]] = {}
+        for item in items:
+            doc = self._next_doc
+            self._next_doc += 1
+            self._docs[doc] = item
+            self._doc_of[item["uid"]] = doc
+            for tag in set(item.get("tags", [])):
+                by_tag.setdefault(tag, []).append(doc)
+        self._bits = {tag: _mask_of(docs) for tag, docs in by_tag.items()}
+        self._live = (1 << self._next_doc) - 1
+
+    def add(self, item: dict):
+        doc = self._next_doc
+        self._next_doc += 1
+        self._docs[doc] = item
+        self._doc_of[item["uid"]] = doc
+        bit = 1 << doc
+        for tag in set(item.get("tags", [])):
+            self._bits[tag] = self._bits.get(tag, 0) | bit
+        self._live |= bit
+
+    def remove(self, item: dict):
+        doc = self._doc_of.pop(item["uid"], None)
+        if doc is None:
+            return
+        del self._docs[doc]
+        bit = 1 << doc
+        for tag in set(item.get("tags", [])):
+            rest = self._bits.get(tag, 0) & ~bit
+            if rest:
+                self._bits[tag] = rest
+            else:
+                self._bits.pop(tag, None)
+        self._live &= ~bit
+
+    def replace(self, old: dict, new: dict):
+        self.remove(old)
+        self.add(new)
+
+    def tags(self) -> list[str]:
+        return sorted(self._bits)
+
+    def counts(self) -> dict[str, int]:
+        """タグごとの件数（タグ名順）"""
+        return {tag: self._bits[tag].bit_count() for tag in sorted(self._bits)}
+
+    def mask(self, include: Iterable[str] = (), exclude: Iterable[str] = (), mode: str = _AND) -> int:
+        """
+        include のタグを mode（"and": すべて持つ / "or": どれかを持つ）で合わせ、
+        exclude のタグを持つものを除いたビット集合を返す。include が空なら全件から除く。
+        """
+        include = list(include)
+        if not include:
+            result = self._live
+        elif mode == _OR:
+            result = 0
+            for tag in include:
+                result |= self._bits.get(tag, 0)
+        else:
+            result = self._live
+            for tag in include:
+                result &= self._bits.get(tag, 0)
+        for tag in exclude:
+            result &= ~self._bits.get(tag, 0)
+        return result
+
+    def query(self, expr: str) -> int:
+        """
+        「仕事 AND NOT SNS」「仕事 OR 個人」のようなタグ式をビット集合にする。
+        優先順位は NOT > AND > OR で、語を並べただけの場合は AND とみなす。
+        """
+        tokens = expr.split()
+        if not tokens:
+            return self._live
+        result = 0
+        term = self._live
+        negate = False
+        expect_tag = True
+        for token in tokens:
+            op = token.casefold()
+            if op == _OR:
+                if expect_tag:
+                    raise ValueError(f"タグ式が不正です: {expr}")
+                result |= term
+                term = self._live
+                expect_tag = True
+            elif op == _AND:
+                if expect_tag:
+                    raise ValueError(f"タグ式が不正です: {expr}")
+                expect_tag = True
+            elif op == _NOT:
+                negate = not negate
+                expect_tag = True
+            else:
+                bits = self._bits.get(token, 0)
+                term &= (~bits if negate else bits)
+                negate = False
+                expect_tag = False
+        if expect_tag:
+            raise ValueError(f"タグ式が不正です: {expr}")
+        return (result | term) & self._live
+
+    def matcher(self, mask: int) -> Callable[[dict], bool]:
+        """
+        item が mask に含まれるかを返す関数（検索結果との突き合わせ用。並びは呼び出し側のまま）。
+        mask をバイト列にするだけで、含まれる item の集合は作らない（1件ごとに O(1)）。
+        """
+        bits = mask.to_bytes(mask.bit_length() // 8 + 1, "little")
+        size = len(bits)
+        doc_of = self._doc_of.get
+
+        def contains(item: dict) -> bool:
+            doc = doc_of(item["uid"])
+            return doc is not None and doc >> 3 < size and bool(bits[doc >> 3] >> (doc & 7) & 1)
+        return contains
+
+    def items(self, mask: int) -> list[dict]:
+        """mask に含まれる item を追加順に返す"""
+        return [self._docs[doc] for doc in members(mask)]
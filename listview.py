@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Hashable, Sequence
+
+from metrics import METRICS
+
+
+OVERSCAN_ROWS = 20  # 見えている行の上下に余分に描いておく行数
+ROW_CACHE_LIMIT = 4096  # 整形済みの行を覚えておく上限（超えたら捨てて作り直す）
+
+
+class VirtualList(ttk.Frame):
+    """
+    仮想化したリスト表示。論理的な行（rows）は全件持つが、Listbox に入れるのは
+    見えている行と上下の OVERSCAN_ROWS 行だけ。スクロールバーは論理的な行数に対応させる。
+    行の文字列は行オブジェクトごとに覚えておき（itemは差し替え運用なので、同じオブジェクトなら内容も同じ）、
+    変わった行だけを Listbox に差し替える。
+    Listbox と同じ感覚で使えるよう curselection() は論理的な行番号を返す。
+    行ごとのキー（row → id の配列）を渡しておけば、選択は行番号ではなくキーで覚え、
+    並び替えや絞り込みで行が動いても同じ行を選んだままにする。
+    """
+
+    def __init__(self, master, **listbox_options):
+        super().__init__(master)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.scrollbar = ttk.Scrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.listbox = tk.Listbox(self, exportselection=False, **listbox_options)
+        self.listbox.grid(row=0, column=0, sticky="nsew")
+
+        self._rows: Sequence[Any] = []
+        self._format: Callable[[Any], str] = str
+        self._variant: Hashable = None
+        self._cache: dict[int, tuple[Any, str]] = {}  # id(行) -> (行, 文字列)
+        self._row_height = 0  # 1行の高さ（px、最初に描いたときに測る）
+        self._top = 0  # 画面のいちばん上に見えている論理行
+        self._first = 0  # Listbox の0行目に当たる論理行
+        self._lines: list[str] = []  # いま Listbox に入っている文字列
+        self._selected: int | None = None  # 選択中の論理行
+        self._keys: Sequence[Hashable] | None = None  # 論理行 -> キー
+        self._selected_key: Hashable = None  # 選択中の行のキー
+
+        self.listbox.bind("<Configure>", lambda e: self._render())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", self._on_wheel)
+        self.listbox.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.listbox.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.listbox.bind("<Up>", lambda e: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self._move_selection(1))
+        self.listbox.bind("<Prior>", lambda e: self._move_selection(-self._visible_rows()))
+        self.listbox.bind("<Next>", lambda e: self._move_selection(self._visible_rows()))
+
+    # ---- 公開API ----
+    def set_rows(self, rows: Sequence[Any], format_row: Callable[[Any], str], variant: Hashable = None,
+                 keys: Sequence[Hashable] | None = None):
+        """
+        表示する行を差し替える。format_row は見える行にだけ呼ばれる。
+        variant（パスワード表示の有無など）が変わったら、覚えていた文字列は使わない。
+        keys を渡すと、選択中のキーが新しい rows にもあればその行を選び直す。
+        """
+        if variant != self._variant:
+            self._cache.clear()
+        self._rows = rows
+        self._format = format_row
+        self._variant = variant
+        self._keys = keys
+        self._selected = None
+        if keys is not None and self._selected_key is not None:
+            try:
+                self._selected = keys.index(self._selected_key)
+            except ValueError:
+                pass
+        if self._selected is None:
+            self._selected_key = None
+        self._top = max(0, min(self._top, len(rows) - self._visible_rows()))
+        self._render()
+
+    def curselection(self) -> tuple[int, ...]:
+        return () if self._selected is None else (self._selected,)
+
+    def selected_key(self) -> Hashable:
+        """選択中の行のキー（選択なし・キー未指定なら None）"""
+        return self._selected_key
+
+    def selection_set(self, row: int | None):
+        self._select(row if row is not None and 0 <= row < len(self._rows) else None)
+        self._render()
+
+    def _select(self, row: int | None):
+        self._selected = row
+        self._selected_key = None if row is None or self._keys is None else self._keys[row]
+
+    def see(self, row: int):
+        visible = self._visible_rows()
+        if row < self._top:
+            self._top = row
+        elif row >= self._top + visible:
+            self._top = row - visible + 1
+        self._render()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def page_size(self) -> int:
+        """1回の描画で Listbox に入る行数（見えている行＋上下の余白）"""
+        return self._visible_rows() + 2 * OVERSCAN_ROWS
+
+    # ---- 描画 ----
+    def _visible_rows(self) -> int:
+        if not self._row_height and self._lines:
+            bbox = self.listbox.bbox(self.listbox.nearest(0))
+            if bbox:
+                self._row_height = bbox[3] + 1
+        line = self._row_height or 18  # まだ描いていなければ目安
+        return max(1, self.listbox.winfo_height() // line)
+
+    def _text(self, row: Any) -> str:
+        cached = self._cache.get(id(row))
+        if cached is not None and cached[0] is row:
+            return cached[1]
+        if len(self._cache) >= ROW_CACHE_LIMIT:
+            self._cache.clear()
+        text = self._format(row)
+        self._cache[id(row)] = (row, text)
+        return text
+
+    def _render(self):
+        with METRICS.span("render"):
+            self._render_window()
+
+    def _render_window(self):
+        total = len(self._rows)
+        visible = self._visible_rows()
+        self._top = max(0, min(self._top, total - visible))
+        first = max(0, self._top - OVERSCAN_ROWS)
+        stop = min(total, self._top + visible + OVERSCAN_ROWS)
+        lines = [self._text(self._rows[i]) for i in range(first, stop)]
+        self._patch(first, lines)
+
+        self.listbox.yview(self._top - first)
+        self.listbox.selection_clear(0, tk.END)
+        if self._selected is not None and first <= self._selected < stop:
+            self.listbox.selection_set(self._selected - first)
+        if total:
+            self.scrollbar.set(self._top / total, min(1.0, (self._top + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _patch(self, first: int, lines: list[str]):
+        """Listbox の中身を lines にする。重なっている範囲は変わった行だけ差し替える"""
+        old_first, old = self._first, self._lines
+        old_stop, stop = old_first + len(old), first + len(lines)
+        lb = self.listbox
+        if not old or stop <= old_first or old_stop <= first:
+            lb.delete(0, tk.END)
+            if lines:
+                lb.insert(tk.END, *lines)
+        else:
+            # 窓からはみ出した行を落とし、足りない行を前後に足す
+            if old_stop > stop:
+                lb.delete(stop - old_first, tk.END)
+            if first > old_first:
+                lb.delete(0, first - old_first - 1)
+            if first < old_first:
+                lb.insert(0, *lines[:old_first - first])
+            if stop > old_stop:
+                lb.insert(tk.END, *lines[old_stop - first:])
+            # 重なっている範囲は、文字列が変わった行だけ差し替える
+            lo, hi = max(first, old_first), min(stop, old_stop)
+            for pos in range(lo, hi):
+                text = lines[pos - first]
+                if old[pos - old_first] != text:
+                    lb.delete(pos - first)
+                    lb.insert(pos - first, text)
+        self._first, self._lines = first, lines
+
+    # ---- 操作 ----
+    def _scroll_by(self, rows: int):
+        self._top += rows
+        self._render()
+        return "break"
+
+    def _on_wheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_scrollbar(self, action: str, amount: str, unit: str | None = None):
+        if action == "moveto":
+            self._top = int(float(amount) * len(self._rows))
+            self._render()
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_select(self, event=None):
+        picked = self.listbox.curselection()
+        if picked:
+            self._select(self._first + picked[0])
+
+    def _move_selection(self, delta: int):
+        if not self._rows:
+            return "break"
+        row = self._top if self._selected is None else self._selected + delta
+        self._select(max(0, min(row, len(self._rows) - 1)))
+        self.see(self._selected)
+        return "break"
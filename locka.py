@@ -0,0 +1,260 @@
+"""
+Locka のコマンドライン版（GUIなし）。
+
+    python locka.py get github          # 一致したエントリのパスワードを表示
+    python locka.py search git --tags "仕事 AND NOT SNS"
+    python locka.py add --site GitHub --id me@example.com --tags "仕事, 開発"
+    python locka.py export -o backup.json
+    python locka.py convert data/locka.db    # 保存形式を変換する（.db なら SQLite、.enc ならファイル1つ）
+    python locka.py breach-import pwned-passwords-sha1.txt   # 流出パスワードの一覧を照合用に変換する（1回だけ）
+    python locka.py breach-check             # 全エントリを流出パスワードの一覧と照合する
+    python locka.py audit                    # 使い回し・弱いパスワードを一覧する
+
+起動を速くするため、暗号化まわり（vault / cryptography）はコマンドを実行するときに読み込む。
+Tk は読み込まない。get / search はエージェント（agent.py）が動いていればそちらに問い合わせる（KDFなし）。
+"""
+from __future__ import annotations
+
+import argparse
+import getpass
+import json
+import sys
+from pathlib import Path
+
+from metrics import METRICS, export_path
+from orders import ORDERS  # 並び順の名前だけ（軽いので先に読む）
+
+
+def _ask(prompt: str) -> str:
+    try:
+        return getpass.getpass(prompt)
+    except EOFError:
+        raise SystemExit("パスワードを読み取れませんでした（端末または標準入力が必要です）。")
+
+
+def _open_vault(args, create: bool = False):
+    from vault import Vault
+
+    vault = Vault(Path(args.vault))
+    if not vault.exists():
+        if not create:
+            raise SystemExit(f"保管庫が見つかりません: {args.vault}")
+        pw = _ask("新しいマスターパスワード: ")
+        if not pw.strip():
+            raise SystemExit("空のパスワードは設定できません。")
+        if _ask("確認のためもう一度: ") != pw:
+            raise SystemExit("パスワードが一致しません。")
+    else:
+        pw = _ask("マスターパスワード: ")
+    try:
+        # SQLite の保存先なら、全件を読むのは必要になったときだけ
+        vault.unlock(pw, lazy=True)
+    except ValueError:
+        raise SystemExit("パスワードが異なるか、データが壊れています。")
+    return vault
+
+
+def _ask_agent(args, payload: dict):
+    """エージェントに問い合わせる（いない・使わない指定・使えないOSなら None を返し、自分で解錠する）"""
+    if args.no_agent:
+        return None
+    import agent
+
+    if not agent.available():
+        return None  # Windows など（Unix ドメインソケット・ユーザーIDがない）
+
+    try:
+        return agent.request({**payload, "vault": str(Path(args.vault).resolve())})
+    except OSError:
+        return None
+
+
+def cmd_get(args) -> int:
+    from vault import format_record
+
+    found = _ask_agent(args, {"op": "get", "query": args.query, "tags": args.tags, "field": args.field})
+    if found is None:
+        found = _open_vault(args).lookup(args.query, tags=args.tags, field=args.field)
+    matches = found["matches"]
+    if not matches:
+        print("一致するエントリがありません。", file=sys.stderr)
+        return 1
+    if len(matches) > 1:
+        print("複数のエントリが一致しました。絞り込んでください:", file=sys.stderr)
+        for record in matches:
+            print(f"  {format_record(record)}", file=sys.stderr)
+        return 2
+
+    print(found["value"])
+    return 0
+
+
+def cmd_search(args) -> int:
+    from vault import format_record, summarize
+
+    payload = {"op": "search", "keyword": args.keyword, "fuzzy": args.fuzzy, "tags": args.tags, "order": args.sort}
+    found = _ask_agent(args, payload)
+    if found is None:
+        vault = _open_vault(args)
+        found = [summarize(r) for r in vault.query(args.keyword, fuzzy=args.fuzzy, tags=args.tags, order=args.sort)]
+    for record in found:
+        print(format_record(record))
+    return 0
+
+
+def cmd_add(args) -> int:
+    from vault import parse_tags
+
+    vault = _open_vault(args, create=True)
+    pw = sys.stdin.readline().rstrip("\n") if args.password_stdin else _ask(f"{args.site} のパスワード: ")
+    _warn_breached(pw)
+    vault.add(args.site, args.id, pw, parse_tags(args.tags or ""))
+    vault.save()
+    return 0
+
+
+def _warn_breached(pw: str):
+    """流出パスワードの一覧を変換してあれば照合し、あれば警告だけ出す（追加はする）"""
+    from breach import BreachIndex
+
+    index = BreachIndex.open_if_exists()
+    if index is None:
+        return
+    with index:
+        if index.contains(pw):
+            print("警告: このパスワードは流出したパスワードの一覧にあります。変更をおすすめします。", file=sys.stderr)
+
+
+def cmd_export(args) -> int:
+    vault = _open_vault(args)
+    text = json.dumps(vault.export_plain(), ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"平文のパスワードを含むファイルを書き出しました: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+def cmd_convert(args) -> int:
+    vault = _open_vault(args)
+    vault.convert(Path(args.output))
+    print(f"{len(vault.items)} 件を書き出しました: {args.output}（元の {args.vault} はそのまま残しています）", file=sys.stderr)
+    return 0
+
+
+def cmd_breach_import(args) -> int:
+    from breach import import_corpus
+
+    count = import_corpus(Path(args.source), Path(args.output), plain=args.plain)
+    print(f"{count} 件のハッシュを書き出しました: {args.output}", file=sys.stderr)
+    return 0
+
+
+def cmd_breach_check(args) -> int:
+    from breach import BreachIndex, audit
+    from vault import format_record
+
+    path = Path(args.corpus)
+    if not path.exists():
+        raise SystemExit(f"流出パスワードの一覧がありません。先に breach-import で変換してください: {path}")
+    vault = _open_vault(args)
+    with BreachIndex(path) as index:
+        found = audit(vault, index)
+    for record in found:
+        print(format_record(record))
+    print(f"{len(vault.items)} 件中 {len(found)} 件が流出したパスワードの一覧にありました。", file=sys.stderr)
+    return 1 if found else 0
+
+
+def cmd_audit(args) -> int:
+    from audit import WEAK_BITS, strength_label
+    from vault import format_record
+
+    vault = _open_vault(args)
+    index = vault.audit_index
+    groups = index.reuse_groups()
+    weak = index.weak(WEAK_BITS if args.weak_bits is None else args.weak_bits)
+    if groups:
+        print("同じパスワードを使っているエントリ:")
+    for group in groups:
+        print(f"  {len(group)} 件:")
+        for record in group:
+            print(f"    {format_record(record)}")
+    if weak:
+        print("弱いパスワード:")
+    for record in weak:
+        bits = index.strength(record)
+        print(f"  {format_record(record)}  {strength_label(bits)}（約 {bits} ビット）")
+    reused = sum(len(group) for group in groups)
+    print(f"{len(vault.items)} 件中 使い回し {reused} 件（{len(groups)} グループ）・弱い {len(weak)} 件", file=sys.stderr)
+    return 1 if groups or weak else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="locka", description="Locka パスワード管理（コマンドライン版）")
+    parser.add_argument("--vault", default=str(Path("data") / "locka.enc"), help="暗号化データのパス")
+    parser.add_argument("--no-agent", action="store_true", help="エージェントに問い合わせず、その場で解錠する")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("get", help="エントリのパスワード（または ID）を表示する")
+    p.add_argument("query", help="サイト名など（完全一致 → 部分一致 → あいまい検索の順に探す）")
+    p.add_argument("--field", choices=("pw", "id"), default="pw")
+    p.add_argument("--tags", help="タグ式（例: \"仕事 AND NOT SNS\"）")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("search", help="エントリを一覧する（パスワードは表示しない）")
+    p.add_argument("keyword", nargs="?", default="")
+    p.add_argument("--tags", help="タグ式（例: \"仕事 AND NOT SNS\"）")
+    p.add_argument("--fuzzy", action="store_true", help="あいまい検索（点数順）")
+    p.add_argument("--sort", default="name_asc", choices=tuple(ORDERS))
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("add", help="エントリを追加する")
+    p.add_argument("--site", required=True)
+    p.add_argument("--id", required=True)
+    p.add_argument("--tags", help="カンマ区切り（例: \"仕事, SNS\"）")
+    p.add_argument("--password-stdin", action="store_true", help="パスワードを標準入力の1行目から読む")
+    p.set_defaults(func=cmd_add)
+
+    p = sub.add_parser("convert", help="別の保存形式に変換する（拡張子で決まる。.db / .sqlite は SQLite）")
+    p.add_argument("output", help="書き出し先（例: data/locka.db）")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("breach-import", help="流出パスワードの一覧を照合用のファイルに変換する")
+    p.add_argument("source", help="Pwned Passwords の SHA-1 版（\"ハッシュ:件数\" の行。順序は問わない）")
+    p.add_argument("--plain", action="store_true", help="1行1パスワードの平文の一覧として読む")
+    p.add_argument("-o", "--output", default=str(Path("data") / "breach.idx"))
+    p.set_defaults(func=cmd_breach_import)
+
+    p = sub.add_parser("breach-check", help="全エントリのパスワードを流出パスワードの一覧と照合する（あれば終了コード 1）")
+    p.add_argument("--corpus", default=str(Path("data") / "breach.idx"), help="breach-import で作ったファイル")
+    p.set_defaults(func=cmd_breach_check)
+
+    p = sub.add_parser("audit", help="使い回し・弱いパスワードを一覧する（パスワードは表示しない。あれば終了コード 1）")
+    p.add_argument("--weak-bits", type=int, help="これ未満の見積もりを弱いとする（ビット。既定 50）")
+    p.set_defaults(func=cmd_audit)
+
+    p = sub.add_parser("export", help="平文のJSONに書き出す（取り扱い注意）")
+    p.add_argument("-o", "--output")
+    p.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        # タグ式の誤りなど
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        # LOCKA_METRICS を設定したときだけ、区間ごとの処理時間を書き出す
+        path = export_path()
+        if path is not None:
+            METRICS.export(path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
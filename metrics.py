@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+
+METRICS_WINDOW = 512  # 区間ごとに覚えておく直近の計測数（p50/p95/p99 はこの範囲で出す）
+METRICS_ENV = "LOCKA_METRICS"  # 書き出し先のパス（.prom なら Prometheus テキスト形式、それ以外は JSON）
+QUANTILES = (0.5, 0.95, 0.99)
+# ステータス行に出す操作（区間名 -> 表示名）。チャンク単位などの細かい区間は出さない
+OPERATIONS = {
+    "unlock": "解錠",
+    "save": "保存",
+    "reload": "読み直し",
+    "filter": "絞り込み",
+    "sort": "並び替え",
+}
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    """整列済みの値の q 分位点（最近傍。値がなければ 0）"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    """1つの区間の計測値（ミリ秒）。直近 METRICS_WINDOW 件から分位点を出す"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.recent: deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.recent.append(ms)
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> float:
+        return _quantile(sorted(self.recent), q)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "last_ms": round(self.recent[-1], 3) if self.recent else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            **{f"p{round(q * 100)}_ms": round(_quantile(ordered, q), 3) for q in QUANTILES},
+        }
+
+
+class Span:
+    """
+    計測区間。with で囲むか、resume() / pause() / finish() で手動で区切る
+    （ジェネレータのように途中で手放す処理は、手放している間を pause() で除く）。
+    finish() されなかった区間（取り消された検索など）は記録しない。
+    """
+    __slots__ = ("_metrics", "name", "_elapsed", "_start")
+
+    def __init__(self, metrics: Metrics, name: str):
+        self._metrics = metrics
+        self.name = name
+        self._elapsed = 0.0
+        self._start: float | None = None
+
+    def __enter__(self) -> Span:
+        return self.resume()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+
+    def resume(self) -> Span:
+        self._start = time.perf_counter()
+        return self
+
+    def pause(self):
+        if self._start is not None:
+            self._elapsed += time.perf_counter() - self._start
+            self._start = None
+
+    def finish(self):
+        self.pause()
+        self._metrics.record(self.name, self._elapsed * 1000)
+
+
+class Metrics:
+    """
+    処理区間ごとの所要時間を集める（書き込みスレッドやチャンクの並列処理からも記録するのでロックする）。
+    記録するのは区間名と時間だけで、エントリの中身やパスワードには触れない。
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._hists: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self.last_operation: tuple[str, float] | None = None  # (区間名, ミリ秒)。ステータス行用
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def record(self, name: str, ms: float):
+        with self._lock:
+            hist = self._hists.get(name)
+            if hist is None:
+                hist = self._hists[name] = Histogram(self.window)
+            hist.add(ms)
+            if name in OPERATIONS:
+                self.last_operation = (name, ms)
+
+    def quantile(self, name: str, q: float) -> float:
+        with self._lock:
+            hist = self._hists.get(name)
+            return hist.quantile(q) if hist is not None else 0.0
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {name: hist.summary() for name, hist in sorted(self._hists.items())}
+
+    def reset(self):
+        with self._lock:
+            self._hists.clear()
+            self.last_operation = None
+
+    def status_text(self) -> str:
+        """ステータス行の文字列（例: 「保存 12.3 ms（p95 20.1 ms）」）"""
+        last = self.last_operation
+        if last is None:
+            return ""
+        name, ms = last
+        return f"{OPERATIONS[name]} {ms:.1f} ms（p95 {self.quantile(name, 0.95):.1f} ms）"
+
+    # ---- 書き出し ----
+    def to_json(self) -> str:
+        return json.dumps({"generated_at": time.time(), "spans": self.snapshot()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus のテキスト形式（node_exporter の textfile collector で読める summary）"""
+        lines = [
+            "# HELP locka_span_seconds Time spent in each Locka operation.",
+            "# TYPE locka_span_seconds summary",
+        ]
+        for name, s in self.snapshot().items():
+            for q in QUANTILES:
+                lines.append(f'locka_span_seconds{{span="{name}",quantile="{q}"}} {s[f"p{round(q * 100)}_ms"] / 1000:.6f}')
+            lines.append(f'locka_span_seconds_sum{{span="{name}"}} {s["total_ms"] / 1000:.6f}')
+            lines.append(f'locka_span_seconds_count{{span="{name}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Path):
+        """path の拡張子に合わせて書き出す（.prom は Prometheus 形式、それ以外は JSON）"""
+        from storage import write_atomic
+
+        text = self.to_prometheus() if path.suffix == ".prom" else self.to_json()
+        write_atomic(path, text.encode("utf-8"))
+
+
+METRICS = Metrics()  # プロセス全体で共有する計測
+
+
+def export_path() -> Path | None:
+    """書き出し先（環境変数 LOCKA_METRICS。未設定なら書き出さない）"""
+    value = os.environ.get(METRICS_ENV, "").strip()
+    return Path(value) if value else None
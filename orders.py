@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator
+
+
+# 並び順 -> (キー, 降順か)。降順は (キー, -doc番号) の索引を後ろから読む（同じキーは降順でも追加順）
+ORDERS = {
+    "name_asc": ("name", False),
+    "name_desc": ("name", True),
+    "created_asc": ("created", False),
+    "created_desc": ("created", True),
+    "updated_asc": ("updated", False),
+    "updated_desc": ("updated", True),
+}
+_FIELDS = ("name", "created", "updated")
+_SORT_RATIO = 8  # 候補が全体の 1/8 未満なら、索引を歩くより候補だけ並べる方が速い
+
+
+def sort_keys(item: dict) -> tuple:
+    """(name, created, updated) の並び替えキー"""
+    return (
+        str(item.get("site", "")).lower(),
+        item.get("created_at", 0),
+        item.get("updated_at", 0),
+    )
+
+
+class SortIndex:
+    """
+    並び順ごとの整列済み索引。(キー, doc番号) のリストを bisect で差分更新し、
+    表示のたびに全件をソートし直さない。同じキーは追加順に並ぶ（降順でも。sorted(reverse=True) と同じ）。
+    索引は並び順ごとに、最初に使われたときに作る。
+    """
+
+    def __init__(self, items: Iterable[dict] = ()):
+        self._docs: dict[int, dict] = {}  # doc番号 -> item
+        self._doc_of: dict[str, int] = {}  # uid -> doc番号
+        self._keys: dict[int, tuple] = {}  # doc番号 -> sort_keys()
+        self._sorted: dict[tuple[str, bool], list[tuple] | None] = dict.fromkeys(ORDERS.values())  # 未作成は None
+        self._next_doc = 0
+        self.rebuild(items)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def rebuild(self, items: Iterable[dict]):
+        self._docs.clear()
+        self._doc_of.clear()
+        self._keys.clear()
+        self._next_doc = 0
+        for item in items:
+            self._register(item)
+        self._sorted = dict.fromkeys(ORDERS.values())
+
+    def _entries(self, field: str, descending: bool) -> list[tuple]:
+        entries = self._sorted[field, descending]
+        if entries is None:
+            pos = _FIELDS.index(field)
+            sign = -1 if descending else 1
+            entries = sorted((keys[pos], sign * doc) for doc, keys in self._keys.items())
+            self._sorted[field, descending] = entries
+        return entries
+
+    def _register(self, item: dict) -> int:
+        doc = self._next_doc
+        self._next_doc += 1
+        self._docs[doc] = item
+        self._doc_of[item["uid"]] = doc
+        self._keys[doc] = sort_keys(item)
+        return doc
+
+    def add(self, item: dict):
+        doc = self._register(item)
+        keys = self._keys[doc]
+        for (field, descending), entries in self._sorted.items():
+            if entries is not None:
+                insort(entries, (keys[_FIELDS.index(field)], -doc if descending else doc))
+
+    def remove(self, item: dict):
+        doc = self._doc_of.pop(item["uid"], None)
+        if doc is None:
+            return
+        del self._docs[doc]
+        keys = self._keys.pop(doc)
+        for (field, descending), entries in self._sorted.items():
+            if entries is None:
+                continue
+            at = bisect_left(entries, (keys[_FIELDS.index(field)], -doc if descending else doc))
+            del entries[at]
+
+    def replace(self, old: dict, new: dict):
+        self.remove(old)
+        self.add(new)
+
+    def _walk(self, field: str, descending: bool) -> Iterator[int]:
+        entries = self._entries(field, descending)
+        if descending:
+            for _, neg_doc in reversed(entries):
+                yield -neg_doc
+        else:
+            for _, doc in entries:
+                yield doc
+
+    def ordered(self, order: str, items: Iterable[dict] | None = None, limit: int | None = None) -> list[dict]:
+        """
+        order の並びで item を返す（items を渡せばその中だけ）。
+        limit 件そろった時点で索引を歩くのをやめる。
+        """
+        field, descending = ORDERS[order]
+        if items is None:
+            docs: Iterable[int] = self._walk(field, descending)
+        else:
+            doc_of = self._doc_of
+            wanted = [doc_of[x["uid"]] for x in items if x["uid"] in doc_of]
+            if len(wanted) * _SORT_RATIO < len(self._docs):
+                # 候補が少ない → 保持しているキーで候補だけを並べる（キーは作り直さない）
+                pos = _FIELDS.index(field)
+                wanted.sort()  # 同じキーは doc番号順（安定ソートなので降順でも保たれる）
+                wanted.sort(key=lambda doc: self._keys[doc][pos], reverse=descending)
+                docs = wanted
+            else:
+                allowed = set(wanted)
+                docs = (doc for doc in self._walk(field, descending) if doc in allowed)
+
+        result = []
+        for doc in docs:
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(self._docs[doc])
+        return result
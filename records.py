@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import sys
+import time
+import uuid
+from typing import Any, Callable, Iterable, Iterator
+
+
+SCHEMA_VERSION = 3  # items の形式の版（payload["schema"]。一致すれば読み込み時の補完・移行を省く）
+_FIELDS = ("uid", "site", "id", "pw_sealed", "tags", "created_at", "updated_at")
+_FIELD_SET = frozenset(_FIELDS)
+
+
+class TagTable:
+    """
+    タグ文字列を intern する（同じタグは全 record で同じ str オブジェクトを共有する）。
+    索引（TagIndex など）はタグ文字列をそのままキーにする。共有された str はハッシュを覚えているので、番号に置き換える必要はない。
+    """
+
+    def __init__(self):
+        self._names: dict[str, str] = {}
+
+    def intern(self, tag: str) -> str:
+        name = self._names.get(tag)
+        if name is None:
+            name = sys.intern(str(tag))
+            self._names[name] = name
+        return name
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+TAGS = TagTable()  # プロセス全体で共有するタグ表
+_MISSING = object()
+
+
+def _tags_of(tags: Any) -> tuple[str, ...]:
+    # list 以外の壊れた tags は、従来の補完と同じく空として扱う
+    if not isinstance(tags, (list, tuple)):
+        return ()
+    return tuple(map(TAGS.intern, tags))
+
+
+class Record:
+    """
+    1件分のエントリ。__slots__ で持ち、dict より小さい。
+    既存コードや保存形式（dict の payload）と混ぜて使えるよう、get / [] / items() などは dict と同じ形で読める。
+    書き換えずに replace() で新しい Record を作る運用（索引・チャンクの使い回しが参照の同一性に頼るため）。
+    None のフィールドは「キーがない」扱い（補完前の過去データもそのまま読めるように）。
+    """
+    __slots__ = _FIELDS + ("extra",)
+
+    def __init__(
+        self,
+        uid: str | None = None,
+        site: str | None = None,
+        id: str | None = None,
+        pw_sealed: str | None = None,
+        tags: Iterable[str] = (),
+        created_at: float | None = None,
+        updated_at: float | None = None,
+        extra: dict | None = None,
+    ):
+        self.uid = uid
+        self.site = site
+        self.id = id
+        self.pw_sealed = pw_sealed
+        self.tags = _tags_of(tags)
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.extra = extra or None  # 知らないキーも落とさずに持ち回る
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Record:
+        """保存形式の dict から作る（正規化はしない。migrate_items を参照）"""
+        if data.keys() <= _FIELD_SET:
+            # よくある形（知らないキーがない）は __init__ を通さずに詰める（読み込みが速い）
+            record = object.__new__(cls)
+            get = data.get
+            record.uid = get("uid")
+            record.site = get("site")
+            record.id = get("id")
+            record.pw_sealed = get("pw_sealed")
+            record.tags = _tags_of(get("tags", ()))
+            record.created_at = get("created_at")
+            record.updated_at = get("updated_at")
+            record.extra = None
+            return record
+        known = {k: v for k, v in data.items() if k in _FIELD_SET}
+        extra = {k: v for k, v in data.items() if k not in _FIELD_SET}
+        return cls(**known, extra=extra)
+
+    def to_dict(self) -> dict:
+        data = {k: v for k in _FIELDS if (v := getattr(self, k)) is not None}
+        data["tags"] = list(self.tags)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def replace(self, **changes: Any) -> Record:
+        data = self.to_dict()
+        data.update(changes)
+        return Record.from_dict(data)
+
+    # ---- dict と同じ読み方 ----
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> list[str]:
+        return list(self.to_dict())
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        return iter(self.to_dict().items())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __repr__(self) -> str:
+        return f"Record(uid={self.uid!r}, site={self.site!r}, id={self.id!r})"
+
+
+def migrate_items(
+    items: Iterable[Any],
+    seal: Callable[[str, str], str],
+    now: float | None = None,
+    rebind: Callable[[str, str], str] | None = None,
+) -> tuple[list[Record], bool]:
+    """
+    過去データの補完・移行を1回の走査で行い、Record の list を返す（変更があれば True も返す）。
+        - tags を文字列の list にそろえる
+        - created_at / updated_at がなければ補う
+        - uid がない・重複しているものには新しく振る
+        - 平文の pw は uid に結びつけて封印し、pw_sealed にする（seal(平文, uid)）
+        - rebind を渡すと、封印済みの pw_sealed も uid に結びつけて封印し直す（schema 2 以前から）
+    """
+    now = time.time() if now is None else now
+    result: list[Record] = []
+    seen: set[str] = set()
+    changed = False
+    for item in items:
+        data = item.to_dict() if isinstance(item, Record) else dict(item)
+        fixed = dict(data)
+
+        tags = data.get("tags", [])
+        fixed["tags"] = [str(t).strip() for t in tags if str(t).strip()] if isinstance(tags, (list, tuple)) else []
+        fixed.setdefault("created_at", now)
+        fixed.setdefault("updated_at", now)
+        uid = fixed.get("uid")
+        if not isinstance(uid, str) or not uid or uid in seen:
+            fixed["uid"] = uid = uuid.uuid4().hex
+        seen.add(uid)
+        if "pw" in fixed:
+            fixed["pw_sealed"] = seal(str(fixed.pop("pw")), uid)
+        elif rebind is not None and fixed.get("pw_sealed"):
+            fixed["pw_sealed"] = rebind(fixed["pw_sealed"], uid)
+
+        if fixed != data:
+            changed = True
+        elif isinstance(item, Record):
+            result.append(item)
+            continue
+        result.append(Record.from_dict(fixed))
+    return result, changed
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import heapq
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Callable, Iterable, Iterator
+
+
+FUZZY_LIMIT = 200  # あいまい検索で返す上位件数
+SEARCH_BATCH = 2000  # 少しずつ進める検索で、1回に確かめる件数
+INDEX_BATCH = 500  # 索引づくりを少しずつ進めるときの1回分の件数
+DEBOUNCE_MS = 150  # 入力が止まってから検索を始めるまでの待ち
+SLICE_MS = 12  # 検索ジョブが1回の after() で使ってよい時間
+_BOUNDARY = frozenset(" ._-@/:+")  # 単語の区切りとみなす文字
+_WEIGHTS = (3, 1, 2)  # site / id / tags の重み
+
+
+def normalize(text: str) -> str:
+    """全角・半角や大文字・小文字の違いをならす（NFKC＋casefold）"""
+    return unicodedata.normalize("NFKC", str(text)).casefold()
+
+
+def haystack_of(item: dict) -> str:
+    """検索対象の文字列（site + id + tags を正規化してつないだもの）"""
+    site, user_id, tags = _fields_of(item)
+    return f"{site} {user_id} {' '.join(tags)}".strip()
+
+
+def _fields_of(item: dict) -> tuple[str, str, tuple[str, ...]]:
+    return (
+        normalize(item.get("site", "")),
+        normalize(item.get("id", "")),
+        tuple(normalize(t) for t in item.get("tags", [])),
+    )
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Entry:
+    """索引に載せた1件分。正規化済みの文字列を持っておき、検索のたびに作り直さない"""
+    __slots__ = ("item", "haystack", "fields", "chars")
+
+    def __init__(self, item: dict):
+        self.item = item
+        self.fields = _fields_of(item)
+        site, user_id, tags = self.fields
+        self.haystack = f"{site} {user_id} {' '.join(tags)}".strip()
+        self.chars = frozenset(self.haystack)
+
+
+def subsequence_score(query: str, text: str) -> int:
+    """
+    query の文字が text に順番どおり現れれば（部分列）点数を返す。現れなければ 0。
+    連続一致・先頭一致・単語の頭での一致を高く評価する。
+    """
+    if not query or len(query) > len(text):
+        return 0
+
+    pos = text.find(query)
+    if pos >= 0:
+        # そのまま含まれる場合がいちばん強い
+        score = 40 * len(query)
+        if pos == 0:
+            score += 60
+        elif text[pos - 1] in _BOUNDARY:
+            score += 30
+        return score - (len(text) - len(query)) // 4
+
+    score = 0
+    prev = -1
+    for ch in query:
+        pos = text.find(ch, prev + 1)
+        if pos < 0:
+            return 0
+        s = 10
+        if pos == prev + 1 and prev >= 0:
+            s += 15
+        if pos == 0:
+            s += 20
+        elif text[pos - 1] in _BOUNDARY:
+            s += 15
+        if prev >= 0:
+            s -= min(pos - prev - 1, 5)
+        score += s
+        prev = pos
+    return max(score - (len(text) - len(query)) // 4, 1)
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """a と b が、1文字の置換・挿入・削除か、隣り合う2文字の入れ替えで一致するか"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+def typo_score(query: str, text: str) -> int:
+    """
+    部分列にならない打ち間違い（入れ替え・1文字違いなど）を拾う。
+    単語の頭から query と同じくらいの長さを切り出し、1手以内で一致すれば低めの点数を返す。
+    """
+    if len(query) < 4:
+        return 0
+    starts = [0] + [i + 1 for i, ch in enumerate(text) if ch in _BOUNDARY]
+    for start in starts[:4]:
+        for size in (len(query), len(query) - 1, len(query) + 1):
+            word = text[start:start + size]
+            if len(word) == size and within_one_edit(query, word):
+                return 5 * len(query) + (10 if start == 0 else 0)
+    return 0
+
+
+def fuzzy_score(terms: list[str], patterns: list[re.Pattern], entry: _Entry) -> int:
+    """
+    全ての語がどこかのフィールドに当たれば、重みつきの合計点を返す（外れたら 0）。
+    patterns は各語の部分列を表す正規表現で、当たらない語は site の打ち間違いだけを確かめる。
+    """
+    site, user_id, tags = entry.fields
+    total = 0
+    for term, pattern in zip(terms, patterns):
+        best = 0
+        if pattern.search(entry.haystack):
+            for weight, texts in zip(_WEIGHTS, ((site,), (user_id,), tags)):
+                for text in texts:
+                    best = max(best, subsequence_score(term, text) * weight)
+        if best == 0:
+            best = typo_score(term, site) * _WEIGHTS[0]
+        if best == 0:
+            return 0
+        total += best
+    return total
+
+
+class SearchIndex:
+    """
+    site / id / tags のトライグラム転置インデックス。
+    itemの追加・差し替え・削除のたびに差分だけ更新し、検索は
+    候補（全トライグラムのposting listの積集合）を絞ってから部分一致で確かめる。
+    直前の検索結果も覚えておき、文字を打ち足して絞り込む場合はそこから探す。
+    索引そのものは最初に検索されたときに作る（アンロック直後の起動を遅くしない）。
+    iter_search() / iter_rank() は SEARCH_BATCH 件ごとに None を返しながら進み、
+    途中で捨てても索引は壊れない（UIを止めずに少しずつ検索するため）。
+    """
+
+    def __init__(self, items: Iterable[dict] = ()):
+        self._docs: dict[int, _Entry] = {}  # doc番号 -> 正規化済みの1件
+        self._doc_of: dict[str, int] = {}  # uid -> doc番号
+        self._postings: defaultdict[str, set[int]] = defaultdict(set)
+        self._next_doc = 0
+        self._last: tuple[str, list[int]] | None = None  # 直前の (keyword, 結果)
+        self._pending: list[dict] | None = None  # まだ索引にしていない item
+        self._version = 0  # 追加・削除のたびに増やす（途中まで進んだ検索が古くなったかの判定用）
+        self.rebuild(items)
+
+    def __len__(self) -> int:
+        return len(self._docs) + len(self._pending or ())
+
+    def rebuild(self, items: Iterable[dict]):
+        self._docs.clear()
+        self._doc_of.clear()
+        self._postings.clear()
+        self._last = None
+        self._pending = list(items)
+
+    def _ensure(self):
+        for _ in self._ensure_steps():
+            pass
+
+    def _ensure_steps(self, batch: int = INDEX_BATCH) -> Iterator[None]:
+        """まだ索引にしていない item を batch 件ずつ索引にする"""
+        while self._pending:
+            chunk = self._pending[:batch]
+            del self._pending[:batch]
+            for item in chunk:
+                self._index(item)
+            yield None
+        self._pending = None
+
+    def add(self, item: dict):
+        if self._pending is not None:
+            self._pending.append(item)
+            return
+        self._index(item)
+
+    def _index(self, item: dict):
+        doc = self._next_doc
+        self._next_doc += 1
+        entry = _Entry(item)
+        self._docs[doc] = entry
+        self._doc_of[item["uid"]] = doc
+        for gram in trigrams(entry.haystack):
+            self._postings[gram].add(doc)
+        self._last = None
+        self._version += 1
+
+    def remove(self, item: dict):
+        if self._pending is not None:
+            # 索引づくりの途中なら、索引済みの側にある場合もある
+            self._pending = [x for x in self._pending if x["uid"] != item["uid"]]
+        doc = self._doc_of.pop(item["uid"], None)
+        if doc is None:
+            return
+        entry = self._docs.pop(doc)
+        for gram in trigrams(entry.haystack):
+            posting = self._postings[gram]
+            posting.discard(doc)
+            if not posting:
+                del self._postings[gram]
+        self._last = None
+        self._version += 1
+
+    def replace(self, old: dict, new: dict):
+        self.remove(old)
+        self.add(new)
+
+    def search(self, keyword: str) -> list[dict]:
+        """keyword を含む item を追加順に返す"""
+        return _last_of(self.iter_search(keyword))
+
+    def iter_search(self, keyword: str, batch: int = SEARCH_BATCH) -> Iterator[list[dict] | None]:
+        """search() を少しずつ進める版。途中は None を、最後に結果を返す"""
+        yield from self._ensure_steps()
+        keyword = normalize(keyword)
+        if not keyword:
+            yield [entry.item for entry in self._docs.values()]
+            return
+
+        if self._last is not None and self._last[0] in keyword:
+            # 打ち足しで絞り込んでいる → 前回の結果だけを確かめれば足りる
+            candidates: list[int] = self._last[1]
+        elif len(keyword) >= 3:
+            postings = sorted((self._postings.get(g, set()) for g in trigrams(keyword)), key=len)
+            candidates = sorted(set.intersection(*postings)) if postings[0] else []
+        else:
+            # 2文字以下はトライグラムが作れないので、事前に作った haystack を総なめする
+            candidates = list(self._docs)
+
+        version = self._version
+        docs: list[int] = []
+        for start in range(0, len(candidates), batch):
+            if start:
+                yield None
+            for doc in candidates[start:start + batch]:
+                entry = self._docs.get(doc)  # 途中で削除されていることもある
+                if entry is not None and keyword in entry.haystack:
+                    docs.append(doc)
+        if version == self._version:
+            self._last = (keyword, docs)
+        yield [self._docs[doc].item for doc in docs if doc in self._docs]
+
+    def rank(self, query: str, limit: int = FUZZY_LIMIT) -> list[dict]:
+        """
+        あいまい検索。空白区切りの各語を部分列・打ち間違いで照合して点数をつけ、
+        上位 limit 件だけを有界ヒープで選ぶ（全件ソートしない: O(n log k)）。
+        """
+        return _last_of(self.iter_rank(query, limit))
+
+    def iter_rank(self, query: str, limit: int = FUZZY_LIMIT, batch: int = SEARCH_BATCH) -> Iterator[list[dict] | None]:
+        """rank() を少しずつ進める版。途中は None を、最後に結果を返す"""
+        yield from self._ensure_steps()
+        terms = normalize(query).split()
+        if not terms:
+            yield [entry.item for entry in self._docs.values()]
+            return
+
+        patterns = [re.compile(".*?".join(map(re.escape, term))) for term in terms]
+        # 使われている文字がほとんど含まれない item は採点する前に弾く
+        # （打ち間違いを拾えるのは4種類以上の文字を使う検索のときだけ）
+        needed = frozenset("".join(terms))
+        allowed_missing = 1 if len(needed) >= 4 else 0
+
+        heap: list[tuple[int, int]] = []
+        for n, (doc, entry) in enumerate(list(self._docs.items()), 1):
+            if n % batch == 0:
+                yield None
+            if len(needed - entry.chars) > allowed_missing:
+                continue
+            score = fuzzy_score(terms, patterns, entry)
+            if not score:
+                continue
+            key = (score, -doc)  # 同点なら先に追加したものを上に
+            if len(heap) < limit:
+                heapq.heappush(heap, key)
+            elif key > heap[0]:
+                heapq.heapreplace(heap, key)
+
+        ranked = (-neg_doc for _, neg_doc in sorted(heap, reverse=True))
+        yield [self._docs[doc].item for doc in ranked if doc in self._docs]
+
+
+def _last_of(steps: Iterator[Any]) -> Any:
+    result = None
+    for result in steps:
+        pass
+    return result
+
+
+class SearchScheduler:
+    """
+    検索ジョブを Tk の after() で少しずつ進める（UIスレッドを長く止めない）。
+    入力中は debounce し、新しい検索が来たら古いジョブは捨てて結果も反映しない。
+    ジョブは、途中なら None を、表示できる結果が出たら (rows, done) を yield するジェネレータ。
+    """
+
+    def __init__(self, widget, debounce_ms: int = DEBOUNCE_MS, slice_ms: int = SLICE_MS):
+        self.widget = widget
+        self.debounce_ms = debounce_ms
+        self.slice_ms = slice_ms
+        self._job: Iterator[Any] | None = None
+        self._deliver: Callable[[Any, bool], None] | None = None
+        self._after_id: str | None = None
+
+    @property
+    def busy(self) -> bool:
+        return self._job is not None
+
+    def submit(self, job: Iterator[Any], deliver: Callable[[Any, bool], None], debounce: bool = False):
+        """
+        job を始める（前のジョブは取り消す）。debounce なら入力が止まるまで待ち、
+        そうでなければ最初の1区切りをこの場で進める。
+        """
+        self.cancel()
+        self._job, self._deliver = job, deliver
+        if debounce:
+            self._after_id = self.widget.after(self.debounce_ms, self._step)
+        else:
+            self._step()
+
+    def cancel(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        if self._job is not None:
+            self._job.close()
+            self._job = None
+
+    def _step(self):
+        self._after_id = None
+        job = self._job
+        if job is None:
+            return
+        deadline = time.perf_counter() + self.slice_ms / 1000
+        while True:
+            try:
+                out = next(job)
+            except StopIteration:
+                self._job = None
+                return
+            if out is not None:
+                rows, done = out
+                if done:
+                    self._job = None
+                self._deliver(rows, done)
+                if done or self._job is not job:
+                    # 完了、または反映中に次の検索が始まった
+                    return
+            if time.perf_counter() >= deadline:
+                break
+        self._after_id = self.widget.after(1, self._step)
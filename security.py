@@ -1,19 +1,66 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import hmac
 import json
+import lzma
 import os
-from dataclasses import dataclass
-from typing import Any
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives import hashes
 
+from metrics import METRICS
+
+
+DEFAULT_ITERS = 390_000  # PBKDF2 の反復回数（キャリブレーション前の既定値）
+MIN_PBKDF2_ITERS = 100_000  # キャリブレーションしてもこれより弱くはしない
+SCRYPT_MIN_N = 2 ** 14
+SCRYPT_MAX_N = 2 ** 20  # メモリ使用量 128 * n * r bytes の上限（1GiB）
+DEFAULT_COMPRESSION = "zlib"  # 暗号化前の圧縮（"none" / "zlib" / "lzma"）
+CHUNK_RECORDS = 1024  # v3以降で1チャンクにまとめるレコード数
+
+# ---- バイナリコンテナ（v2: 一括 / v3: チャンク分割 / v4: データ鍵をヘッダに格納） ----
+# magic | version | kdf_id | compression | reserved | kdf params(3) | salt | nonce | generation | [wrapped key] | 本体
+#   v2 本体: payload全体のAEAD暗号文
+#   v3,v4 本体: マニフェスト長 | マニフェスト（AEAD） | チャンク(nonce＋AEAD暗号文)…
+MAGIC = b"LCKA"
+CONTAINER_VERSION = 4
+_SUPPORTED_VERSIONS = (2, 3, 4)
+_HEADER_V3 = struct.Struct(">4sBBBBIII16s12sQ")
+_HEADER = struct.Struct(">4sBBBBIII16s12sQ60s")
+_KDF_IDS = {"pbkdf2-sha256": 1, "scrypt": 2}
+_KDF_NAMES = {v: k for k, v in _KDF_IDS.items()}
+_COMPRESSION_IDS = {"none": 0, "zlib": 1, "lzma": 2}
+_COMPRESSION_NAMES = {v: k for k, v in _COMPRESSION_IDS.items()}
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+_KEY_SIZE = 32
+_MANIFEST_LEN = struct.Struct(">I")
+_CHUNK_AAD = MAGIC + b"/chunk"
+_SECRET_AAD = MAGIC + b"/secret/"  # + record の uid（封印したパスワードを別の record へ移すと開けない）
+_LEGACY_SECRET_AAD = MAGIC + b"/secret"  # schema 2 以前（uid に結びつけていない）
+_WRAP_AAD = MAGIC + b"/dek"
+_BLIND_SIZE = 16  # 目隠し索引（鍵つきハッシュ）のバイト数
+
+_chunk_executor: ThreadPoolExecutor | None = None
+
 
 @dataclass(frozen=True)
 class EncryptedPayload:
-    """暗号化ファイルに保存するメタ情報つきペイロード"""
+    """v1形式（JSON＋Fernet）のメタ情報つきペイロード。読み込み互換のために残している"""
     v: int
     kdf: str
     iters: int
@@ -21,44 +68,622 @@ class EncryptedPayload:
     token: str
 
 
-def _derive_fernet_key(master_password: str, salt: bytes, iters: int) -> bytes:
-    """マスターパス＋saltからFernet鍵（base64 32bytes）を作る"""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=iters,
-    )
-    raw_key = kdf.derive(master_password.encode("utf-8"))
-    return base64.urlsafe_b64encode(raw_key)
+@dataclass(frozen=True)
+class KdfParams:
+    """KDFの種類とパラメータ（ヘッダに保存する）"""
+    kdf: str = "pbkdf2-sha256"
+    iters: int = DEFAULT_ITERS  # PBKDF2 の反復回数
+    n: int = 0  # scrypt のコストパラメータ
+    r: int = 0
+    p: int = 0
+
+    def values(self) -> tuple[int, int, int]:
+        """ヘッダの3つのパラメータ欄に入れる値"""
+        if self.kdf == "scrypt":
+            return self.n, self.r, self.p
+        return self.iters, 0, 0
+
+    @classmethod
+    def from_values(cls, kdf: str, a: int, b: int, c: int) -> KdfParams:
+        if kdf == "scrypt":
+            return cls(kdf=kdf, iters=0, n=a, r=b, p=c)
+        return cls(kdf=kdf, iters=a)
+
+    def cost(self) -> int:
+        """同じKDF同士で強さを比べるための目安"""
+        if self.kdf == "scrypt":
+            return self.n * self.r * self.p
+        return self.iters
+
+
+@dataclass(frozen=True)
+class KdfPolicy:
+    """
+    どのKDFを、どれくらいの解錠時間を目安に使うか。
+    パラメータはこのマシンで計測して決め（calibrate）、
+    ファイルのパラメータが外れていれば次回保存時に鍵を包み直す。
+    """
+    kdf: str = "pbkdf2-sha256"
+    target_ms: int = 300
+    tolerance: float = 0.5  # 目標コストからこの比率までのずれは許容する
+
+    def calibrate(self) -> KdfParams:
+        """このマシンでKDFを試し、target_ms 程度で終わるパラメータを選ぶ"""
+        target = self.target_ms / 1000
+        if self.kdf == "scrypt":
+            n = SCRYPT_MIN_N
+            while n < SCRYPT_MAX_N:
+                # コストは n にほぼ比例するので、倍にして目標を超えるならここで止める
+                if _time_kdf(KdfParams(kdf="scrypt", iters=0, n=n, r=8, p=1)) * 2 > target:
+                    break
+                n *= 2
+            return KdfParams(kdf="scrypt", iters=0, n=n, r=8, p=1)
+
+        probe = 50_000
+        elapsed = _time_kdf(KdfParams(iters=probe))
+        iters = int(probe * target / max(elapsed, 1e-6)) // 10_000 * 10_000
+        return KdfParams(iters=max(MIN_PBKDF2_ITERS, iters))
+
+    def accepts(self, current: KdfParams, desired: KdfParams) -> bool:
+        """current のままでよいか（KDFの種類が同じで、コストが許容範囲内）"""
+        if current.kdf != desired.kdf:
+            return False
+        ratio = current.cost() / max(desired.cost(), 1)
+        return 1 - self.tolerance <= ratio <= 1 + self.tolerance
+
+
+def _time_kdf(params: KdfParams) -> float:
+    start = time.perf_counter()
+    _derive_raw_key("calibration", os.urandom(16), params)
+    return time.perf_counter() - start
+
+
+@dataclass(frozen=True)
+class VaultHeader:
+    """コンテナの固定長ヘッダ（AEADの追加認証データとしても使う）"""
+    params: KdfParams
+    salt: bytes
+    nonce: bytes
+    compression: str = "none"
+    generation: int = 0
+    wrapped_key: bytes = b""  # v4: KDF鍵で包んだデータ鍵
+    version: int = CONTAINER_VERSION
+
+    def pack(self) -> bytes:
+        fields = (
+            MAGIC,
+            self.version,
+            _KDF_IDS[self.params.kdf],
+            _COMPRESSION_IDS[self.compression],
+            0,
+            *self.params.values(),
+            self.salt,
+            self.nonce,
+            self.generation,
+        )
+        if self.version >= 4:
+            return _HEADER.pack(*fields, self.wrapped_key)
+        return _HEADER_V3.pack(*fields)
+
+    @classmethod
+    def unpack(cls, blob: bytes) -> VaultHeader:
+        version = container_version(blob)
+        if version not in _SUPPORTED_VERSIONS:
+            raise ValueError(f"未対応のフォーマットバージョンです: {version}")
+        layout = _HEADER if version >= 4 else _HEADER_V3
+        if len(blob) < layout.size:
+            raise ValueError("ヘッダが短すぎます。")
+        magic, version, kdf_id, comp_id, _, a, b, c, salt, nonce, generation, *rest = layout.unpack_from(blob)
+        if magic != MAGIC:
+            raise ValueError("Lockaのデータファイルではありません。")
+        compression = _COMPRESSION_NAMES.get(comp_id)
+        if kdf_id not in _KDF_NAMES or compression is None:
+            raise ValueError("未対応のKDFまたは圧縮形式です。")
+        return cls(
+            params=KdfParams.from_values(_KDF_NAMES[kdf_id], a, b, c),
+            salt=salt,
+            nonce=nonce,
+            compression=compression,
+            generation=generation,
+            wrapped_key=rest[0] if rest else b"",
+            version=version,
+        )
+
+    @property
+    def size(self) -> int:
+        return (_HEADER if self.version >= 4 else _HEADER_V3).size
+
+
+@dataclass(frozen=True)
+class SessionKey:
+    """
+    アンロック時に一度だけ導出した鍵をセッション中保持する。
+    保存時は対称暗号だけを使い、KDFは回さない。
+
+    kek はマスターパスからKDFで導出した鍵で、データ鍵(dek)を包むだけに使う。
+    チャンク・ジャーナル・パスワードはすべて dek から切り出した鍵で暗号化するので、
+    KDFのパラメータやsaltを変えても（rekey）中身を暗号化し直す必要はない。
+    v3以前のファイルは KDFの結果そのものを dek として扱う。
+    """
+    params: KdfParams
+    salt: bytes = field(repr=False)
+    kek: bytes = field(repr=False)
+    dek: bytes = field(repr=False)
+    _fernet: Fernet = field(init=False, repr=False, compare=False)
+    _aead: AESGCM = field(init=False, repr=False, compare=False)
+    _secret_aead: AESGCM = field(init=False, repr=False, compare=False)
+    _index_key: bytes = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_fernet", Fernet(base64.urlsafe_b64encode(self.dek)))
+        # v2以降の鍵はデータ鍵からHKDFで用途別に切り出す（Fernet鍵と共用しない）
+        object.__setattr__(self, "_aead", AESGCM(_subkey(self.dek, b"locka/v2/data")))
+        object.__setattr__(self, "_secret_aead", AESGCM(_subkey(self.dek, b"locka/v3/secret")))
+        object.__setattr__(self, "_index_key", _subkey(self.dek, b"locka/v5/index"))
+
+    @classmethod
+    def derive(
+        cls,
+        master_password: str,
+        salt: bytes | None = None,
+        params: KdfParams | None = None,
+        dek: bytes | None = None,
+    ) -> SessionKey:
+        """
+        マスターパスから鍵を導出する（saltを省略すると新規生成）。
+        dek を省略すると、導出した鍵をそのままデータ鍵にする（v3以前の互換用）。
+        """
+        if salt is None:
+            salt = os.urandom(16)
+        if params is None:
+            params = KdfParams()
+        kek = _derive_raw_key(master_password, salt=salt, params=params)
+        return cls(params=params, salt=salt, kek=kek, dek=kek if dek is None else dek)
+
+    @classmethod
+    def create(cls, master_password: str, params: KdfParams | None = None) -> SessionKey:
+        """新規の保管庫用に、ランダムなデータ鍵を持つ鍵を作る"""
+        return cls.derive(master_password, params=params, dek=os.urandom(_KEY_SIZE))
+
+    def rekey(self, master_password: str, params: KdfParams | None = None) -> SessionKey:
+        """
+        マスターパス変更・KDF変更用。新しいsalt（とパラメータ）で kek を導出し直す。
+        データ鍵はそのままなので、保存済みのチャンクや封印したパスワードは使い回せる。
+        """
+        return SessionKey.derive(master_password, params=params or self.params, dek=self.dek)
+
+    def wrap(self) -> bytes:
+        """データ鍵を kek で包む（v4ヘッダに入れる）"""
+        nonce = os.urandom(_NONCE_SIZE)
+        return nonce + AESGCM(self.kek).encrypt(nonce, self.dek, _WRAP_AAD)
+
+    @classmethod
+    def unwrap(cls, master_password: str, header: VaultHeader) -> SessionKey:
+        """v4ヘッダからデータ鍵を取り出す（パスワード違いは InvalidTag）"""
+        kek = _derive_raw_key(master_password, salt=header.salt, params=header.params)
+        wrapped = header.wrapped_key
+        dek = AESGCM(kek).decrypt(wrapped[:_NONCE_SIZE], wrapped[_NONCE_SIZE:], _WRAP_AAD)
+        return cls(params=header.params, salt=header.salt, kek=kek, dek=dek)
+
+
+def _derive_raw_key(master_password: str, salt: bytes, params: KdfParams) -> bytes:
+    """マスターパス＋saltから32bytesの鍵を作る（PBKDF2-SHA256 または scrypt）"""
+    if params.kdf == "scrypt":
+        kdf = Scrypt(salt=salt, length=_KEY_SIZE, n=params.n, r=params.r, p=params.p)
+    else:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=_KEY_SIZE,
+            salt=salt,
+            iterations=params.iters,
+        )
+    with METRICS.span("kdf"):
+        return kdf.derive(master_password.encode("utf-8"))
+
+
+class SecretBox:
+    """
+    パスワードなどの秘密フィールドを1件ずつ専用のサブ鍵で封印・開封する。
+    封印は record の uid に結びつける（追加認証データ）ので、別の record に移した暗号文は開けない。
+    一覧表示はメタ情報だけで済むので、平文は必要になった分だけ復号し、
+    小さなLRUにだけ置く（ロック時に clear() で捨てる）。
+    """
+
+    def __init__(self, session: SessionKey, capacity: int = 256):
+        self._aead = session._secret_aead
+        self.capacity = capacity
+        self._cache: OrderedDict[tuple[str, str], str] = OrderedDict()  # (uid, 暗号文) -> 平文
+
+    def seal(self, plain: str, uid: str) -> str:
+        nonce = os.urandom(_NONCE_SIZE)
+        sealed = nonce + self._aead.encrypt(nonce, plain.encode("utf-8"), _SECRET_AAD + uid.encode("utf-8"))
+        return base64.b64encode(sealed).decode("ascii")
+
+    def open(self, sealed: str, uid: str, remember: bool = True) -> str:
+        """remember=False なら LRU に置かない（全件を照合するときなど、一覧表示の分を押し出さない）"""
+        if not sealed:
+            return ""
+        key = (uid, sealed)
+        plain = self._cache.get(key)
+        if plain is not None:
+            self._cache.move_to_end(key)
+            return plain
+
+        plain = self._decrypt(sealed, _SECRET_AAD + uid.encode("utf-8"))
+        if not remember:
+            return plain
+        self._cache[key] = plain
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return plain
+
+    def rebind(self, sealed: str, uid: str) -> str:
+        """schema 2 以前の（uid に結びつけていない）封印を開き、uid に結びつけて封印し直す（移行用）"""
+        try:
+            plain = self._decrypt(sealed, _LEGACY_SECRET_AAD)
+        except ValueError:
+            self.open(sealed, uid, remember=False)  # すでに結びつけてあればそのまま
+            return sealed
+        return self.seal(plain, uid)
+
+    def _decrypt(self, sealed: str, aad: bytes) -> str:
+        raw = base64.b64decode(sealed)
+        try:
+            return self._aead.decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], aad).decode("utf-8")
+        except InvalidTag:
+            raise ValueError("パスワードの復号に失敗しました。データが壊れています。")
+
+    def clear(self):
+        self._cache.clear()
+
+
+def _subkey(raw_key: bytes, info: bytes) -> bytes:
+    """データ鍵から用途別の32bytes鍵を作る"""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(raw_key)
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(data, 6)
+    if compression == "lzma":
+        return lzma.compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return data
+
+
+def container_version(blob: bytes) -> int:
+    """ファイル形式を判定する（v1: JSON＋Fernet / v2以降: バイナリ）"""
+    if blob[:len(MAGIC)] == MAGIC and len(blob) > len(MAGIC):
+        return blob[len(MAGIC)]
+    return 1
+
+
+def _chunk_key(record: Any) -> Any:
+    """チャンク分けで record を見分ける値（uid。なければオブジェクトそのもの）"""
+    uid = record.get("uid") if isinstance(record, dict) else getattr(record, "uid", None)
+    return uid if uid is not None else id(record)
+
+
+class ChunkCache:
+    """
+    前回書き込んだ（または読み込んだ）チャンクの暗号文と、どの record がどのチャンクにいたかを保持する。
+    itemは書き換えずに差し替える運用なので、同じitemオブジェクトの並びなら
+    暗号文をそのまま使い回せる（保存時は変更のあったチャンクだけ暗号化し直す）。
+    """
+
+    def __init__(self):
+        self._owner: tuple[bytes, str] | None = None
+        self._entries: dict[tuple[int, ...], tuple[tuple, bytes]] = {}
+        self._by_tag: dict[bytes, tuple[tuple, bytes]] = {}  # 暗号文のタグ -> (records, 暗号文)。読み直し用
+        self._layout: list[tuple] = []  # 前回のチャンク分け（並び順）
+        self._starts: dict[int, int] = {}  # id(チャンクの先頭の record) -> _layout の番号
+        self._slots: dict[Any, int] = {}  # _chunk_key -> 前回いたチャンクの番号（変わったチャンクの分だけ振り直す）
+        self._next_slot = 0
+
+    def layout(self, records: list, chunk_records: int, session: SessionKey, compression: str) -> list[tuple]:
+        """
+        前回のチャンク分けをなるべく保って records を分ける。
+        record は前回と同じチャンクに、新しい record は直前の record と同じチャンクに入れるので、
+        1件の追加・削除で後ろのチャンクの境界がずれない（暗号化し直すのはそのチャンクだけ）。
+        大きくなりすぎたチャンクは分け、小さな切れ端は前のチャンクにまとめる。
+        """
+        if self._owner != (session.dek, compression) or not self._layout:
+            return [tuple(records[i:i + chunk_records]) for i in range(0, len(records), chunk_records)]
 
+        prev, starts, slots = self._layout, self._starts, self._slots
+        groups: list[list] = []
+        current = None  # 直前の record がいたチャンクの番号
+        pos, k, count = 0, 0, len(records)
+        while pos < count:
+            if k < len(prev):
+                chunk = prev[k]
+                end = pos + len(chunk)
+                if tuple(records[pos:end]) == chunk:
+                    # 変わっていないチャンクは丸ごと（1件ずつ見ない）
+                    groups.append(list(chunk))
+                    current = slots.get(_chunk_key(chunk[-1]))
+                    pos, k = end, k + 1
+                    continue
+            # 変わったところは、変わっていないチャンクの先頭が来るまで1件ずつ前回のチャンクに振り分ける
+            while pos < count:
+                record = records[pos]
+                j = starts.get(id(record))
+                if j is not None and j > k:
+                    k = j
+                    break
+                slot = slots.get(_chunk_key(record))
+                if not groups or (slot is not None and current is not None and slot != current):
+                    groups.append([])
+                if slot is not None:
+                    current = slot
+                groups[-1].append(record)
+                pos += 1
 
-def encrypt_items(items: Any, master_password: str) -> bytes:
+        result: list[tuple] = []
+        for group in groups:
+            if result and len(group) <= chunk_records // 4 and len(result[-1]) + len(group) <= 2 * chunk_records:
+                result[-1] += tuple(group)
+            elif len(group) > 2 * chunk_records:
+                result.extend(tuple(group[i:i + chunk_records]) for i in range(0, len(group), chunk_records))
+            else:
+                result.append(tuple(group))
+        return result
+
+    def get(self, records: tuple, session: SessionKey, compression: str) -> bytes | None:
+        if self._owner != (session.dek, compression):
+            return None
+        hit = self._entries.get(tuple(map(id, records)))
+        return hit[1] if hit is not None else None
+
+    def find(self, blob: bytes, session: SessionKey, compression: str) -> tuple | None:
+        """同じ暗号文のチャンクがあれば、その records を返す（ほかのプロセスが書き直したファイルの読み直し用）"""
+        if self._owner != (session.dek, compression):
+            return None
+        hit = self._by_tag.get(blob[-_TAG_SIZE:])
+        return hit[0] if hit is not None and hit[1] == blob else None
+
+    def replace(self, chunks: list[tuple[tuple, bytes]], session: SessionKey, compression: str):
+        # recordsへの参照を持ち続けるので、id() が別オブジェクトに再利用されることはない
+        owner = (session.dek, compression)
+        old = self._entries
+        if owner != self._owner or len(self._slots) > 2 * sum(len(records) for records, _ in chunks):
+            old, self._slots = {}, {}  # 消えた record の分がたまったら振り直す
+        self._owner = owner
+        self._entries = {}
+        for records, blob in chunks:
+            key = tuple(map(id, records))
+            if key not in old:
+                self._next_slot += 1
+                self._slots.update(dict.fromkeys(map(_chunk_key, records), self._next_slot))
+            self._entries[key] = (records, blob)
+        self._by_tag = {blob[-_TAG_SIZE:]: (records, blob) for records, blob in chunks}
+        self._layout = [records for records, _ in chunks]
+        self._starts = {id(records[0]): i for i, records in enumerate(self._layout) if records}
+
+
+def _map_chunks(fn, chunks: list) -> list:
+    """チャンク単位の処理をスレッドプールで並列に回す（cryptography/zlibはGILを解放する）"""
+    global _chunk_executor
+    if len(chunks) <= 1:
+        return [fn(c) for c in chunks]
+    if _chunk_executor is None:
+        _chunk_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="locka-chunk")
+    return list(_chunk_executor.map(fn, chunks))
+
+
+def _json_default(obj: Any) -> Any:
+    """dict 以外の record（to_dict() を持つもの）も保存形式の dict にして書く"""
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"保存できない値です: {type(obj).__name__}")
+    return to_dict()
+
+
+# チャンク単位の区間（json_encode / compress / encrypt など）は1チャンクあたりの時間（並列に走る）
+def _seal_chunk(records: tuple, session: SessionKey, compression: str) -> bytes:
+    with METRICS.span("json_encode"):
+        data = json.dumps(records, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+    with METRICS.span("compress"):
+        plain = _compress(data, compression)
+    with METRICS.span("encrypt"):
+        nonce = os.urandom(_NONCE_SIZE)
+        return nonce + session._aead.encrypt(nonce, plain, _CHUNK_AAD)
+
+
+def _open_chunk(chunk: bytes, session: SessionKey, compression: str, factory: Callable[[dict], Any] | None = None) -> list:
+    with METRICS.span("decrypt"):
+        plain = session._aead.decrypt(chunk[:_NONCE_SIZE], chunk[_NONCE_SIZE:], _CHUNK_AAD)
+    with METRICS.span("decompress"):
+        data = _decompress(plain, compression)
+    with METRICS.span("json_decode"):
+        records = json.loads(data.decode("utf-8"))
+        if factory is not None:
+            records = [factory(r) for r in records]
+    return records
+
+
+def encrypt_items(
+    items: Any,
+    session: SessionKey,
+    compression: str = DEFAULT_COMPRESSION,
+    generation: int = 0,
+    chunk_records: int = CHUNK_RECORDS,
+    cache: ChunkCache | None = None,
+) -> bytes:
     """
-    items（Pythonのlist/dict）を暗号化して、ファイル保存用bytesを返す
+    items（Pythonのlist/dict）をセッション鍵で暗号化して、ファイル保存用bytes（v4形式）を返す。
+    レコードは chunk_records 件ずつのチャンクに分けて個別のnonceで並列に暗号化し、
+    各チャンクのタグを並び順どおりに載せたマニフェストで、並べ替え・欠落を検知できるようにする。
+    cache を渡すと、前回のチャンク分けを保ち（ChunkCache.layout）、変わっていないチャンクは暗号化し直さない。
     """
-    iters = 390_000
-    salt = os.urandom(16)
-    key = _derive_fernet_key(master_password, salt=salt, iters=iters)
+    if isinstance(items, dict):
+        records = items.get("items", []) or []
+        meta = {k: v for k, v in items.items() if k != "items"}
+    else:
+        records, meta = items, {}
 
-    f = Fernet(key)
-    plain = json.dumps(items, ensure_ascii=False).encode("utf-8")
-    token = f.encrypt(plain).decode("utf-8")
+    if cache is not None:
+        groups = cache.layout(records, chunk_records, session, compression)
+    else:
+        groups = [tuple(records[i:i + chunk_records]) for i in range(0, len(records), chunk_records)]
 
-    payload = EncryptedPayload(
-        v=1,
-        kdf="pbkdf2-sha256",
-        iters=iters,
-        salt_b64=base64.b64encode(salt).decode("ascii"),
-        token=token,
+    def seal(group: tuple) -> bytes:
+        if cache is not None:
+            blob = cache.get(group, session, compression)
+            if blob is not None:
+                return blob
+        return _seal_chunk(group, session, compression)
+
+    chunks = _map_chunks(seal, groups)
+    if cache is not None:
+        cache.replace(list(zip(groups, chunks)), session, compression)
+
+    manifest = {
+        "meta": meta,
+        "chunks": [[len(g), len(c), base64.b64encode(c[-_TAG_SIZE:]).decode("ascii")] for g, c in zip(groups, chunks)],
+    }
+    header = VaultHeader(
+        params=session.params,
+        salt=session.salt,
+        nonce=os.urandom(_NONCE_SIZE),
+        compression=compression,
+        generation=generation,
+        wrapped_key=session.wrap(),
     )
-    return json.dumps(payload.__dict__, ensure_ascii=False, indent=2).encode("utf-8")
+    aad = header.pack()
+    sealed_manifest = session._aead.encrypt(
+        header.nonce,
+        _compress(json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), compression),
+        aad,
+    )
+    return b"".join([aad, _MANIFEST_LEN.pack(len(sealed_manifest)), sealed_manifest, *chunks])
 
 
-def decrypt_items(blob: bytes, master_password: str) -> Any:
+def unlock_items(
+    blob: bytes,
+    master_password: str,
+    cache: ChunkCache | None = None,
+    factory: Callable[[dict], Any] | None = None,
+) -> tuple[Any, SessionKey]:
     """
-    暗号化ファイル(bytes)を復号して payload(dict) を返す
+    暗号化ファイル(bytes)を復号して (payload, セッション鍵) を返す。
+    鍵はファイルのsaltから導出するので、以降の保存でそのまま使える。
+    v1（JSON＋Fernet）/ v2（バイナリ一括）/ v3,v4（チャンク分割）は自動判別する。
+    factory を渡すと、チャンク形式の items は1件ずつ factory(dict) に通した値になる。
     """
+    version = container_version(blob)
+    if version >= 3:
+        return _unlock_chunked(blob, master_password, cache, factory)
+    if version == 2:
+        return _unlock_v2(blob, master_password)
+    return _unlock_v1(blob, master_password)
+
+
+def _unlock_chunked(
+    blob: bytes,
+    master_password: str,
+    cache: ChunkCache | None,
+    factory: Callable[[dict], Any] | None,
+) -> tuple[Any, SessionKey]:
+    try:
+        header = VaultHeader.unpack(blob)
+        if header.version >= 4:
+            session = SessionKey.unwrap(master_password, header)
+        else:
+            session = SessionKey.derive(master_password, salt=header.salt, params=header.params)
+        return _open_chunked(blob, header, session, cache, factory), session
+
+    except InvalidTag:
+        raise ValueError("マスターパスワードが異なるか、ファイルが壊れています。")
+    except Exception as e:
+        raise ValueError(f"復号に失敗しました。: {e}")
+
+
+def reopen_items(
+    blob: bytes,
+    session: SessionKey,
+    cache: ChunkCache | None = None,
+    factory: Callable[[dict], Any] | None = None,
+) -> Any:
+    """
+    ほかのプロセスが書き直したファイルを、解錠済みのセッション鍵で読み直して payload を返す（KDFなし）。
+    cache にあるのと同じ暗号文のチャンクは復号せず、前回の record をそのまま使う（変わったチャンクだけ復号する）。
+    """
+    if container_version(blob) < 3:
+        raise ValueError("この形式のファイルは読み直せません。解錠し直してください。")
+    try:
+        return _open_chunked(blob, VaultHeader.unpack(blob), session, cache, factory)
+    except InvalidTag:
+        raise ValueError("ファイルが壊れているか、改ざんされています。")
+
+
+def _open_chunked(
+    blob: bytes,
+    header: VaultHeader,
+    session: SessionKey,
+    cache: ChunkCache | None,
+    factory: Callable[[dict], Any] | None,
+) -> dict:
+    aad = blob[:header.size]
+
+    pos = header.size
+    (manifest_len,) = _MANIFEST_LEN.unpack_from(blob, pos)
+    pos += _MANIFEST_LEN.size
+    manifest_plain = session._aead.decrypt(header.nonce, blob[pos:pos + manifest_len], aad)
+    manifest = json.loads(_decompress(manifest_plain, header.compression).decode("utf-8"))
+    pos += manifest_len
+
+    chunks = []
+    for count, size, tag in manifest["chunks"]:
+        chunk = blob[pos:pos + size]
+        if len(chunk) != size or chunk[-_TAG_SIZE:] != base64.b64decode(tag):
+            raise ValueError("チャンクが欠けているか、並びが改ざんされています。")
+        chunks.append(chunk)
+        pos += size
+    if pos != len(blob):
+        raise ValueError("ファイル末尾に不明なデータがあります。")
+
+    def open_chunk(chunk: bytes) -> Any:
+        hit = cache.find(chunk, session, header.compression) if cache is not None else None
+        return list(hit) if hit is not None else _open_chunk(chunk, session, header.compression, factory)
+
+    groups = _map_chunks(open_chunk, chunks)
+    records = []
+    for (count, _, _), group in zip(manifest["chunks"], groups):
+        if len(group) != count:
+            raise ValueError("チャンクのレコード数が一致しません。")
+        records.extend(group)
+
+    if cache is not None:
+        cache.replace([(tuple(g), c) for g, c in zip(groups, chunks)], session, header.compression)
+
+    return {**manifest["meta"], "items": records}
+
+
+def _unlock_v2(blob: bytes, master_password: str) -> tuple[Any, SessionKey]:
+    try:
+        header = VaultHeader.unpack(blob)
+        session = SessionKey.derive(master_password, salt=header.salt, params=header.params)
+        aad = blob[:header.size]
+        plain = session._aead.decrypt(header.nonce, blob[header.size:], aad)
+        data = json.loads(_decompress(plain, header.compression).decode("utf-8"))
+
+        return data, session
+
+    except InvalidTag:
+        raise ValueError("マスターパスワードが異なるか、ファイルが壊れています。")
+    except Exception as e:
+        raise ValueError(f"復号に失敗しました。: {e}")
+
+
+def _unlock_v1(blob: bytes, master_password: str) -> tuple[Any, SessionKey]:
     try:
         meta: dict[str, Any] = json.loads(blob.decode("utf-8"))
 
@@ -66,15 +691,54 @@ def decrypt_items(blob: bytes, master_password: str) -> Any:
         iters = int(meta["iters"])
         token = meta["token"].encode("utf-8")
 
-        key = _derive_fernet_key(master_password, salt=salt, iters=iters)
-        f = Fernet(key)
+        session = SessionKey.derive(master_password, salt=salt, params=KdfParams(iters=iters))
 
-        plain = f.decrypt(token)
+        plain = session._fernet.decrypt(token)
         data = json.loads(plain.decode("utf-8"))
 
-        return data
+        return data, session
 
     except InvalidToken:
         raise ValueError("マスターパスワードが異なるか、ファイルが壊れています。")
     except Exception as e:
         raise ValueError(f"復号に失敗しました。: {e}")
+
+
+def decrypt_items(blob: bytes, master_password: str) -> Any:
+    """
+    暗号化ファイル(bytes)を復号して payload(dict) を返す
+    """
+    data, _ = unlock_items(blob, master_password)
+    return data
+
+
+def seal_record(record: Any, session: SessionKey, aad: bytes = MAGIC) -> bytes:
+    """
+    ジャーナル1件分をセッション鍵で暗号化する（nonce＋AEAD暗号文。改ざん検知つき）
+    aad を渡すと、その値にも結びつける（SQLiteの行なら行の索引。別の行へ移すと復号できない）
+    """
+    plain = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + session._aead.encrypt(nonce, plain, aad)
+
+
+def open_record(token: bytes, session: SessionKey, version: int = CONTAINER_VERSION, aad: bytes = MAGIC) -> Any:
+    """
+    seal_record で暗号化した1件を復号する（version=1 は旧形式のFernetトークン）
+    """
+    try:
+        if version == 1:
+            plain = session._fernet.decrypt(token)
+        else:
+            plain = session._aead.decrypt(token[:_NONCE_SIZE], token[_NONCE_SIZE:], aad)
+        return json.loads(plain.decode("utf-8"))
+    except (InvalidToken, InvalidTag):
+        raise ValueError("ジャーナルのレコードが壊れているか、改ざんされています。")
+
+
+def blind_index(session: SessionKey, value: str) -> bytes:
+    """
+    検索用の目隠し索引（データ鍵から切り出した鍵での HMAC-SHA256）。
+    同じ値は同じ索引になるので一致検索には使えるが、鍵がなければ元の値は推測できない。
+    """
+    return hmac.new(session._index_key, value.encode("utf-8"), hashlib.sha256).digest()[:_BLIND_SIZE]
@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+from cryptography.exceptions import InvalidTag
+
+from metrics import METRICS
+from security import KdfPolicy, SessionKey, VaultHeader, blind_index, open_record, seal_record
+from storage import merge_ops, merge_payload, resolve_kdf_params
+
+
+_ROW_AAD = b"LCKA/row"  # 行の暗号文に結びつける値（＋uid の目隠し索引）
+_STATE_AAD = b"LCKA/state"  # state の暗号文に結びつける値（＋ヘッダ）
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    pos INTEGER PRIMARY KEY,
+    uid_tag BLOB NOT NULL UNIQUE,
+    site_tag BLOB NOT NULL,
+    data BLOB NOT NULL,
+    gen INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_site ON items (site_tag);
+"""
+
+
+class SqliteStore:
+    """
+    SQLite による保存（1件1行。JournalStore と同じ使い方ができる）。
+
+    - 行は1件ずつセッション鍵で AEAD 暗号化する。AAD に uid の目隠し索引を入れるので、
+      暗号文を別の行へ移すと復号できない
+    - 索引は鍵つきハッシュ（uid・サイト名の一致検索用）。名前や日時の順序を表に出すと内容が漏れるので、
+      平文で持つのは保存順（pos）だけ。並び替えは読み込んだあとに SortIndex で行う
+    - WAL モード。変更は変わった行だけを1トランザクションで書く（件数によらず O(変更行数)）
+    - 件数・設定・世代は暗号化した state に入れ、読み込み時に行数と突き合わせる（行の削除・追加を検知）
+    - items を読まずに開ける（load_items=False）。サイト名の完全一致なら find_site() で該当行だけ復号する
+    - 行には書いたときの世代（gen）を持たせる。ほかのプロセスが保存していたら、
+      前回より後の世代の行だけを復号して読み直す（書く前の確認は BEGIN IMMEDIATE の中で行う）
+    - ヘッダも書く直前にトランザクションの中で読み直す。ほかのプロセスが包み直していれば、それを上書きしない
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        policy: KdfPolicy | None = None,
+        record_factory: Callable[[dict], Any] | None = None,
+    ):
+        self.path = path
+        self.journal_path = Path(f"{path}-wal")  # 変更の検知用（JournalStore のジャーナルに当たる）
+        self.kdf_cache_path = path.with_name("kdf.json")
+        self.policy = policy or KdfPolicy()
+        self.record_factory = record_factory
+
+        self.session: SessionKey | None = None
+        self.generation = 0  # 保存のたびに進める
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()  # 書き込みスレッドと UI スレッドで接続を共有する
+        self._header = b""  # VaultHeader.pack()（前回読み書きしたもの。空なら次の保存で作る）
+        self._rewrap = False  # 次の保存でデータ鍵を包み直すか（KDF のパラメータがポリシーから外れていた）
+        self._count = 0  # state に記録された件数
+        self._positions: list[int] | None = None  # Vault.items の位置 -> pos（None なら未読み込み）
+        self._next_pos = 0
+        self._needs_rewrite = False
+        self._meta: dict = {}  # state のうち件数・世代以外（設定など）
+        self._version = None  # PRAGMA data_version（ほかの接続が書くと変わる）
+        self._disk: dict | None = None  # ファイル上の内容（前回読み書きした時点。items を読んでいなければ None）
+        self._base: dict | None = None  # 呼び出し側が知っている内容（次の ops はこれに対する変更。_disk と別物なら合わせる）
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # トランザクションは自分で張る（isolation_level=None）
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")  # 1件の変更も fsync してから返す（JournalStore と同じ）
+            db.executescript(_SCHEMA)
+            if "gen" not in {row[1] for row in db.execute("PRAGMA table_info(items)")}:
+                # 行ごとの世代がなかったころの表（既存の行は 0 ＝読み直しでは変わっていない扱い）
+                db.execute("ALTER TABLE items ADD COLUMN gen INTEGER NOT NULL DEFAULT 0")
+            db.execute("CREATE INDEX IF NOT EXISTS items_gen ON items (gen)")
+            self._db = db
+        return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def read(self) -> tuple[bytes, bytes] | None:
+        """ヘッダと state を読む（I/Oのみ。なければNone）"""
+        if not self.path.exists():
+            return None
+        with self._lock:
+            db = self._connect()
+            self._version = self._data_version(db)
+            return self._read_meta(db)
+
+    @staticmethod
+    def _read_meta(db: sqlite3.Connection) -> tuple[bytes, bytes] | None:
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        if "header" not in meta or "state" not in meta:
+            return None
+        return meta["header"], meta["state"]
+
+    @staticmethod
+    def _data_version(db: sqlite3.Connection) -> int:
+        return db.execute("PRAGMA data_version").fetchone()[0]
+
+    def open(self, raw: tuple[bytes, bytes] | None, master_password: str, load_items: bool = True) -> Any:
+        """
+        read() の結果を復号して payload を返す（新規なら鍵だけ作って None）。
+        load_items=False なら items は読まない（payload に "items" が入らない。あとで load_items() で読む）。
+        """
+        with METRICS.span("unlock"):
+            if raw is None:
+                params = resolve_kdf_params(self.policy, self.kdf_cache_path)
+                self.session = SessionKey.create(master_password, params=params)
+                self._positions = []
+                self._needs_rewrite = True
+                return None
+
+            header_blob, state_blob = raw
+            try:
+                header = VaultHeader.unpack(header_blob)
+                self.session = SessionKey.unwrap(master_password, header)
+            except InvalidTag:
+                raise ValueError("マスターパスワードが異なるか、ファイルが壊れています。")
+            state = self._open_state(header_blob, state_blob)
+            self._header = header_blob
+            self._apply_policy(master_password)
+            self._set_state(state)
+            if load_items:
+                items = self.load_items()  # read() のあとに書かれていれば、state もそのときのものに変わる
+                return {**self._meta, "items": items}
+            return dict(self._meta)
+
+    def _set_state(self, state: dict):
+        self.generation = int(state.get("generation", 0))
+        self._count = int(state.get("count", 0))
+        self._meta = {k: v for k, v in state.items() if k not in ("count", "generation")}
+
+    def _open_state(self, header_blob: bytes, state_blob: bytes) -> dict:
+        try:
+            return open_record(state_blob, self.session, aad=_STATE_AAD + header_blob)
+        except ValueError:
+            raise ValueError("保管庫の管理情報が壊れているか、改ざんされています。")
+
+    def load_items(self) -> list:
+        """全行を保存順に復号する（state と行は同じ読み取りトランザクションで読む）"""
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN")
+            try:
+                state = self._disk_state(db)
+                rows = db.execute("SELECT pos, uid_tag, data FROM items ORDER BY pos").fetchall()
+            finally:
+                db.execute("COMMIT")
+        if state is not None:
+            self._set_state(state)
+        if len(rows) != self._count:
+            raise ValueError("行が欠けているか、増えています。")
+        with METRICS.span("decrypt"):
+            items = [self._open_row(uid_tag, data) for _, uid_tag, data in rows]
+        self._positions = [pos for pos, _, _ in rows]
+        self._next_pos = rows[-1][0] + 1 if rows else 0
+        self._disk = self._base = {**self._meta, "items": items}
+        return items
+
+    def find_site(self, site: str) -> list:
+        """サイト名（大文字小文字は区別しない）が一致する行だけを復号して返す（全件は読まない）"""
+        tag = blind_index(self.session, site.casefold())
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT uid_tag, data FROM items WHERE site_tag = ? ORDER BY pos", (tag,)
+            ).fetchall()
+        return [self._open_row(uid_tag, data) for uid_tag, data in rows]
+
+    def _open_row(self, uid_tag: bytes, data: bytes) -> Any:
+        try:
+            item = open_record(data, self.session, aad=_ROW_AAD + uid_tag)
+        except ValueError:
+            raise ValueError("行が壊れているか、改ざんされています。")
+        return self.record_factory(item) if self.record_factory is not None else item
+
+    def _row(self, item: Any, gen: int) -> tuple[bytes, bytes, bytes, int]:
+        """(uid_tag, site_tag, data, gen)"""
+        uid_tag = blind_index(self.session, item["uid"])
+        site_tag = blind_index(self.session, str(item.get("site", "")).casefold())
+        return uid_tag, site_tag, seal_record(item, self.session, aad=_ROW_AAD + uid_tag), gen
+
+    def adopt(self, session: SessionKey):
+        """
+        別の保存先で解錠済みの鍵をそのまま使う（保存形式の変換用）。
+        データ鍵が同じなので、封印済みのパスワードは暗号化し直さなくてよい。次の保存は全体保存。
+        """
+        self.session = session
+        self._header = b""
+        self._rewrap = False
+        self._positions = []
+        self._needs_rewrite = True
+        self._disk = self._base = None
+
+    def commit(self, payload: dict, ops: list[dict] | None):
+        """
+        変更を保存する。ops があれば変わった行だけを書き、ops=None（全体保存）なら全行を書き直す。
+        どちらも1トランザクションで、state（件数・設定・世代）も一緒に書く。
+        前回読んでからほかのプロセスが保存していれば、record 単位で合わせた内容を書く。
+        """
+        with METRICS.span("save"):
+            rewrite = ops is None or self._needs_rewrite
+            with self._lock, METRICS.span("write"):
+                db = self._connect()
+                saved = (
+                    self._positions and list(self._positions), self._next_pos, self._count, self.generation, self._disk,
+                    self._header, self._rewrap,
+                )
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    written, ops = self._rebase(db, payload, ops)
+                    generation = self.generation + 1
+                    if self._positions is None and not rewrite:
+                        # items を読まずに開いた場合。位置指定の操作に要るので pos だけ読む（復号はしない）
+                        self._positions = [pos for (pos,) in db.execute("SELECT pos FROM items ORDER BY pos")]
+                        self._next_pos = self._positions[-1] + 1 if self._positions else 0
+                    if rewrite:
+                        self._rewrite(db, written["items"], generation)
+                    else:
+                        for op in ops:
+                            self._apply(db, op, generation)
+                    self._write_state(db, written, generation)
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    # 途中まで進めた位置表などは書く前に戻す
+                    (
+                        self._positions, self._next_pos, self._count, self.generation, self._disk,
+                        self._header, self._rewrap,
+                    ) = saved
+                    raise
+            self.generation = generation
+            self._needs_rewrite = False
+            if rewrite or self._base is not None:
+                self._disk, self._base = written, payload
+            # items を読まずに追加した場合の payload は全件ではないので覚えない（load_items で読んだときに揃う）
+
+    def pull(self) -> dict | None:
+        """
+        ほかのプロセスが保存した内容（commit で合わせた内容を含む）を返す。前回から変わっていなければ None。
+        呼び出し側は未保存の変更がないときだけ呼び、返った payload を自分の内容にすること。
+        """
+        with self._lock:
+            if self._base is None:
+                return None
+            db = self._connect()
+            version = self._data_version(db)
+            pulled = False
+            if version != self._version:
+                db.execute("BEGIN")
+                try:
+                    state = self._disk_state(db)
+                    if state is not None and int(state["generation"]) != self.generation:
+                        self._pull_disk(db, state)
+                        pulled = True
+                finally:
+                    db.execute("COMMIT")
+                self._version = version
+            if not pulled and self._base is self._disk:
+                return None
+            self._base = self._disk
+            return self._disk
+
+    def _disk_state(self, db: sqlite3.Connection) -> dict | None:
+        """いまの state（件数・設定・世代）。まだ書かれていなければ None"""
+        raw = self._read_meta(db)
+        return self._open_state(*raw) if raw is not None else None
+
+    def _rebase(self, db: sqlite3.Connection, payload: dict, ops: list[dict] | None) -> tuple[dict, list[dict] | None]:
+        """
+        書く内容と操作を返す（トランザクションの中で呼ぶ）。ほかのプロセスが先に保存していれば、
+        ファイル上の内容と record 単位で合わせ、ファイル上の内容からの操作に作り直す。
+        """
+        state = self._disk_state(db)
+        stale = state is not None and int(state["generation"]) != self.generation
+        if stale and self._base is None:
+            # items を読まずに開いた（CLI の追加など）。位置は書く直前に読み直すので、合わせるのは設定だけ
+            self.generation = int(state["generation"])
+            self._positions = None
+            if not any(op.get("op") == "settings" for op in ops or ()):
+                payload = {**payload, "settings": state.get("settings", payload.get("settings"))}
+            return payload, ops
+        if self._base is None or (not stale and self._base is self._disk):
+            return payload, ops
+        if stale:
+            self._pull_disk(db, state)
+        merged = merge_payload(self._base, payload, self._disk)
+        return merged, None if ops is None else merge_ops(self._disk, merged)
+
+    def _pull_disk(self, db: sqlite3.Connection, state: dict):
+        """
+        ファイル上の最新の内容を self._disk に読む（トランザクションの中で呼ぶ）。
+        前回より後の世代で書かれた行だけを復号し、ほかは手元の record を使う。
+        """
+        with METRICS.span("reload"):
+            positions = [pos for (pos,) in db.execute("SELECT pos FROM items ORDER BY pos")]
+            if len(positions) != int(state.get("count", 0)):
+                raise ValueError("行が欠けているか、増えています。")
+            changed = {
+                pos: self._open_row(uid_tag, data)
+                for pos, uid_tag, data in db.execute("SELECT pos, uid_tag, data FROM items WHERE gen > ?", (self.generation,))
+            }
+            known = dict(zip(self._positions, self._disk["items"]))
+            items = []
+            for pos in positions:
+                item = changed.get(pos)
+                if item is None:
+                    item = known.get(pos)
+                if item is None:
+                    raise ValueError("行が壊れているか、改ざんされています。")
+                items.append(item)
+            self._positions = positions
+            self._next_pos = positions[-1] + 1 if positions else 0
+            self._set_state(state)
+            self._disk = {**self._meta, "items": items}
+
+    def _rewrite(self, db: sqlite3.Connection, items: list, gen: int):
+        db.execute("DELETE FROM items")
+        db.executemany(
+            "INSERT INTO items (pos, uid_tag, site_tag, data, gen) VALUES (?, ?, ?, ?, ?)",
+            ((pos, *self._row(item, gen)) for pos, item in enumerate(items)),
+        )
+        self._positions = list(range(len(items)))
+        self._next_pos = len(items)
+
+    def _apply(self, db: sqlite3.Connection, op: dict, gen: int):
+        """ジャーナルと同じ位置指定の操作を1行ずつ反映する"""
+        kind = op.get("op")
+        if kind == "add":
+            pos = self._next_pos
+            db.execute(
+                "INSERT INTO items (pos, uid_tag, site_tag, data, gen) VALUES (?, ?, ?, ?, ?)", (pos, *self._row(op["item"], gen))
+            )
+            self._positions.append(pos)
+            self._next_pos += 1
+        elif kind == "update":
+            pos = self._positions[op["index"]]
+            db.execute(
+                "UPDATE items SET uid_tag = ?, site_tag = ?, data = ?, gen = ? WHERE pos = ?", (*self._row(op["item"], gen), pos)
+            )
+        elif kind == "delete":
+            db.execute("DELETE FROM items WHERE pos = ?", (self._positions.pop(op["index"]),))
+        elif kind != "settings":
+            # settings は state に入るので行は書かない
+            raise ValueError(f"未知のジャーナル操作です: {kind}")
+
+    def _write_state(self, db: sqlite3.Connection, payload: dict, generation: int):
+        self._resolve_header(db)
+        self._count = len(self._positions)
+        state = {k: v for k, v in payload.items() if k != "items"}
+        state.update(count=self._count, generation=generation)
+        self._meta = {k: v for k, v in state.items() if k not in ("count", "generation")}
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("header", self._header), ("state", seal_record(state, self.session, aad=_STATE_AAD + self._header))],
+        )
+
+    def _resolve_header(self, db: sqlite3.Connection):
+        """
+        書くヘッダを決める（トランザクションの中で呼ぶ）。
+        開いたあとにほかのプロセスが包み直していれば、そのヘッダを使い、こちらの包み直しは取りやめる
+        （データ鍵は同じなので state も行もそのまま読める。パスワードは持っていないので、その鍵は導出し直さない）。
+        """
+        raw = self._read_meta(db)
+        if raw is not None and self._header and raw[0] != self._header:
+            self._header, self._rewrap = raw[0], False
+        if self._rewrap or not self._header:
+            self._header = VaultHeader(
+                params=self.session.params,
+                salt=self.session.salt,
+                nonce=os.urandom(12),
+                wrapped_key=self.session.wrap(),
+            ).pack()
+            self._rewrap = False
+
+    def _apply_policy(self, master_password: str):
+        """
+        解錠した直後に、KDFのパラメータがポリシーどおりか確かめる（外れていれば次の保存で鍵を包み直すだけ）。
+        マスターパスワードはここでだけ使い、保存先には残さない。
+        """
+        desired = resolve_kdf_params(self.policy, self.kdf_cache_path)
+        if not self.policy.accepts(self.session.params, desired):
+            self.session = self.session.rekey(master_password, params=desired)
+            self._rewrap = True  # 行は暗号化し直さない（データ鍵は同じ）
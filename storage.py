@@ -0,0 +1,707 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from metrics import METRICS
+from security import (
+    CONTAINER_VERSION,
+    ChunkCache,
+    KdfParams,
+    KdfPolicy,
+    SessionKey,
+    container_version,
+    encrypt_items,
+    open_record,
+    reopen_items,
+    seal_record,
+    unlock_items,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+JOURNAL_MAX_BYTES = 256 * 1024  # ジャーナルがこのサイズを超えたらスナップショットへまとめる
+JOURNAL_MAX_RATIO = 0.5  # スナップショットに対するジャーナルの比率の上限
+_FRAME = struct.Struct(">I")  # v2ジャーナルの各レコードの長さ
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")  # この拡張子なら SQLite の保存先（sqlstore.SqliteStore）
+
+
+def write_atomic(path: Path, data: bytes):
+    """
+    一時ファイルに書いて fsync → rename で置き換える。
+    書き込み途中で落ちても、元のファイルは壊れずに残る。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # rename自体も確定させる（ディレクトリのfsyncはPOSIXのみ）
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def file_stamp(path: Path) -> tuple | None:
+    """ファイルの (inode, サイズ, 更新時刻)。変わっていれば誰かが書いた（なければ None）"""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class FileLock:
+    """
+    保管庫を複数のプロセスで共有するための助言ロック（保管庫の隣の .lock ファイルにかける）。
+    読むときは共有、書くときは排他。持ったまま落ちたプロセスの分は OS が外す。
+    POSIX は flock、Windows は msvcrt.locking（共有ロックがないので常に排他）。
+    同じプロセスの中でも入れ子にはしないこと（別々に開いたファイル同士なので自分自身を待ってしまう）。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @contextmanager
+    def hold(self, shared: bool = False) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def same_record(a: Any, b: Any) -> bool:
+    """同じ内容の record か（同じオブジェクトなら中身は比べない）"""
+    return a is b or dict(a.items()) == dict(b.items())
+
+
+def _updated_at(record: Any) -> float:
+    return float(record.get("updated_at") or 0)
+
+
+def merge_payload(base: dict, local: dict, remote: dict) -> dict:
+    """
+    同じ base から、このプロセス（local）とほかのプロセス（remote。ファイル上の内容）が
+    別々に変更した payload を record 単位で合わせる（uid で対応づける）。
+        - 片方だけが変えた record は、その変更を採る
+        - 両方が変えた record は updated_at の新しいほう（同じなら local）
+        - 片方が削除し、もう片方が編集していた record は残す（データを失わない側に倒す）
+        - 並びは remote の並びから削除・差し替えをして、local で増えた record を末尾に足したもの
+        - settings は local で変えた項目だけ local、ほかは remote
+    """
+    base_items = {x["uid"]: x for x in base["items"]}
+    local_items = {x["uid"]: x for x in local["items"]}
+    remote_uids = set()
+    merged = []
+    for r in remote["items"]:
+        uid = r["uid"]
+        remote_uids.add(uid)
+        b = base_items.get(uid)
+        l = local_items.get(uid)
+        if l is None:
+            # local で削除した（remote でも変わっていなければ消す）か、remote で追加された
+            if b is None or not same_record(r, b):
+                merged.append(r)
+        elif b is not None and same_record(l, b):
+            merged.append(r)
+        elif b is not None and same_record(r, b):
+            merged.append(l)
+        else:
+            merged.append(l if _updated_at(l) >= _updated_at(r) else r)
+    for l in local["items"]:
+        uid = l["uid"]
+        if uid in remote_uids:
+            continue
+        b = base_items.get(uid)
+        # local で追加した、または remote で削除されたが local で編集していた
+        if b is None or not same_record(l, b):
+            merged.append(l)
+
+    base_settings = base.get("settings") or {}
+    settings = dict(remote.get("settings") or {})
+    for key, value in (local.get("settings") or {}).items():
+        if key not in base_settings or base_settings[key] != value:
+            settings[key] = value
+    return {**remote, "items": merged, "settings": settings}
+
+
+def merge_ops(remote: dict, merged: dict) -> list[dict]:
+    """
+    remote を merged にするジャーナル操作（位置指定）を作る。
+    merged は remote から削除・差し替え・末尾への追加だけでできていること（merge_payload の結果）。
+    """
+    kept = {x["uid"] for x in merged["items"]}
+    ops: list[dict] = []
+    pos = 0
+    for item in remote["items"]:
+        if item["uid"] not in kept:
+            ops.append({"op": "delete", "index": pos})
+            continue
+        current = merged["items"][pos]
+        if current is not item:
+            ops.append({"op": "update", "index": pos, "item": current})
+        pos += 1
+    ops.extend({"op": "add", "item": item} for item in merged["items"][pos:])
+    if merged.get("settings") != remote.get("settings"):
+        ops.append({"op": "settings", "settings": merged["settings"]})
+    return ops
+
+
+def apply_op(payload: dict, op: dict):
+    """
+    ジャーナルの1操作を payload に適用する。
+    items の位置はアプリ側の self.items と同じ並びを指す。
+    """
+    kind = op["op"]
+    items = payload["items"]
+    if kind == "add":
+        items.append(op["item"])
+    elif kind == "update":
+        items[op["index"]] = op["item"]
+    elif kind == "delete":
+        del items[op["index"]]
+    elif kind == "settings":
+        payload["settings"] = op["settings"]
+    else:
+        raise ValueError(f"未知のジャーナル操作です: {kind}")
+
+
+def resolve_kdf_params(policy: KdfPolicy, cache_path: Path) -> KdfParams:
+    """
+    このマシン向けのKDFパラメータを返す。
+    ポリシーが前回と同じなら計測結果（cache_path）を使い回し、変わっていれば計測し直す。
+    """
+    try:
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+        if cached["kdf"] == policy.kdf and cached["target_ms"] == policy.target_ms:
+            return KdfParams(**cached["params"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    params = policy.calibrate()
+    record = {"kdf": policy.kdf, "target_ms": policy.target_ms, "params": asdict(params)}
+    try:
+        write_atomic(cache_path, json.dumps(record, indent=2).encode("utf-8"))
+    except OSError:
+        pass  # 計測結果を残せなくても、次回また計測するだけ
+    return params
+
+
+def open_store(path: Path, policy: KdfPolicy | None = None, record_factory: Callable[[dict], Any] | None = None):
+    """
+    パスの拡張子で保存先の実装を選ぶ（既定はファイル1つ＋ジャーナルの JournalStore）。
+    どちらも次の形で使う:
+        exists() / read() / open(raw, master_password, load_items=True) -> payload
+        commit(payload, ops) / pull() -> payload | None / adopt(session) / session / path / journal_path
+    commit は、前回読んでからほかのプロセスが保存していれば、その変更と record 単位で合わせてから書く
+    （merge_payload）。pull はその結果や、ほかのプロセスの保存を変わった分だけ読んで返す。
+    """
+    if path.suffix in SQLITE_SUFFIXES:
+        from sqlstore import SqliteStore
+
+        return SqliteStore(path, policy=policy, record_factory=record_factory)
+    return JournalStore(path, policy=policy, record_factory=record_factory)
+
+
+def split_journal(journal: bytes, version: int = CONTAINER_VERSION) -> tuple[list[bytes], bool]:
+    """
+    ジャーナルをレコード単位に分ける。戻り値の2つ目は「末尾が書き込み途中か」。
+    v1は1行1トークン、v2は長さつきのバイナリレコード。
+    """
+    records = []
+    if version == 1:
+        for line in journal.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                return records, True
+            records.append(line.strip())
+        return records, False
+
+    pos = 0
+    while pos < len(journal):
+        if pos + _FRAME.size > len(journal):
+            return records, True
+        (size,) = _FRAME.unpack_from(journal, pos)
+        end = pos + _FRAME.size + size
+        if end > len(journal):
+            return records, True
+        records.append(journal[pos + _FRAME.size:end])
+        pos = end
+    return records, False
+
+
+class JournalStore:
+    """
+    ベーススナップショット＋追記専用ジャーナルによる保存（v2 storage mode）。
+
+    - スナップショット: payload 全体をチャンク単位で暗号化した data/locka.enc
+      （前回から変わっていないチャンクは暗号文を使い回す）
+    - ジャーナル: 変更1件ごとに個別に暗号化・認証したレコードを1行ずつ追記
+      各レコードはスナップショットの世代(gen)と通し番号(seq)を持ち、
+      別世代のレコードや欠落・並べ替えは読み込み時に弾く
+    - ジャーナルが閾値を超えたら新しい世代のスナップショットへまとめる（compaction）
+    - 解錠時にKDFのパラメータがポリシーから外れていないか確かめ、外れていたら次回保存時に鍵を包み直す（rekey）
+    - 読むときは共有、書くときは排他の助言ロック（FileLock）をかけ、ほかのプロセスと同時に書かない。
+      ファイルの (inode, サイズ, 更新時刻) が前回と違えば、ほかのプロセスが書いたとみなして読み直す。
+      ジャーナルが伸びただけなら続きだけ、スナップショットが変わっていれば暗号文の変わったチャンクだけ復号する
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        policy: KdfPolicy | None = None,
+        max_bytes: int = JOURNAL_MAX_BYTES,
+        max_ratio: float = JOURNAL_MAX_RATIO,
+        record_factory: Callable[[dict], Any] | None = None,
+    ):
+        self.path = path
+        self.journal_path = path.with_suffix(".journal")
+        self.kdf_cache_path = path.with_name("kdf.json")
+        self.policy = policy or KdfPolicy()
+        self.max_bytes = max_bytes
+        self.max_ratio = max_ratio
+        self.record_factory = record_factory  # 読み込んだ item（dict）を変換する関数（Record.from_dict など）
+
+        self.session: SessionKey | None = None
+        self.chunks = ChunkCache()
+        self.generation = 0  # スナップショットの世代
+        self._seq = 0  # 次に追記するレコードの通し番号
+        self._snapshot_size = 0
+        self._journal_size = 0
+        self._needs_compaction = False
+
+        self.file_lock = FileLock(path.with_suffix(".lock"))
+        self._lock = threading.Lock()  # 書き込みスレッド（commit）と UI スレッド（pull）で状態を共有する
+        self._stamp: tuple | None = None  # 前回読み書きしたときのファイルの印（_file_stamp）
+        self._disk: dict | None = None  # ファイル上の内容（前回読み書きした時点）
+        self._base: dict | None = None  # 呼び出し側が知っている内容（次の ops はこれに対する変更。_disk と別物なら合わせる）
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def read(self) -> tuple[bytes, bytes] | None:
+        """スナップショットとジャーナルを読み込む（I/Oのみ。なければNone）"""
+        if not self.path.exists():
+            return None
+        with self.file_lock.hold(shared=True):
+            # 読んでいる途中にほかのプロセスがまとめ直すと、スナップショットとジャーナルが食い違う
+            self._stamp = self._file_stamp()
+            return self._read_files()
+
+    def _file_stamp(self) -> tuple:
+        return file_stamp(self.path), file_stamp(self.journal_path)
+
+    def _read_files(self) -> tuple[bytes, bytes] | None:
+        try:
+            snapshot = self.path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            journal = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            journal = b""
+        return snapshot, journal
+
+    def open(self, raw: tuple[bytes, bytes] | None, master_password: str, load_items: bool = True) -> Any:
+        """
+        read() の結果を復号し、スナップショットにジャーナルを再生した payload を返す。
+        新規（raw=None）の場合は鍵だけ作って None を返す。KDFはどちらも1回だけ。
+        ファイル1つの形式は全体を復号しないと読めないので、load_items は無視して常に items を読む。
+        """
+        with METRICS.span("unlock"):
+            payload = self._open(raw, master_password)
+        if isinstance(payload, dict):
+            self._disk = self._base = payload
+        return payload
+
+    def _open(self, raw: tuple[bytes, bytes] | None, master_password: str) -> Any:
+        if raw is None:
+            params = resolve_kdf_params(self.policy, self.kdf_cache_path)
+            self.session = SessionKey.create(master_password, params=params)
+            self._needs_compaction = True
+            return None
+
+        snapshot, journal = raw
+        payload, self.session = unlock_items(
+            snapshot, master_password=master_password, cache=self.chunks, factory=self.record_factory
+        )
+        if isinstance(payload, dict):
+            payload = self._replay(snapshot, journal, payload)
+        else:
+            # 旧形式（listだけ保存してた場合）は次の保存でスナップショットを作り直す
+            self._needs_compaction = True
+        self._apply_policy(master_password, legacy=container_version(snapshot) < 4)
+        return payload
+
+    def _replay(self, snapshot: bytes, journal: bytes, payload: dict) -> dict:
+        """スナップショットの payload にジャーナルを再生する（世代・通し番号もファイルに合わせる）"""
+        version = container_version(snapshot)
+        self._needs_compaction = False
+        if version != CONTAINER_VERSION:
+            # v1ファイルは次の保存でv2へ移行する（ジャーナルもv2で作り直す）
+            self._needs_compaction = True
+
+        self.generation = int(payload.get("generation", 0))
+        self._snapshot_size = len(snapshot)
+        self._seq = 0
+        self._journal_size = 0
+
+        payload.setdefault("items", [])
+        records, torn = split_journal(journal, version)
+        if torn:
+            # 書き込み途中で落ちた末尾レコード。続けて追記しないよう次回はまとめ直す
+            self._needs_compaction = True
+        for token in records:
+            try:
+                record = open_record(token, self.session, version)
+            except ValueError:
+                # 壊れたレコード以降は信用しない。次の保存でスナップショットを作り直す
+                self._needs_compaction = True
+                break
+            if record.get("gen") != self.generation:
+                # 以前の世代（compaction前）のジャーナル
+                self._needs_compaction = True
+                break
+            if record.get("seq") != self._seq:
+                self._needs_compaction = True
+                break
+            if "item" in record and self.record_factory is not None:
+                record["item"] = self.record_factory(record["item"])
+            apply_op(payload, record)
+            self._seq += 1
+            self._journal_size += _FRAME.size + len(token)
+
+        return payload
+
+    def adopt(self, session: SessionKey):
+        """
+        別の保存先で解錠済みの鍵をそのまま使う（保存形式の変換用）。
+        データ鍵が同じなので、封印済みのパスワードは暗号化し直さなくてよい。次の保存は全体保存。
+        """
+        self.session = session
+        self.chunks = ChunkCache()
+        self._needs_compaction = True
+        self._disk = self._base = None
+
+    def commit(self, payload: dict, ops: list[dict] | None):
+        """
+        変更を保存する。ops があればジャーナルへ追記し、
+        ops=None（全体保存）や閾値超えのときはスナップショットを書き直す。
+        前回読んでからほかのプロセスが保存していれば、record 単位で合わせた内容を書く。
+        """
+        with METRICS.span("save"), self._lock, self.file_lock.hold():
+            try:
+                written, ops = self._rebase(payload, ops)
+                if ops is None or self._needs_compaction or self._over_threshold():
+                    self.compact(written)
+                elif ops:
+                    self._append(ops)
+            except BaseException:
+                # どこまで書けたか分からない。失敗した操作を抜かしたまま位置指定の操作を追記しないよう、
+                # 次回はスナップショットから書き直す
+                self._needs_compaction = True
+                raise
+            self._stamp = self._file_stamp()
+            if isinstance(payload, dict):
+                self._disk, self._base = written, payload
+
+    def pull(self) -> dict | None:
+        """
+        ほかのプロセスが保存した内容（commit で合わせた内容を含む）を返す。前回から変わっていなければ None。
+        呼び出し側は未保存の変更がないときだけ呼び、返った payload を自分の内容にすること。
+        """
+        with self._lock:
+            if self._base is None:
+                return None
+            if self._stamp != self._file_stamp():
+                with self.file_lock.hold(shared=True):
+                    self._pull_disk()
+            elif self._base is self._disk:
+                return None
+            self._base = self._disk
+            return self._disk
+
+    def _rebase(self, payload: Any, ops: list[dict] | None) -> tuple[Any, list[dict] | None]:
+        """
+        書く内容と操作を返す。ほかのプロセスが先に保存していれば、ファイル上の内容と record 単位で合わせ、
+        ファイル上の内容からの操作に作り直す（排他ロックを持って呼ぶ）。
+        """
+        if self._base is None or not isinstance(payload, dict):
+            return payload, ops
+        if self._stamp != self._file_stamp():
+            self._pull_disk()
+        elif self._base is self._disk:
+            return payload, ops
+        merged = merge_payload(self._base, payload, self._disk)
+        return merged, None if ops is None else merge_ops(self._disk, merged)
+
+    def _pull_disk(self):
+        """
+        ファイル上の最新の内容を self._disk に読む（ロックを持って呼ぶ）。
+        スナップショットが前回のままならジャーナルの続きだけを、変わっていれば変わったチャンクだけを復号する。
+        """
+        with METRICS.span("reload"):
+            if self._stamp is not None and file_stamp(self.path) == self._stamp[0] and not self._needs_compaction:
+                ops = self._read_tail()
+                if ops is not None:
+                    payload = {**self._disk, "items": list(self._disk["items"])}
+                    for op in ops:
+                        apply_op(payload, op)
+                    self._disk = payload
+                    self._stamp = self._file_stamp()
+                    return
+            raw = self._read_files()
+            if raw is None:
+                raise ValueError("保管庫のファイルが見つかりません。")
+            snapshot, journal = raw
+            payload = reopen_items(snapshot, self.session, cache=self.chunks, factory=self.record_factory)
+            self._disk = self._replay(snapshot, journal, payload)
+            self._stamp = self._file_stamp()
+
+    def _read_tail(self) -> list[dict] | None:
+        """前回読んだところから先のジャーナルだけを読んで操作の list にする（続きとして読めなければ None）"""
+        try:
+            with self.journal_path.open("rb") as f:
+                if os.fstat(f.fileno()).st_size < self._journal_size:
+                    return None
+                f.seek(self._journal_size)
+                tail = f.read()
+        except FileNotFoundError:
+            return None
+        tokens, torn = split_journal(tail)
+        if torn:
+            return None
+        ops = []
+        for i, token in enumerate(tokens):
+            try:
+                record = open_record(token, self.session)
+            except ValueError:
+                return None
+            if record.get("gen") != self.generation or record.get("seq") != self._seq + i:
+                return None
+            if "item" in record and self.record_factory is not None:
+                record["item"] = self.record_factory(record["item"])
+            ops.append(record)
+        self._seq += len(tokens)
+        self._journal_size += len(tail)
+        return ops
+
+    def compact(self, payload: dict):
+        """
+        新しい世代のスナップショットを書き、ジャーナルを空にする。
+        書いた内容をファイル上の内容として覚える（直接呼んでも、次の保存でファイルを読み直して合わせない）。
+        """
+        generation = self.generation + 1
+        blob = encrypt_items(
+            {**payload, "generation": generation},
+            self.session,
+            generation=generation,
+            cache=self.chunks,
+        )
+        with METRICS.span("write"):
+            write_atomic(self.path, blob)
+        # ここで落ちても、残ったジャーナルは旧世代なので読み込み時に無視される
+        self.generation = generation
+        self._snapshot_size = len(blob)
+        self._seq = 0
+        self._journal_size = 0
+        try:
+            write_atomic(self.journal_path, b"")
+            self._needs_compaction = False
+        except OSError:
+            # スナップショットは書けている。古いジャーナルには追記せず、次回もまとめ直す
+            self._needs_compaction = True
+        self._stamp = self._file_stamp()
+        if isinstance(payload, dict):
+            self._disk = self._base = payload
+
+    def _apply_policy(self, master_password: str, legacy: bool = False):
+        """
+        解錠した直後に、KDFのパラメータがこのマシンのポリシーどおりか確かめる。
+        外れていれば（または旧形式の鍵なら）新しいsalt・パラメータで kek を導出し直し、
+        次の保存でデータ鍵を包み直したスナップショットを書く。チャンクは暗号化し直さない。
+        マスターパスワードはここでだけ使い、保存先には残さない（読むだけのセッションでも持ち続けない）。
+        """
+        desired = resolve_kdf_params(self.policy, self.kdf_cache_path)
+        if legacy or not self.policy.accepts(self.session.params, desired):
+            self.session = self.session.rekey(master_password, params=desired)
+            self._needs_compaction = True
+
+    def _over_threshold(self) -> bool:
+        return (
+            self._journal_size >= self.max_bytes
+            or self._journal_size >= self._snapshot_size * self.max_ratio
+        )
+
+    def _append(self, ops: list[dict]):
+        frames = []
+        for i, op in enumerate(ops):
+            record = {**op, "gen": self.generation, "seq": self._seq + i}
+            sealed = seal_record(record, self.session)
+            frames.append(_FRAME.pack(len(sealed)) + sealed)
+        data = b"".join(frames)
+
+        with METRICS.span("write"), self.journal_path.open("ab") as f:
+            start = f.tell()
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                # 中途半端な追記は取り消す。消せなければ次回はスナップショットから作り直す
+                self._needs_compaction = True
+                f.truncate(start)
+                raise
+
+        self._seq += len(ops)
+        self._journal_size += len(data)
+
+
+class SaveWriter:
+    """
+    保存専用の書き込みスレッド。
+    変更ごとに世代番号を進め（dirtyフラグ）、一定時間(debounce)変更が
+    途切れたところで最新の状態と、それまでに溜まった操作(ops)をまとめて1回書き込む。
+    失敗は errors キューに積み、UIスレッド側で拾って通知する。
+    最後に書き込めた payload は committed に残るので、失敗時はそこへ戻せる。
+    """
+
+    def __init__(self, write: Callable[[Any, list | None], None], committed: Any = None, debounce: float = 0.3):
+        self._write = write
+        self.debounce = debounce
+        self._committed = committed
+        self.errors: queue.Queue[tuple[str, Any, Exception]] = queue.Queue()
+
+        self._cond = threading.Condition()
+        self._pending: Any = None
+        self._ops: list | None = []  # None なら全体保存が必要
+        self._label = ""
+        self._generation = 0  # 受け付けた変更の世代
+        self._written = 0  # 書き込みを終えた世代（失敗も含む）
+        self._last_submit = 0.0
+        self._flush_requested = False
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="locka-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def committed(self) -> Any:
+        """最後に保存に成功した payload"""
+        with self._cond:
+            return self._committed
+
+    @property
+    def dirty(self) -> bool:
+        with self._cond:
+            return self._written < self._generation
+
+    def submit(self, payload: Any, label: str = "", ops: list | None = None) -> int:
+        """
+        保存したい最新状態と、その変更内容(ops)を渡す。書き込みは後でまとめて行われる。
+        ops を省略すると全体保存になる。
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SaveWriter は既に停止しています。")
+            self._generation += 1
+            self._pending = payload
+            if ops is None or self._ops is None:
+                self._ops = None
+            else:
+                self._ops.extend(ops)
+            self._label = label
+            self._last_submit = time.monotonic()
+            self._cond.notify_all()
+            return self._generation
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """debounceを待たずに書き込ませ、完了まで待つ（ロック時・終了時用）"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._written >= self._generation, timeout)
+
+    def close(self, timeout: float | None = None) -> bool:
+        """未保存分を書き切ってからスレッドを止める"""
+        done = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return done
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._written < self._generation:
+                        if self._flush_requested or self._closed:
+                            break
+                        remaining = self._last_submit + self.debounce - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    elif self._closed:
+                        return
+                    else:
+                        self._flush_requested = False
+                        self._cond.wait()
+
+                payload, ops, label, generation = self._pending, self._ops, self._label, self._generation
+                self._pending = None
+                self._ops = []
+
+            try:
+                self._write(payload, ops)
+                ok = True
+            except Exception as e:
+                self.errors.put((label, payload, e))
+                ok = False
+
+            with self._cond:
+                if ok:
+                    self._committed = payload
+                else:
+                    # 書けなかった操作は捨てたので、次はスナップショットごと書く
+                    # （後の操作は位置指定なので、抜けたまま追記するとファイルの内容がずれる）
+                    self._ops = None
+                self._written = generation
+                self._cond.notify_all()
@@ -0,0 +1,28 @@
+"""
+pytest の共通の道具。KDF は最小の強さに固定する（計測・調整をしないので速い）。
+
+    python -m pytest -q
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # リポジトリ直下のモジュールを読む
+
+from bench import bench_policy  # noqa: E402
+from helpers import PASSWORD  # noqa: E402
+from vault import Vault  # noqa: E402
+
+
+@pytest.fixture
+def open_vault(tmp_path):
+    """tmp_path の下の保管庫を開く（なければ作る）。拡張子で保存形式が決まる（.enc / .db）"""
+    def open_(name: str = "locka.enc", password: str = PASSWORD) -> Vault:
+        path = tmp_path / name
+        vault = Vault(path, policy=bench_policy(path))
+        vault.unlock(password)
+        return vault
+    return open_
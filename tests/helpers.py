@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from vault import Vault
+
+
+PASSWORD = "test-master"  # テスト用の保管庫のマスターパスワード
+
+
+def contents(vault: Vault) -> list[dict]:
+    """比べるための中身（保存順の record の dict）"""
+    return [dict(r.items()) for r in vault.items]
+
+
+def fill(vault: Vault, count: int):
+    """site0, site1, ... を count 件足して保存する"""
+    for n in range(count):
+        vault.add(f"site{n}", f"user{n}", f"pw-{n}", ["仕事"] if n % 2 else [])
+    vault.save()
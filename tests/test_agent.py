@@ -0,0 +1,86 @@
+"""エージェント（agent.py）の待ち受け・無操作での終了・本人以外の接続の拒否"""
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import agent
+from helpers import fill
+
+pytestmark = pytest.mark.skipif(not agent.available(), reason="Unix ドメインソケットの SO_PEERCRED がない")
+
+
+@pytest.fixture
+def running(open_vault, tmp_path):
+    """別スレッドで待ち受けるエージェント（テストの終わりに止める）"""
+    vault = open_vault()
+    fill(vault, 3)
+    server = agent.Agent(vault, tmp_path / "run" / "agent.sock", idle_timeout=60.0)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(),), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5.0
+    while not server.socket_path.exists():
+        assert time.monotonic() < deadline, "エージェントが待ち受けを始めない"
+        time.sleep(0.01)
+    yield server
+    if server.socket_path.exists():
+        agent.request({"op": "stop"}, server.socket_path)  # stop() は別スレッドから呼べないので、要求で止める
+    thread.join(5.0)
+
+
+def test_request_round_trip(running):
+    path = running.socket_path
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert path.parent.stat().st_mode & 0o777 == 0o700
+
+    assert agent.request({"op": "ping"}, path)["items"] == 3
+    result = agent.request({"op": "get", "query": "site1"}, path)
+    assert result["value"] == "pw-1"
+    assert [m["site"] for m in result["matches"]] == ["site1"]
+    assert [r["site"] for r in agent.request({"op": "search", "keyword": "site", "tags": "仕事"}, path)] == ["site1"]
+    with pytest.raises(ValueError, match="未知の要求"):
+        agent.request({"op": "nope"}, path)
+    with pytest.raises(OSError, match="異なります"):
+        agent.request({"op": "ping", "vault": str(path.parent / "other.enc")}, path)
+
+    assert agent.request({"op": "stop"}, path) is None
+    deadline = time.monotonic() + 5.0
+    while path.exists():
+        assert time.monotonic() < deadline, "stop で終了しない"
+        time.sleep(0.01)
+    assert running.vault.secrets is None  # 終了時に鍵を捨てる
+
+
+def test_other_users_are_refused(running, monkeypatch):
+    # 相手のユーザーIDが本人と違えば、何も読まずに断って切る
+    monkeypatch.setattr(agent, "peer_uid", lambda sock: -1)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5.0)
+        sock.connect(str(running.socket_path))
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    response = json.loads(data)
+    assert response["ok"] is False and "result" not in response
+
+    # クライアントの側も、持ち主が本人でないソケットには何も送らない
+    with pytest.raises(OSError, match="本人ではありません"):
+        agent.request({"op": "ping"}, running.socket_path)
+
+
+def test_idle_agent_locks_and_exits(open_vault, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, "AGENT_IDLE_CHECK_SEC", 0.01)
+    vault = open_vault()
+    fill(vault, 1)
+    server = agent.Agent(vault, tmp_path / "run" / "agent.sock", idle_timeout=0.05)
+
+    started = time.monotonic()
+    asyncio.run(asyncio.wait_for(server.serve(), timeout=5.0))
+    assert time.monotonic() - started >= 0.05
+    assert not server.socket_path.exists()
+    assert vault.secrets is None and vault.store.session is None
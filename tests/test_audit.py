@@ -0,0 +1,34 @@
+"""使い回し・強さの監査（AuditIndex）"""
+from __future__ import annotations
+
+from helpers import fill
+
+
+def test_reuse_groups_follow_edits(open_vault):
+    vault = open_vault()
+    fill(vault, 4)
+    a, b, c, d = vault.items
+    vault.update(b["uid"], pw="pw-0")
+    assert [[r["uid"] for r in g] for g in vault.audit_index.reuse_groups()] == [[a["uid"], b["uid"]]]
+
+    vault.update(c["uid"], pw="pw-0")
+    vault.delete(a["uid"])
+    groups = vault.audit_index.reuse_groups()
+    assert [sorted(r["uid"] for r in g) for g in groups] == [sorted([b["uid"], c["uid"]])]
+    assert vault.audit_index.reuse_count(vault.get(d["uid"])) == 1
+
+
+def test_unchanged_passwords_are_not_reopened(open_vault, monkeypatch):
+    vault = open_vault()
+    fill(vault, 5)
+    index = vault.audit_index
+    opened = []
+    reveal = index._reveal
+    monkeypatch.setattr(index, "_reveal", lambda r: opened.append(r["uid"]) or reveal(r))
+
+    uid = vault.items[1]["uid"]
+    vault.update(uid, site="renamed", tags=["x"])
+    assert opened == []
+    vault.update(uid, pw="Str0ng-and-l0ng#passphrase")
+    assert opened == [uid]
+    assert uid not in [r["uid"] for r in index.weak()]
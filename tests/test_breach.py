@@ -0,0 +1,107 @@
+"""流出パスワードの一覧の取り込み（import_corpus）と照合（BreachIndex）"""
+from __future__ import annotations
+
+import hashlib
+import random
+
+import pytest
+
+import breach
+from breach import BreachIndex, import_corpus, password_digest
+from helpers import fill
+
+
+def write_hashes(path, digests):
+    """Pwned Passwords と同じ "SHA1の16進:件数" の行で書く（順序はばらばら）"""
+    lines = [f"{d.hex().upper()}:{n + 1}" for n, d in enumerate(digests)]
+    random.Random(0).shuffle(lines)
+    path.write_text("\n".join(["見出し行", *lines, ""]), encoding="utf-8")
+
+
+def digest(prefix: int, rest: int) -> bytes:
+    """先頭2バイトが prefix、残りが rest の SHA-1 の形のバイト列"""
+    return prefix.to_bytes(2, "big") + rest.to_bytes(18, "big")
+
+
+def test_plain_corpus_hits_and_misses(tmp_path):
+    source = tmp_path / "plain.txt"
+    source.write_bytes(b"hunter2\r\npassword\n\npassword\n123456\n")
+    dest = tmp_path / "breach.idx"
+    assert import_corpus(source, dest, plain=True, run_entries=2) == 3  # 重複は1つにまとめる
+
+    with BreachIndex(dest) as index:
+        assert len(index) == 3
+        assert index.contains("hunter2") and index.contains("password") and index.contains("123456")
+        assert not index.contains("hunter3") and not index.contains("")
+        assert index.check_many([password_digest(p) for p in ("x", "password", "y", "hunter2")]) == [False, True, False, True]
+
+
+def test_bucket_boundaries(tmp_path):
+    top = (1 << 144) - 1  # 残り 18 バイトがすべて 0xff
+    present = [
+        digest(0x0000, 0),  # 最初の区間の先頭
+        digest(0x1234, top),  # 区間の末尾
+        digest(0x1235, 0),  # 次の区間の先頭
+        digest(0x1235, 1 << 100),
+        digest(0xFFFF, top),  # 最後の区間の末尾
+    ]
+    source = tmp_path / "pwned.txt"
+    write_hashes(source, present)
+    dest = tmp_path / "breach.idx"
+    assert import_corpus(source, dest) == len(present)
+
+    width = breach.PREFIX_BYTES
+    step = 1 << (8 * (20 - width))  # 照合に使う先頭バイト列が1つずれる差
+    absent = [
+        digest(0x0000, step),
+        digest(0x1234, top - step),
+        digest(0x1234, 0),
+        digest(0x1235, step),
+        digest(0x1236, 0),  # 空の区間
+        digest(0xFFFF, top - step),
+    ]
+    with BreachIndex(dest) as index:
+        assert [index.contains_digest(d) for d in present] == [True] * len(present)
+        assert [index.contains_digest(d) for d in absent] == [False] * len(absent)
+        assert index.contains_digest(digest(0x1234, top - 1))  # 残さないバイトの違いは同じものとみなす
+
+
+def test_dense_bucket_around_the_estimate(tmp_path):
+    # 区間の中で偏って並んでいても（見積もりが外れても）見つかる
+    rng = random.Random(1)
+    present = sorted({digest(0x4242, rng.getrandbits(24) << 104) for _ in range(3000)})  # 区間の先頭の隅に固まる
+    present += [digest(0x4241, rng.getrandbits(144)) for _ in range(50)]
+    source = tmp_path / "pwned.txt"
+    write_hashes(source, present)
+    dest = tmp_path / "breach.idx"
+    import_corpus(source, dest, run_entries=700)
+
+    step = 1 << (8 * (20 - breach.PREFIX_BYTES))
+    taken = {d[:breach.PREFIX_BYTES] for d in present}
+    absent = [d for p in present if (d := (int.from_bytes(p, "big") + step).to_bytes(20, "big"))[:breach.PREFIX_BYTES] not in taken]
+    with BreachIndex(dest) as index:
+        assert all(index.check_many(present))
+        assert not any(index.check_many(absent))
+
+
+def test_broken_index_is_rejected(tmp_path):
+    source = tmp_path / "plain.txt"
+    source.write_bytes(b"hunter2\n")
+    dest = tmp_path / "breach.idx"
+    import_corpus(source, dest, plain=True)
+    dest.write_bytes(dest.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="切れています"):
+        BreachIndex(dest)
+    with pytest.raises(ValueError):
+        import_corpus(source, dest, width=2)
+    assert BreachIndex.open_if_exists(tmp_path / "none.idx") is None
+
+
+def test_audit_reports_breached_entries(open_vault, tmp_path):
+    vault = open_vault()
+    fill(vault, 4)
+    source = tmp_path / "pwned.txt"
+    write_hashes(source, [hashlib.sha1(b"pw-2").digest(), hashlib.sha1(b"pw-0").digest()])
+    import_corpus(source, tmp_path / "breach.idx")
+    with BreachIndex(tmp_path / "breach.idx") as index:
+        assert [r["site"] for r in breach.audit(vault, index)] == ["site0", "site2"]
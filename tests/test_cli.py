@@ -0,0 +1,19 @@
+"""コマンドライン版（locka.py）"""
+from __future__ import annotations
+
+import os
+import socket
+
+import locka
+from helpers import PASSWORD, fill
+
+
+def test_get_without_unix_sockets(open_vault, tmp_path, monkeypatch, capsys):
+    # Windows のように Unix ドメインソケットもユーザーIDもない環境では、エージェントに聞かずに自分で解錠する
+    fill(open_vault(), 3)
+    monkeypatch.delattr(socket, "AF_UNIX", raising=False)
+    monkeypatch.delattr(os, "getuid", raising=False)
+    monkeypatch.setattr(locka, "_ask", lambda prompt: PASSWORD)
+
+    assert locka.main(["--vault", str(tmp_path / "locka.enc"), "get", "site1"]) == 0
+    assert capsys.readouterr().out.strip() == "pw-1"
@@ -0,0 +1,176 @@
+"""暗号化コンテナ（.enc）の移行・パスワード違い・改ざん"""
+from __future__ import annotations
+
+import base64
+import dataclasses
+import json
+import os
+
+import pytest
+
+from helpers import PASSWORD, contents, fill
+from security import (
+    CONTAINER_VERSION,
+    DEFAULT_COMPRESSION,
+    MIN_PBKDF2_ITERS,
+    ChunkCache,
+    KdfParams,
+    KdfPolicy,
+    SessionKey,
+    container_version,
+    encrypt_items,
+    reopen_items,
+)
+from vault import Vault
+
+
+def write_v1(path, payload: dict, password: str = PASSWORD):
+    """旧形式（JSON + Fernet。パスワードは平文のまま items に入っている）のファイルを書く"""
+    salt = os.urandom(16)
+    session = SessionKey.derive(password, salt=salt, params=KdfParams(iters=MIN_PBKDF2_ITERS))
+    token = session._fernet.encrypt(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    meta = {"salt_b64": base64.b64encode(salt).decode("ascii"), "iters": MIN_PBKDF2_ITERS, "token": token.decode("ascii")}
+    path.write_text(json.dumps(meta), encoding="utf-8")
+
+
+def test_v1_migrates_to_current_container(open_vault, tmp_path):
+    path = tmp_path / "locka.enc"
+    write_v1(path, {
+        "items": [
+            {"site": "GitHub", "id": "me@example.com", "pw": "old-pw", "tags": ["仕事"]},
+            {"site": "Mail", "id": "me", "pw": "mail-pw"},
+        ],
+        "settings": {"show_pw": False},
+    })
+
+    vault = open_vault()
+    assert [r["site"] for r in vault.items] == ["GitHub", "Mail"]
+    assert all(r["uid"] and r["pw_sealed"] for r in vault.items)  # 補完・封印済み
+    vault.save()
+    assert container_version(path.read_bytes()) == CONTAINER_VERSION
+
+    reopened = open_vault()
+    assert contents(reopened) == contents(vault)
+    assert reopened.reveal(reopened.items[0]) == "old-pw"
+    assert list(reopened.items[0]["tags"]) == ["仕事"]
+    assert reopened.settings["show_pw"] is False
+
+
+@pytest.mark.parametrize("name", ["locka.enc", "locka.db"])
+def test_wrong_password_is_rejected(open_vault, name):
+    fill(open_vault(name), 3)
+    with pytest.raises(ValueError):
+        open_vault(name, password="wrong-password")
+    assert len(open_vault(name).items) == 3
+
+
+def test_wrong_password_is_rejected_for_v1(open_vault, tmp_path):
+    write_v1(tmp_path / "locka.enc", {"items": [{"site": "a", "id": "b", "pw": "c"}]})
+    with pytest.raises(ValueError):
+        open_vault(password="wrong-password")
+
+
+def test_tampered_chunk_is_rejected(open_vault, tmp_path):
+    fill(open_vault(), 3)
+    path = tmp_path / "locka.enc"
+    blob = bytearray(path.read_bytes())
+    blob[-1] ^= 1  # 最後のチャンクのタグ
+    path.write_bytes(bytes(blob))
+    with pytest.raises(ValueError):
+        open_vault()
+
+
+@pytest.fixture
+def sealed_chunks(monkeypatch):
+    """暗号化し直したチャンク（_seal_chunk に渡された records）"""
+    import security
+
+    sealed = []
+    seal_chunk = security._seal_chunk
+
+    def counting(records, *args):
+        sealed.append(records)
+        return seal_chunk(records, *args)
+
+    monkeypatch.setattr(security, "_seal_chunk", counting)
+    return sealed
+
+
+@pytest.mark.parametrize("edit", ["delete", "insert", "update"])
+def test_single_edit_reseals_one_chunk(sealed_chunks, edit):
+    session = SessionKey.create(PASSWORD, KdfParams(iters=MIN_PBKDF2_ITERS))
+    cache = ChunkCache()
+    items = [{"uid": f"u{n}", "site": f"site{n}"} for n in range(100)]
+    encrypt_items({"items": items}, session, chunk_records=10, cache=cache)
+    assert len(sealed_chunks) == 10
+
+    sealed_chunks.clear()
+    if edit == "delete":
+        del items[3]  # 前のほうを消しても、後ろのチャンクの境界はずれない
+    elif edit == "insert":
+        items.insert(3, {"uid": "new", "site": "new"})
+    else:
+        items[3] = {**items[3], "site": "edited"}
+    blob = encrypt_items({"items": items}, session, chunk_records=10, cache=cache)
+    assert len(sealed_chunks) == 1
+    assert items[3] in sealed_chunks[0]
+    assert reopen_items(blob, session)["items"] == items
+
+
+def test_chunks_stay_bounded(sealed_chunks):
+    session = SessionKey.create(PASSWORD, KdfParams(iters=MIN_PBKDF2_ITERS))
+    cache = ChunkCache()
+    items = [{"uid": f"u{n}"} for n in range(30)]
+    encrypt_items({"items": items}, session, chunk_records=10, cache=cache)
+
+    del items[11:19]  # 消して小さくなった切れ端（2件）は前のチャンクとまとめる
+    items += [{"uid": f"v{n}"} for n in range(50)]  # 追記が続いても、大きすぎるチャンクは分ける
+    blob = encrypt_items({"items": items}, session, chunk_records=10, cache=cache)
+    sizes = [len(records) for records in cache.layout(items, 10, session, DEFAULT_COMPRESSION)]
+    assert sizes == [12, 10, 10, 10, 10, 10, 10]
+    assert reopen_items(blob, session)["items"] == items
+
+
+def test_sealed_password_is_bound_to_its_record(open_vault):
+    vault = open_vault()
+    fill(vault, 2)
+    first, second = vault.items
+    moved = second.replace(pw_sealed=first["pw_sealed"])  # 別の record へ暗号文を移す
+    with pytest.raises(ValueError):
+        vault.reveal(moved)
+    assert vault.reveal(first) == "pw-0"
+
+
+def test_unbound_passwords_are_resealed_on_migration(open_vault, tmp_path):
+    """schema 2 以前の（uid に結びつけていない）封印は、読み込み時に uid に結びつけて封印し直す"""
+    session = SessionKey.create(PASSWORD, KdfParams(iters=MIN_PBKDF2_ITERS))
+    nonce = os.urandom(12)
+    legacy = base64.b64encode(nonce + session._secret_aead.encrypt(nonce, b"old-pw", b"LCKA/secret")).decode("ascii")
+    item = {"uid": "u1", "site": "GitHub", "id": "me", "pw_sealed": legacy, "tags": [], "created_at": 1.0, "updated_at": 1.0}
+    (tmp_path / "locka.enc").write_bytes(encrypt_items({"items": [item], "settings": {}, "schema": 2}, session))
+
+    vault = open_vault()
+    assert vault.items[0]["pw_sealed"] != legacy
+    assert vault.reveal(vault.items[0]) == "old-pw"
+    vault.save()
+    reopened = open_vault()
+    assert reopened.reveal(reopened.items[0]) == "old-pw"
+
+
+@pytest.mark.parametrize("name", ["locka.enc", "locka.db"])
+def test_policy_rekey_does_not_keep_the_password(open_vault, tmp_path, name):
+    fill(open_vault(name), 3)
+    stronger = KdfParams(iters=MIN_PBKDF2_ITERS * 3)
+    cache = {"kdf": stronger.kdf, "target_ms": KdfPolicy().target_ms, "params": dataclasses.asdict(stronger)}
+    (tmp_path / "kdf.json").write_text(json.dumps(cache), encoding="utf-8")
+
+    vault = Vault(tmp_path / name, policy=KdfPolicy(kdf=stronger.kdf))
+    vault.unlock(PASSWORD)
+    assert vault.store.session.params == stronger  # 解錠した時点で包み直す鍵を作っておく
+    assert PASSWORD not in vars(vault.store).values()  # 読むだけのセッションでもパスワードは残らない
+    vault.save()
+
+    reopened = Vault(tmp_path / name, policy=KdfPolicy(kdf=stronger.kdf))
+    reopened.unlock(PASSWORD)
+    assert reopened.store.session.params == stronger
+    assert contents(reopened) == contents(vault)
@@ -0,0 +1,61 @@
+"""タグの索引（ビット集合）とタグ式"""
+from __future__ import annotations
+
+import pytest
+
+from facets import TagIndex, members
+
+
+def item(uid: str, *tags: str) -> dict:
+    return {"uid": uid, "tags": list(tags)}
+
+
+@pytest.fixture
+def index() -> TagIndex:
+    return TagIndex([
+        item("a", "仕事", "SNS"),
+        item("b", "仕事"),
+        item("c", "個人", "SNS"),
+        item("d"),
+    ])
+
+
+def uids(index: TagIndex, mask: int) -> list[str]:
+    return [x["uid"] for x in index.items(mask)]
+
+
+def test_query_expressions(index):
+    assert uids(index, index.query("仕事 AND NOT SNS")) == ["b"]
+    assert uids(index, index.query("仕事 and not SNS")) == ["b"]  # 演算子は大文字・小文字を問わない
+    assert uids(index, index.query("仕事 SNS")) == ["a"]  # 並べただけなら AND
+    assert uids(index, index.query("個人 OR 仕事 AND NOT SNS")) == ["b", "c"]  # AND が OR より先
+    assert uids(index, index.query("NOT NOT 個人")) == ["c"]
+    assert uids(index, index.query("")) == ["a", "b", "c", "d"]
+    assert index.query("ない") == 0
+
+
+@pytest.mark.parametrize("expr", ["AND 仕事", "仕事 OR", "仕事 AND OR 個人", "NOT", "OR"])
+def test_malformed_query_is_rejected(index, expr):
+    with pytest.raises(ValueError):
+        index.query(expr)
+
+
+def test_mask_and_counts_follow_changes(index):
+    assert index.counts() == {"SNS": 2, "仕事": 2, "個人": 1}
+    assert uids(index, index.mask(["仕事", "個人"], mode="or")) == ["a", "b", "c"]
+    assert uids(index, index.mask(exclude=["SNS"])) == ["b", "d"]
+
+    index.replace(item("b", "仕事"), item("b", "個人"))
+    index.remove(item("a", "仕事", "SNS"))
+    index.add(item("e", "仕事"))
+    assert index.counts() == {"SNS": 1, "仕事": 1, "個人": 2}
+    assert uids(index, index.query("個人")) == ["c", "b"]  # 差し替えたものは後ろへ
+    assert uids(index, index.query("NOT 仕事")) == ["c", "d", "b"]
+    assert list(members(index.query("仕事"))) == [5]
+
+
+def test_matcher_keeps_the_callers_order(index):
+    contains = index.matcher(index.query("SNS OR 個人"))
+    rows = [item("c"), item("d"), item("a"), item("x")]  # 索引にない uid は含まれない
+    assert [x["uid"] for x in filter(contains, rows)] == ["c", "a"]
+    assert list(filter(index.matcher(0), rows)) == []
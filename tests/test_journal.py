@@ -0,0 +1,97 @@
+"""ジャーナル（.enc の追記）の読み直しと、書き込みに失敗したあとの保存"""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from helpers import contents, fill
+from storage import SaveWriter
+
+
+def fail_journal_append_once(monkeypatch, store):
+    """次のジャーナルへの追記（open("ab")）を1回だけ失敗させる"""
+    real_open = Path.open
+    armed = [True]
+
+    def open_(self, mode="r", *args, **kwargs):
+        if armed[0] and self == store.journal_path and "a" in mode:
+            armed[0] = False
+            raise OSError("追記できません（テスト）")
+        return real_open(self, mode, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "open", open_)
+
+
+def test_journal_replay(open_vault):
+    vault = open_vault()
+    fill(vault, 10)
+    vault.delete(vault.items[3]["uid"])
+    vault.update(vault.items[5]["uid"], site="EDITED", pw="new")
+    vault.add("added", "me", "pw", [])
+    vault.save()
+    assert vault.store.journal_path.stat().st_size > 0
+
+    reopened = open_vault()
+    assert contents(reopened) == contents(vault)
+    assert reopened.reveal(reopened.items[5]) == "new"
+
+
+def test_torn_journal_tail_is_ignored(open_vault):
+    vault = open_vault()
+    fill(vault, 5)
+    vault.update(vault.items[1]["uid"], site="EDITED")
+    vault.save()
+    expected = contents(vault)
+    with vault.store.journal_path.open("ab") as f:
+        f.write(b"\x40\x00\x00\x00partial")  # 書き込み途中で落ちた末尾
+
+    reopened = open_vault()
+    assert contents(reopened) == expected
+    # 壊れた末尾には追記せず、次の保存でまとめ直す
+    reopened.update(reopened.items[0]["uid"], site="AGAIN")
+    reopened.save()
+    assert contents(open_vault()) == contents(reopened)
+
+
+def test_failed_append_does_not_desync_file(open_vault, monkeypatch):
+    vault = open_vault()
+    fill(vault, 10)
+    fail_journal_append_once(monkeypatch, vault.store)
+    vault.delete(vault.items[2]["uid"])
+    with pytest.raises(OSError):
+        vault.save()
+
+    # 失敗した操作は取り出し済み。次の保存は位置指定の操作を追記せず、全体を書き直す
+    vault.update(vault.items[5]["uid"], site="EDITED")
+    vault.save()
+    reopened = open_vault()
+    assert contents(reopened) == contents(vault)
+    assert "site2" not in [r["site"] for r in reopened.items]
+
+
+def test_save_writer_failure_falls_back_to_snapshot(open_vault):
+    vault = open_vault()
+    fill(vault, 10)
+    calls = []
+
+    def write(payload, ops):
+        calls.append(ops)
+        if len(calls) == 1:
+            raise OSError("書き込めません（テスト）")  # 保存先に渡る前に失敗
+        vault.store.commit(payload, ops)
+
+    writer = SaveWriter(write, committed=vault.payload(), debounce=0)
+    try:
+        vault.delete(vault.items[2]["uid"])
+        writer.submit(vault.payload(), "削除", vault.take_ops())
+        writer.flush()
+        assert not writer.errors.empty()
+
+        vault.update(vault.items[5]["uid"], site="EDITED")
+        writer.submit(vault.payload(), "編集", vault.take_ops())
+        writer.flush()
+    finally:
+        writer.close()
+    assert calls[1] is None  # 失敗のあとは全体保存
+    assert contents(open_vault()) == contents(vault)
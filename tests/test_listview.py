@@ -0,0 +1,143 @@
+"""仮想化したリスト表示（Tk の部品は画面なしで動く代わりのものに差し替える）"""
+from __future__ import annotations
+
+import pytest
+
+import listview
+from listview import OVERSCAN_ROWS, VirtualList
+
+
+VISIBLE_ROWS = 10
+
+
+class FakeListbox:
+    """tk.Listbox のうち VirtualList が使う分だけ（行の出し入れを数える）"""
+
+    def __init__(self, master=None, **options):
+        self.lines: list[str] = []
+        self.selected: list[int] = []
+        self.calls = {"delete": 0, "insert": 0}
+
+    def _index(self, index) -> int:
+        return len(self.lines) if index == listview.tk.END else index
+
+    def delete(self, first, last=None):
+        self.calls["delete"] += 1
+        stop = self._index(first) + 1 if last is None else self._index(last) + (last != listview.tk.END)
+        del self.lines[self._index(first):stop]
+
+    def insert(self, index, *lines):
+        self.calls["insert"] += 1
+        at = self._index(index)
+        self.lines[at:at] = lines
+
+    def selection_clear(self, first, last=None):
+        self.selected = []
+
+    def selection_set(self, index):
+        self.selected = [index]
+
+    def curselection(self):
+        return tuple(self.selected)
+
+    def winfo_height(self) -> int:
+        return 18 * VISIBLE_ROWS  # 行の高さを測れないときの目安（18px）で VISIBLE_ROWS 行
+
+    def bbox(self, index):
+        return None
+
+    def nearest(self, y):
+        return 0
+
+    def grid(self, **options):
+        pass
+
+    def bind(self, *args):
+        pass
+
+    def yview(self, *args):
+        pass
+
+
+class FakeScrollbar:
+    def __init__(self, master=None, **options):
+        self.position = (0.0, 1.0)
+
+    def grid(self, **options):
+        pass
+
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+@pytest.fixture
+def view(monkeypatch) -> VirtualList:
+    monkeypatch.setattr(listview.ttk.Frame, "__init__", lambda self, master=None: None)
+    monkeypatch.setattr(listview.ttk.Frame, "grid_rowconfigure", lambda self, *a, **k: None)
+    monkeypatch.setattr(listview.ttk.Frame, "grid_columnconfigure", lambda self, *a, **k: None)
+    monkeypatch.setattr(listview.tk, "Listbox", FakeListbox)
+    monkeypatch.setattr(listview.ttk, "Scrollbar", FakeScrollbar)
+    return VirtualList(None)
+
+
+def rows_of(count: int) -> list[dict]:
+    return [{"uid": f"u{n}", "site": f"site{n}"} for n in range(count)]
+
+
+class Formatter:
+    """行を文字列にした回数を数える"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, row: dict) -> str:
+        self.calls += 1
+        return row["site"]
+
+
+def test_only_the_window_is_formatted(view):
+    fmt = Formatter()
+    view.set_rows(rows_of(10_000), fmt)
+    window = VISIBLE_ROWS + OVERSCAN_ROWS
+    assert view.listbox.lines == [f"site{n}" for n in range(window)]
+    assert fmt.calls == window
+    assert len(view) == 10_000
+
+    view.see(5_000)  # スクロールした先の窓だけを描く
+    assert view.listbox.lines[0] == f"site{5_000 - VISIBLE_ROWS + 1 - OVERSCAN_ROWS}"
+    assert len(view.listbox.lines) == VISIBLE_ROWS + 2 * OVERSCAN_ROWS
+
+
+def test_set_rows_patches_only_changed_rows(view):
+    fmt = Formatter()
+    rows = rows_of(100)
+    view.set_rows(rows, fmt)
+    fmt.calls = 0
+    view.listbox.calls = {"delete": 0, "insert": 0}
+
+    rows = list(rows)
+    rows[3] = {**rows[3], "site": "edited"}  # 差し替えた行だけ整形し直して入れ替える
+    view.set_rows(rows, fmt)
+    assert fmt.calls == 1
+    assert view.listbox.calls == {"delete": 1, "insert": 1}
+    assert view.listbox.lines[3] == "edited"
+
+    view.set_rows(rows, fmt, variant="masked")  # variant が変わったら覚えた文字列は使わない
+    assert fmt.calls == 1 + VISIBLE_ROWS + OVERSCAN_ROWS
+
+
+def test_selection_follows_the_key_across_reorders(view):
+    rows = rows_of(50)
+    view.set_rows(rows, Formatter(), keys=[r["uid"] for r in rows])
+    view.selection_set(5)
+    assert view.selected_key() == "u5"
+
+    reordered = rows[::-1]
+    view.set_rows(reordered, Formatter(), keys=[r["uid"] for r in reordered])
+    assert view.curselection() == (44,)
+    assert view.selected_key() == "u5"
+
+    remaining = [r for r in rows if r["uid"] != "u5"]
+    view.set_rows(remaining, Formatter(), keys=[r["uid"] for r in remaining])
+    assert view.curselection() == ()
+    assert view.selected_key() is None
@@ -0,0 +1,112 @@
+"""同じ保管庫を2つのプロセス（ここでは2つの Vault）で開いたときの record 単位の合わせ込み"""
+from __future__ import annotations
+
+import pytest
+
+import sqlstore
+import storage
+from helpers import contents, fill
+
+
+STORES = ["locka.enc", "locka.db"]
+
+
+def sites(vault) -> list[str]:
+    return [r["site"] for r in vault.items]
+
+
+@pytest.fixture
+def merges(monkeypatch):
+    """merge_payload を呼んだ回数"""
+    calls = []
+    merge_payload = storage.merge_payload
+
+    def counting(*args):
+        calls.append(args)
+        return merge_payload(*args)
+
+    monkeypatch.setattr(storage, "merge_payload", counting)
+    monkeypatch.setattr(sqlstore, "merge_payload", counting)
+    return calls
+
+
+@pytest.mark.parametrize("name", STORES)
+def test_edits_on_different_records_are_kept(open_vault, name):
+    a = open_vault(name)
+    fill(a, 6)
+    b = open_vault(name)
+
+    a.update(a.items[0]["uid"], site="from-a")
+    a.save()
+    b.update(b.items[1]["uid"], site="from-b")
+    b.delete(b.items[3]["uid"])
+    b.add("added-by-b", "me", "pw", [])
+    b.save()
+
+    reopened = open_vault(name)
+    assert sites(reopened) == ["from-a", "from-b", "site2", "site4", "site5", "added-by-b"]
+    assert contents(b) == contents(reopened)  # 合わせた内容は保存したほうにも取り込まれている
+    assert a.refresh()
+    assert contents(a) == contents(reopened)
+
+
+@pytest.mark.parametrize("name", STORES)
+def test_same_record_newer_edit_wins(open_vault, name):
+    a = open_vault(name)
+    fill(a, 3)
+    b = open_vault(name)
+    uid = a.items[1]["uid"]
+
+    a.update(uid, site="older")
+    b.update(uid, site="newer", pw="changed")
+    a.save()
+    b.save()
+
+    reopened = open_vault(name)
+    assert reopened.get(uid)["site"] == "newer"
+    assert reopened.reveal(reopened.get(uid)) == "changed"
+
+
+@pytest.mark.parametrize("name", STORES)
+def test_edit_beats_delete(open_vault, name):
+    a = open_vault(name)
+    fill(a, 3)
+    b = open_vault(name)
+    uid = a.items[2]["uid"]
+
+    a.delete(uid)
+    a.save()
+    b.update(uid, site="kept")
+    b.save()
+
+    assert open_vault(name).get(uid)["site"] == "kept"
+
+
+@pytest.mark.parametrize("name", STORES)
+def test_merge_only_when_file_changed(open_vault, name, merges):
+    a = open_vault(name)
+    fill(a, 5)
+    b = open_vault(name)
+
+    a.update(a.items[0]["uid"], site="from-a")
+    a.save()
+    assert merges == []  # ほかに保存したプロセスはない
+
+    b.update(b.items[1]["uid"], site="from-b")
+    b.save()
+    assert len(merges) == 1
+
+    for n in range(3):
+        b.update(b.items[2]["uid"], site=f"again{n}")
+        b.save()
+    assert len(merges) == 1  # 合わせた内容を取り込んだので、以後は合わせない
+
+
+def test_direct_compact_does_not_cause_merge(open_vault, merges):
+    vault = open_vault()
+    fill(vault, 5)
+    vault.store.compact(vault.payload())
+    vault.update(vault.items[0]["uid"], site="edited")
+    vault.save()
+    assert merges == []
+    assert contents(open_vault()) == contents(vault)
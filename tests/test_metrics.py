@@ -0,0 +1,64 @@
+"""区間計測の分位点と書き出し形式"""
+from __future__ import annotations
+
+import json
+
+from metrics import Histogram, Metrics, export_path
+
+
+def test_quantiles_use_the_recent_window():
+    hist = Histogram(window=100)
+    for ms in range(1, 101):
+        hist.add(float(ms))
+    assert [hist.quantile(q) for q in (0.5, 0.95, 0.99)] == [51.0, 96.0, 100.0]
+    assert Histogram().quantile(0.5) == 0.0
+
+    for _ in range(100):
+        hist.add(1000.0)  # 古い計測は窓から落ちる
+    summary = hist.summary()
+    assert summary["p50_ms"] == summary["p99_ms"] == 1000.0
+    assert summary["count"] == 200 and summary["max_ms"] == 1000.0
+
+
+def test_span_excludes_paused_time_and_skips_unfinished(monkeypatch):
+    clock = iter([0.0, 0.010, 5.0, 5.005, 9.0])
+    monkeypatch.setattr("metrics.time.perf_counter", lambda: next(clock))
+    metrics = Metrics()
+    span = metrics.span("filter").resume()
+    span.pause()  # 手放している 0.010〜5.0 は数えない
+    span.resume()
+    span.finish()
+    assert metrics.snapshot()["filter"]["last_ms"] == 15.0
+    assert metrics.status_text() == "絞り込み 15.0 ms（p95 15.0 ms）"
+
+    metrics.span("sort").resume()  # finish しない区間は記録しない
+    assert "sort" not in metrics.snapshot()
+
+
+def test_prometheus_text_format():
+    metrics = Metrics()
+    for ms in (10.0, 20.0, 30.0):
+        metrics.record("save", ms)
+    assert metrics.to_prometheus().splitlines() == [
+        "# HELP locka_span_seconds Time spent in each Locka operation.",
+        "# TYPE locka_span_seconds summary",
+        'locka_span_seconds{span="save",quantile="0.5"} 0.020000',
+        'locka_span_seconds{span="save",quantile="0.95"} 0.030000',
+        'locka_span_seconds{span="save",quantile="0.99"} 0.030000',
+        'locka_span_seconds_sum{span="save"} 0.060000',
+        'locka_span_seconds_count{span="save"} 3',
+    ]
+
+
+def test_export_picks_the_format_from_the_suffix(tmp_path, monkeypatch):
+    metrics = Metrics()
+    metrics.record("unlock", 5.0)
+    metrics.export(tmp_path / "locka.prom")
+    metrics.export(tmp_path / "locka.json")
+    assert (tmp_path / "locka.prom").read_text(encoding="utf-8").startswith("# HELP")
+    assert json.loads((tmp_path / "locka.json").read_text(encoding="utf-8"))["spans"]["unlock"]["count"] == 1
+
+    monkeypatch.delenv("LOCKA_METRICS", raising=False)
+    assert export_path() is None
+    monkeypatch.setenv("LOCKA_METRICS", str(tmp_path / "m.prom"))
+    assert export_path() == tmp_path / "m.prom"
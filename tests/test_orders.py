@@ -0,0 +1,72 @@
+"""並び順の索引"""
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from orders import ORDERS, SortIndex, sort_keys
+
+
+def item(uid: str, site: str, created: float, updated: float) -> dict:
+    return {"uid": uid, "site": site, "created_at": created, "updated_at": updated}
+
+
+def expected(items: list[dict], order: str) -> list[str]:
+    """素直に sorted() した並び（同じキーは追加順）"""
+    field, descending = ORDERS[order]
+    pos = ("name", "created", "updated").index(field)
+    return [x["uid"] for x in sorted(items, key=lambda x: sort_keys(x)[pos], reverse=descending)]
+
+
+def uids(rows: list[dict]) -> list[str]:
+    return [x["uid"] for x in rows]
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_duplicate_keys_keep_insertion_order_in_both_directions(order):
+    items = [
+        item("1", "Mail", 1, 5),
+        item("2", "bank", 2, 5),
+        item("3", "mail", 3, 4),
+        item("4", "Bank", 4, 5),
+        item("5", "mail", 5, 4),
+    ]
+    index = SortIndex(items)
+    assert uids(index.ordered(order)) == expected(items, order)
+    assert uids(index.ordered(order, items[:2] + items[3:])) == expected(items[:2] + items[3:], order)
+
+
+def test_name_desc_keeps_ties_in_insertion_order():
+    index = SortIndex([item("1", "GitHub", 1, 1), item("2", "github", 2, 2), item("3", "Bank", 3, 3)])
+    assert uids(index.ordered("name_desc")) == ["1", "2", "3"]
+    assert uids(index.ordered("name_desc", limit=1)) == ["1"]
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_incremental_updates_match_sorted(order):
+    rnd = random.Random(7)
+
+    def make(uid: str) -> dict:
+        return item(uid, rnd.choice(["a", "B", "c", "A"]), rnd.randint(0, 5), rnd.randint(0, 5))
+
+    items = [make(str(n)) for n in range(40)]
+    index = SortIndex(items)
+    index.ordered(order)  # 索引を作ってから差分で更新する
+    for n in range(40, 80):
+        choice = rnd.random()
+        if choice < 0.4:
+            items.append(make(str(n)))
+            index.add(items[-1])
+        elif choice < 0.7:
+            index.remove(items.pop(rnd.randrange(len(items))))
+        else:
+            at = rnd.randrange(len(items))
+            new = make(items[at]["uid"])
+            index.replace(items.pop(at), new)
+            items.append(new)  # 差し替えたものは追加順の最後になる
+    assert uids(index.ordered(order)) == expected(items, order)
+    few = items[::10]  # 候補が少ないときは候補だけを並べる
+    assert uids(index.ordered(order, few)) == expected(few, order)
+    many = items[::2]
+    assert uids(index.ordered(order, many)) == expected(many, order)
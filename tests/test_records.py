@@ -0,0 +1,60 @@
+"""record の持ち方（__slots__・タグの共有）と過去データの移行"""
+from __future__ import annotations
+
+from records import SCHEMA_VERSION, TAGS, Record, migrate_items
+
+
+def seal(plain: str, uid: str) -> str:
+    return f"sealed:{uid}:{plain}"
+
+
+def test_round_trip_keeps_unknown_keys():
+    data = {
+        "uid": "u1", "site": "GitHub", "id": "me", "pw_sealed": "x", "tags": ["仕事"],
+        "created_at": 1.0, "updated_at": 2.0, "note": "メモ",
+    }
+    record = Record.from_dict(data)
+    assert record.to_dict() == data
+    assert record["note"] == "メモ" and "note" in record
+    assert dict(record.items()) == data
+    assert Record.from_dict({"uid": "u2"}).to_dict() == {"uid": "u2", "tags": []}  # ないキーは足さない
+
+
+def test_replace_makes_a_new_record_and_shares_tags():
+    record = Record.from_dict({"uid": "u1", "site": "a", "tags": ["仕事"]})
+    other = Record.from_dict({"uid": "u2", "tags": ["".join(["仕", "事"])]})
+    assert record.tags[0] is other.tags[0]  # 同じタグは同じ str
+    assert TAGS.intern("仕事") is record.tags[0]
+
+    changed = record.replace(site="b")
+    assert changed is not record
+    assert (record["site"], changed["site"]) == ("a", "b")
+    assert changed["uid"] == "u1"
+
+
+def test_migrate_fills_missing_fields_and_seals_plain_passwords():
+    items = [
+        {"site": "a", "pw": "one", "tags": [" 仕事 ", ""]},
+        {"uid": "dup", "site": "b", "tags": "壊れた tags"},
+        {"uid": "dup", "site": "c", "pw_sealed": "old"},
+    ]
+    migrated, changed = migrate_items(items, seal, now=5.0)
+    assert changed
+    first, second, third = migrated
+    assert first["pw_sealed"] == f"sealed:{first['uid']}:one"  # uid を振ってから、その uid に結びつけて封印
+    assert "pw" not in first
+    assert list(first["tags"]) == ["仕事"]
+    assert list(second["tags"]) == []
+    assert (second["created_at"], second["updated_at"]) == (5.0, 5.0)
+    assert second["uid"] == "dup" and third["uid"] != "dup"  # 重複した uid は振り直す
+    assert third["pw_sealed"] == "old"  # rebind を渡さなければ封印済みのものはそのまま
+
+
+def test_migrate_rebinds_sealed_passwords_and_keeps_current_records():
+    current = Record.from_dict({"uid": "u1", "site": "a", "pw_sealed": "s", "tags": [], "created_at": 1.0, "updated_at": 1.0})
+    migrated, changed = migrate_items([current], seal, rebind=lambda sealed, uid: f"{sealed}@{uid}")
+    assert changed and migrated[0]["pw_sealed"] == "s@u1"
+
+    migrated, changed = migrate_items([current], seal)
+    assert not changed and migrated[0] is current  # 移行済みの record は作り直さない
+    assert SCHEMA_VERSION == 3
@@ -0,0 +1,149 @@
+"""検索（トライグラム索引・あいまい検索・検索ジョブ）"""
+from __future__ import annotations
+
+from search import SearchIndex, SearchScheduler
+
+
+def item(uid: str, site: str, user_id: str = "", tags: tuple[str, ...] = ()) -> dict:
+    return {"uid": uid, "site": site, "id": user_id, "tags": list(tags)}
+
+
+def sites(rows: list[dict]) -> list[str]:
+    return [r["site"] for r in rows]
+
+
+def test_search_matches_substring_in_any_field():
+    index = SearchIndex([
+        item("1", "GitHub", "me@example.com"),
+        item("2", "Gmail", "ＧＩＴ-user"),  # 全角・大文字もならして比べる
+        item("3", "Bank", "me", ("仕事",)),
+    ])
+    assert sites(index.search("git")) == ["GitHub", "Gmail"]
+    assert sites(index.search("example")) == ["GitHub"]
+    assert sites(index.search("仕事")) == ["Bank"]
+    assert sites(index.search("gi")) == ["GitHub", "Gmail"]  # 2文字以下は総なめ
+    assert index.search("nothing") == []
+
+
+def test_narrowing_sees_changes_after_the_previous_search():
+    old = item("1", "GitHub")
+    index = SearchIndex([old, item("2", "GitLab")])
+    assert sites(index.search("git")) == ["GitHub", "GitLab"]
+
+    # 打ち足しは前回の結果から探すが、そのあとの追加・差し替え・削除は反映する
+    index.add(item("3", "Gitea"))
+    assert sites(index.search("gite")) == ["Gitea"]
+    assert sites(index.search("git")) == ["GitHub", "GitLab", "Gitea"]
+
+    index.replace(old, item("1", "Bitbucket"))
+    assert sites(index.search("gitl")) == ["GitLab"]
+    assert sites(index.search("git")) == ["GitLab", "Gitea"]
+
+    index.remove(item("2", "GitLab"))
+    assert sites(index.search("gitl")) == []
+    assert sites(index.search("bit")) == ["Bitbucket"]
+
+
+def test_iter_search_yields_between_batches_and_builds_lazily():
+    index = SearchIndex(item(str(n), f"site{n}") for n in range(50))
+    index.add(item("x", "extra"))  # 索引を作る前の追加も載る
+    steps = list(index.iter_search("site", batch=10))
+    assert steps[:-1] and all(step is None for step in steps[:-1])
+    assert len(steps[-1]) == 50
+    assert sites(index.search("extra")) == ["extra"]
+    assert len(index) == 51
+
+
+def test_fuzzy_ranks_the_closest_site_first():
+    index = SearchIndex([
+        item("1", "Stripe", "ghost-user"),
+        item("2", "GitHub", "me"),
+        item("3", "Gmail", "hub"),
+        item("4", "Bank", "me"),
+    ])
+    assert sites(index.rank("gthub"))[0] == "GitHub"  # 部分列（文字の抜け）
+    assert sites(index.rank("githbu"))[0] == "GitHub"  # 隣り合う文字の入れ替え
+    assert "Bank" not in sites(index.rank("gthub"))
+    assert sites(index.rank("gthub me")) == ["GitHub"]  # 全ての語が当たるものだけ
+
+
+def test_fuzzy_keeps_only_the_top_k_in_score_order():
+    index = SearchIndex(item(str(n), f"vault-{n}-backup") for n in range(30))
+    index.add(item("exact", "vau"))
+    ranked = index.rank("vau", limit=5)
+    assert len(ranked) == 5
+    assert ranked[0]["site"] == "vau"  # 短く、丸ごと一致するものが上
+    assert sites(ranked[1:]) == ["vault-0-backup", "vault-1-backup", "vault-2-backup", "vault-3-backup"]  # 同点は追加順
+
+
+class FakeWidget:
+    """after() で予約した関数を溜めておき、テストから1つずつ動かす"""
+
+    def __init__(self):
+        self.pending: dict[str, tuple[int, object]] = {}
+        self._next = 0
+
+    def after(self, ms: int, fn) -> str:
+        self._next += 1
+        after_id = f"after#{self._next}"
+        self.pending[after_id] = (ms, fn)
+        return after_id
+
+    def after_cancel(self, after_id: str):
+        del self.pending[after_id]
+
+    def run_next(self) -> int:
+        after_id = next(iter(self.pending))
+        ms, fn = self.pending.pop(after_id)
+        fn()
+        return ms
+
+
+def job(steps: int, closed: list[str], name: str):
+    """steps 回 None を返してから、1画面分 → 全件 を返す検索ジョブ"""
+    try:
+        for _ in range(steps):
+            yield None
+        yield [name], False
+        yield [name, name], True
+    finally:
+        closed.append(name)
+
+
+def test_scheduler_debounces_and_drops_the_previous_job():
+    widget, closed, delivered = FakeWidget(), [], []
+    scheduler = SearchScheduler(widget, debounce_ms=150)
+    deliver = lambda rows, done: delivered.append((rows, done))
+
+    scheduler.submit(job(0, closed, "g"), deliver, debounce=True)
+    scheduler.submit(job(0, closed, "gi"), deliver, debounce=True)  # 打ち足し → 前のジョブは捨てる
+    assert delivered == []
+    assert len(widget.pending) == 1  # 前の予約は取り消した
+
+    assert widget.run_next() == 150
+    assert delivered == [(["gi"], False), (["gi", "gi"], True)]
+    assert not scheduler.busy and not widget.pending
+
+
+def test_scheduler_time_slices_long_jobs():
+    widget, closed, delivered = FakeWidget(), [], []
+    scheduler = SearchScheduler(widget, slice_ms=0)  # 1区切りごとに手放す
+    scheduler.submit(job(3, closed, "x"), lambda rows, done: delivered.append(done))
+    assert scheduler.busy and delivered == []
+
+    slices = 0
+    while widget.pending:
+        assert widget.run_next() == 1
+        slices += 1
+    assert slices >= 3
+    assert delivered == [False, True]
+    assert closed == ["x"]
+
+
+def test_scheduler_cancel_stops_delivery():
+    widget, closed, delivered = FakeWidget(), [], []
+    scheduler = SearchScheduler(widget, slice_ms=0)
+    scheduler.submit(job(5, closed, "x"), lambda rows, done: delivered.append(done))
+    scheduler.cancel()
+    assert closed == ["x"] and not widget.pending and not scheduler.busy
+    assert delivered == []
@@ -0,0 +1,121 @@
+"""SQLite の保存先（.db）で items を読まずに開いた場合・ほかのプロセスと同時に使う場合"""
+from __future__ import annotations
+
+import dataclasses
+import json
+import sqlite3
+
+import pytest
+
+from bench import bench_policy
+from helpers import PASSWORD, contents, fill
+from security import MIN_PBKDF2_ITERS, KdfParams, KdfPolicy, VaultHeader
+from vault import Vault
+
+
+def open_lazy(tmp_path) -> Vault:
+    path = tmp_path / "locka.db"
+    vault = Vault(path, policy=bench_policy(path))
+    vault.unlock(PASSWORD, lazy=True)
+    return vault
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """SqliteStore.load_items（全行の復号）を呼んだ回数"""
+    import sqlstore
+
+    calls = []
+    load_items = sqlstore.SqliteStore.load_items
+
+    def counting(self):
+        calls.append(self)
+        return load_items(self)
+
+    monkeypatch.setattr(sqlstore.SqliteStore, "load_items", counting)
+    return calls
+
+
+def test_add_without_loading_items(open_vault, tmp_path, loads):
+    fill(open_vault("locka.db"), 20)
+    loads.clear()
+
+    vault = open_lazy(tmp_path)
+    vault.add("added", "me", "new-pw", ["仕事"])
+    vault.add("added2", "me", "pw2", [])
+    vault.save()
+    assert loads == []
+
+    reopened = open_vault("locka.db")
+    assert [r["site"] for r in reopened.items[-2:]] == ["added", "added2"]
+    assert len(reopened.items) == 22
+    assert reopened.reveal(reopened.items[-2]) == "new-pw"
+
+
+def test_items_after_lazy_add(open_vault, tmp_path):
+    fill(open_vault("locka.db"), 5)
+
+    before_save = open_lazy(tmp_path)
+    before_save.add("unsaved", "me", "pw", [])
+    assert [r["site"] for r in before_save.items][-1] == "unsaved"  # 読んだ items の後ろに並ぶ
+    before_save.update(before_save.items[0]["uid"], site="edited")
+    before_save.save()
+    assert contents(open_vault("locka.db")) == contents(before_save)
+
+    after_save = open_lazy(tmp_path)
+    after_save.add("saved", "me", "pw", [])
+    after_save.save()
+    assert [r["site"] for r in after_save.items].count("saved") == 1  # 保存先から読み、二重にならない
+    assert contents(open_vault("locka.db")) == contents(after_save)
+
+
+def test_lazy_add_with_concurrent_save(open_vault, tmp_path):
+    other = open_vault("locka.db")
+    fill(other, 5)
+
+    vault = open_lazy(tmp_path)
+    other.delete(other.items[0]["uid"])
+    other.set_setting("show_pw", False)
+    other.save()
+    vault.add("lazy", "me", "pw", [])
+    vault.save()
+
+    reopened = open_vault("locka.db")
+    assert [r["site"] for r in reopened.items] == ["site1", "site2", "site3", "site4", "lazy"]
+    assert reopened.settings["show_pw"] is False
+
+
+def disk_header(path) -> bytes:
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT value FROM meta WHERE key = 'header'").fetchone()[0]
+
+
+@pytest.mark.parametrize("rewrap", [False, True], ids=["current", "rewrap-pending"])
+def test_save_keeps_another_process_rekey(open_vault, tmp_path, rewrap):
+    # 先に開いていたプロセスの保存が、あとから包み直されたヘッダを開いたときのもので戻さない
+    path = tmp_path / "locka.db"
+    first = open_vault("locka.db")
+    fill(first, 3)
+    stronger = KdfParams(iters=MIN_PBKDF2_ITERS * 3)
+    cache = {"kdf": stronger.kdf, "target_ms": KdfPolicy().target_ms, "params": dataclasses.asdict(stronger)}
+    (tmp_path / "kdf.json").write_text(json.dumps(cache), encoding="utf-8")
+    if rewrap:
+        # こちらも開いた時点で包み直す鍵を作っている（保存はまだ）
+        first = Vault(path, policy=KdfPolicy(kdf=stronger.kdf))
+        first.unlock(PASSWORD)
+
+    second = Vault(path, policy=KdfPolicy(kdf=stronger.kdf))
+    second.unlock(PASSWORD)
+    second.add("second", "me", "pw-2", [])
+    second.save()
+    rekeyed = disk_header(path)
+    assert VaultHeader.unpack(rekeyed).params == stronger
+
+    first.add("first", "me", "pw-1", [])
+    first.save()
+    assert disk_header(path) == rekeyed
+
+    reopened = Vault(path, policy=KdfPolicy(kdf=stronger.kdf))
+    reopened.unlock(PASSWORD)
+    assert [r["site"] for r in reopened.items][-2:] == ["second", "first"]
+    assert reopened.reveal(reopened.items[-1]) == "pw-1"
@@ -0,0 +1,523 @@
+from __future__ import annotations
+
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from audit import AuditIndex
+from facets import TagIndex
+from metrics import METRICS
+from orders import SortIndex
+from records import SCHEMA_VERSION, Record, migrate_items
+from search import SearchIndex
+from security import KdfPolicy, SecretBox
+from storage import open_store, same_record
+
+
+VAULT_PATH = Path("data") / "locka.enc"  # 暗号化データの保存先
+KDF_POLICY = KdfPolicy(kdf="pbkdf2-sha256", target_ms=300)  # 解錠にかける時間の目安（マシンごとに計測して調整）
+DEFAULT_ORDER = "name_asc"  # 既定の並び順（名前昇順）
+DEFAULT_SETTINGS = {"show_pw": True, "show_timing": False}  # 設定の既定値（パスワード表示・処理時間の表示）
+IDLE_TIMEOUT_SEC = 60  # 自動ロックまでの無操作時間（秒。GUI とエージェントで共通）
+_READ = object()  # unlock() で raw を渡さなかった印
+
+
+def parse_tags(text: str) -> list[str]:
+    """カンマ区切りのタグ入力（例: "仕事, SNS"）を list にする"""
+    return [t.strip() for t in text.split(",") if t.strip()]
+
+
+def summarize(record: Record) -> dict:
+    """一覧用の dict（パスワードは含めない）"""
+    return {"uid": record["uid"], "site": record.get("site", ""), "id": record.get("id", ""), "tags": list(record.get("tags", []))}
+
+
+def format_record(record: Record, pw_text: str | None = None) -> str:
+    """一覧の1行（pw_text が None ならパスワード欄を出さない）"""
+    tags = record.get("tags", [])
+    tag_text = f" [{', '.join(tags)}]" if tags else ""
+    pw_part = "" if pw_text is None else f" | PW: {pw_text}"
+    return f"{record.get('site','')} | ID: {record.get('id','')}{pw_part}{tag_text}"
+
+
+class Vault:
+    """
+    GUI を持たない保管庫の本体（開く・解錠・検索・追加・更新・削除・保存）。
+    GUI（app.py）と CLI（locka.py）はどちらもこれを操作する薄い表側。
+
+    - 変更はジャーナルに追記する操作として溜め、take_ops() で取り出す（None なら全体保存が必要）
+    - 検索・タグ・並び順・監査（使い回し・強さ）の索引は最初に使われたときに作る（1件取り出すだけなら作らない）
+    - record は書き換えずに差し替える（索引・チャンクの使い回しが参照の同一性に頼るため）
+    - 保存先はパスの拡張子で決まる（.enc はファイル1つ、.db は SQLite。storage.open_store を参照）
+    - 同じ保管庫をほかのプロセスと共有できる。保存時に先に保存された変更と record 単位で合わせ、
+      refresh() でほかのプロセスの変更を変わった分だけ取り込む
+    """
+
+    def __init__(self, path: Path = VAULT_PATH, policy: KdfPolicy | None = None):
+        self.store = open_store(path, policy=policy or KDF_POLICY, record_factory=Record.from_dict)
+        self.secrets: SecretBox | None = None  # パスワードは必要なときだけ復号する
+        self._items: list[Record] = []  # 保存順（ジャーナルの位置指定はこの並び）
+        self._records: dict[str, Record] = {}  # uid -> record
+        self._deferred = False  # items をまだ読んでいない（lazy で解錠した場合）
+        self._deferred_adds: list[Record] = []  # items を読まないまま追加した record（読むときに後ろへ足す）
+        self.settings: dict[str, Any] = dict(DEFAULT_SETTINGS)
+        self._ops: list[dict] | None = []  # 未保存の操作（None なら全体保存が必要）
+        self._index: SearchIndex | None = None
+        self._tag_index: TagIndex | None = None
+        self._sort_index: SortIndex | None = None
+        self._audit_index: AuditIndex | None = None
+
+    # ---- 開く・解錠 ----
+    def exists(self) -> bool:
+        return self.store.exists()
+
+    def read(self) -> tuple[bytes, bytes] | None:
+        """ファイルを読むだけ（KDFの前に済ませておける）"""
+        return self.store.read()
+
+    def unlock(self, master_password: str, raw: Any = _READ, lazy: bool = False) -> bool:
+        """
+        マスターパスワードで解錠して中身を読み込む（新規なら鍵だけ作る）。
+        過去データを補完・移行した場合は True を返す（次の保存は全体保存になる）。
+        パスワードが違う・壊れている場合は ValueError。
+        lazy なら、保存先が対応していれば items は最初に使うときに読む（SQLite。CLI・エージェント向け）。
+        追加（add）と保存だけなら最後まで読まない。
+        """
+        if raw is _READ:
+            raw = self.store.read()
+        payload = self.store.open(raw, master_password, load_items=not lazy)
+        self.secrets = SecretBox(self.store.session)
+        return self.load(payload)
+
+    def load(self, payload: Any) -> bool:
+        """payloadを反映する。過去データの補完・移行をした場合は True を返す。"""
+        self._deferred = False
+        if isinstance(payload, dict) and "items" not in payload:
+            # items を読まずに開いた。移行が要らなければ、使うときまで読まない
+            if payload.get("schema") == SCHEMA_VERSION:
+                self._replace_items([])
+                settings = payload.get("settings", {}) or {}
+                self.settings = {k: bool(settings.get(k, v)) for k, v in DEFAULT_SETTINGS.items()}
+                self._ops = []
+                self._deferred = True
+                return False
+            payload = {**payload, "items": self.store.load_items()}
+        if payload is None:
+            self._replace_items([])
+            self.settings = dict(DEFAULT_SETTINGS)
+            self._ops = []
+            return False
+        # payload形式の安全策
+        if isinstance(payload, dict):
+            items = payload.get("items", []) or []
+            settings = payload.get("settings", {}) or {}
+            self.settings = {k: bool(settings.get(k, v)) for k, v in DEFAULT_SETTINGS.items()}
+        else:
+            # 旧形式（listだけ保存してた場合）への保険
+            items = payload if isinstance(payload, list) else []
+            self.settings = dict(DEFAULT_SETTINGS)
+        # 補完・移行（tags・時刻・pwの封印・uid）は1回の走査で行い、済んだ版を schema に記録する
+        # 記録済みなら読み込んだ Record をそのまま使う（保存済みのチャンクと共有しているため差し替えない）
+        migrated = not isinstance(payload, dict)
+        if migrated or payload.get("schema") != SCHEMA_VERSION:
+            # schema 2 以前の pw_sealed は uid に結びついていないので、ここで封印し直す
+            items, _ = migrate_items(items, self.secrets.seal, rebind=self.secrets.rebind)
+            migrated = True
+        else:
+            items = [x if isinstance(x, Record) else Record.from_dict(x) for x in items]
+
+        self._replace_items(items)
+        self._ops = None if migrated else []
+        return migrated
+
+    def restore(self, payload: dict):
+        """保存済みの payload（メモリ上）へ戻す。ファイルの読み直し・KDFは不要"""
+        self._replace_items(list(payload["items"]))
+        self.settings = dict(payload["settings"])
+        self._ops = []
+
+    def refresh(self) -> bool:
+        """
+        ほかのプロセス（別のウィンドウ・CLI・スクリプト）が保存した変更を取り込む。変わっていれば True。
+        変わった record だけを差し替えて索引を更新する（全件の復号・索引の作り直しはしない）。
+        未保存の変更があるときは何もしない（次の保存で record 単位に合わせ、そのあと取り込む）。
+        """
+        if self._ops != [] or self._deferred:
+            return False
+        payload = self.store.pull()
+        if payload is None:
+            return False
+
+        settings = payload.get("settings", {}) or {}
+        settings = {k: bool(settings.get(k, v)) for k, v in DEFAULT_SETTINGS.items()}
+        changed = settings != self.settings
+        self.settings = settings
+
+        indexes = self._built_indexes()
+        current = self._records
+        items: list[Record] = []
+        records: dict[str, Record] = {}
+        for record in payload["items"]:
+            uid = record["uid"]
+            old = current.get(uid)
+            if old is not None and same_record(old, record):
+                record = old  # 同じ内容なら手元の record を使い続ける（索引はそのまま）
+            elif old is not None:
+                for ix in indexes:
+                    ix.replace(old, record)
+                changed = True
+            else:
+                for ix in indexes:
+                    ix.add(record)
+                changed = True
+            items.append(record)
+            records[uid] = record
+        for uid, old in current.items():
+            if uid not in records:
+                for ix in indexes:
+                    ix.remove(old)
+                changed = True
+        self._items = items
+        self._records = records
+        return changed
+
+    def lock(self):
+        """復号済みのパスワードを捨てる"""
+        if self.secrets is not None:
+            self.secrets.clear()
+
+    def _replace_items(self, items: list[Record]):
+        self._deferred = False
+        self._deferred_adds = []
+        self._items = items
+        self._records = {item["uid"]: item for item in items}
+        self._index = self._tag_index = self._sort_index = self._audit_index = None
+
+    @property
+    def items(self) -> list[Record]:
+        if self._deferred:
+            self._load_deferred()
+        return self._items
+
+    @property
+    def records(self) -> dict[str, Record]:
+        if self._deferred:
+            self._load_deferred()
+        return self._records
+
+    def _load_deferred(self):
+        # 保存前の追加は保存先の末尾に足される操作なので、読んだ items の後ろに並べれば保存後と同じ並びになる
+        self._replace_items(self.store.load_items() + self._deferred_adds)
+
+    def convert(self, path: Path) -> Vault:
+        """
+        同じ鍵・同じ中身のまま、別の保存先（拡張子で形式が決まる）に書き出して、その Vault を返す。
+        データ鍵を引き継ぐので、封印済みのパスワードは暗号化し直さない。
+        """
+        target = Vault(path, policy=self.store.policy)
+        if target.exists():
+            raise ValueError(f"書き出し先がすでにあります: {path}")
+        target.store.adopt(self.store.session)
+        target.secrets = self.secrets
+        target.settings = dict(self.settings)
+        target._replace_items(list(self.items))
+        target._ops = None
+        target.save()
+        return target
+
+    # ---- 索引（最初に使われたときに作る） ----
+    @property
+    def index(self) -> SearchIndex:
+        if self._index is None:
+            self._index = SearchIndex(self.items)
+        return self._index
+
+    @property
+    def tag_index(self) -> TagIndex:
+        if self._tag_index is None:
+            self._tag_index = TagIndex(self.items)
+        return self._tag_index
+
+    @property
+    def sort_index(self) -> SortIndex:
+        if self._sort_index is None:
+            self._sort_index = SortIndex(self.items)
+        return self._sort_index
+
+    @property
+    def audit_index(self) -> AuditIndex:
+        if self._audit_index is None:
+            # 全件を1回だけ復号して測る（LRU には残さない）。以後はパスワードが変わった record だけ
+            self._audit_index = AuditIndex(self.items, reveal=lambda r: self.reveal(r, remember=False))
+        return self._audit_index
+
+    def warm(self):
+        """検索・タグ・並び順の索引を前もって作っておく（エージェント向け）"""
+        for _ in self.filter_steps("warm", order=None):
+            pass
+        self.sort_index.ordered(DEFAULT_ORDER, limit=1)
+        self.tag_index.counts()
+
+    def _built_indexes(self) -> list:
+        return [ix for ix in (self._index, self._tag_index, self._sort_index, self._audit_index) if ix is not None]
+
+    # ---- 読む ----
+    def get(self, uid: str) -> Record | None:
+        return self.records.get(uid)
+
+    def reveal(self, record: Record, remember: bool = True) -> str:
+        """封印されたパスワードを必要なときだけ復号する（直近の分はLRUに残る。remember=False なら残さない）"""
+        return self.secrets.open(record.get("pw_sealed", ""), record["uid"], remember)
+
+    def filter_steps(
+        self,
+        keyword: str = "",
+        fuzzy: bool = False,
+        tag_mask: int | None = None,
+        order: str | None = DEFAULT_ORDER,
+        page_size: int | None = None,
+        audit: str | None = None,
+    ) -> Iterator[tuple[list[Record], bool] | None]:
+        """
+        絞り込み→並び替えを少しずつ進める。途中は None、表示できる行が出たら (rows, done) を返す。
+        page_size を渡すと、並び替えの前に先頭の1画面分だけを先に返す。
+        audit（"reuse" / "weak"）を渡すと、監査の結果を使い回しのグループ順・弱い順で返す（order は使わない）。
+        所要時間は filter / sort の区間として記録する（yield で手放している間は含めない）。
+        """
+        span = METRICS.span("filter").resume()
+        # 検索対象：site + id + tags（トライグラム索引で候補を絞ってから部分一致）
+        if keyword and fuzzy:
+            # あいまい検索は点数順がそのまま表示順（ソートしない）
+            steps = self.index.iter_rank(keyword)
+            order = None
+        elif keyword:
+            steps = self.index.iter_search(keyword)
+        else:
+            steps = None
+
+        if steps is not None:
+            for rows in steps:
+                if rows is None:
+                    span.pause()
+                    yield None
+                    span.resume()
+        elif tag_mask is not None:
+            # タグの絞り込みはビット集合の演算だけで済ませる（全件は走査しない）
+            rows = self.tag_index.items(tag_mask)
+            tag_mask = None
+        else:
+            rows = None  # 絞り込みなし → 並び順の索引をそのまま読む
+
+        if tag_mask is not None:
+            rows = list(filter(self.tag_index.matcher(tag_mask), rows))
+            span.pause()
+            yield None
+            span.resume()
+
+        if audit is not None:
+            found = self.audit_rows(audit)
+            if rows is not None:
+                allowed = {x["uid"] for x in rows}
+                found = [x for x in found if x["uid"] in allowed]
+            rows, order = found, None
+        span.finish()
+
+        # --- ソート処理（整列済みの索引を歩くだけ） ---
+        if order is not None:
+            span = METRICS.span("sort").resume()
+            if page_size is not None:
+                page = self.sort_index.ordered(order, rows, limit=page_size)
+                if len(page) < page_size:
+                    span.finish()
+                    yield page, True
+                    return
+                span.pause()
+                yield page, False
+                span.resume()
+            rows = self.sort_index.ordered(order, rows)
+            span.finish()
+
+        yield (rows if rows is not None else list(self.items)), True
+
+    def audit_rows(self, audit: str) -> list[Record]:
+        """監査の結果（"reuse": 使い回しのグループを続けて並べたもの、"weak": 弱い順）"""
+        if audit == "reuse":
+            return [record for group in self.audit_index.reuse_groups() for record in group]
+        if audit == "weak":
+            return self.audit_index.weak()
+        raise ValueError(f"未知の監査です: {audit}")
+
+    def query(self, keyword: str = "", fuzzy: bool = False, tags: str | None = None, order: str | None = DEFAULT_ORDER) -> list[Record]:
+        """
+        検索してまとめて返す（CLI・スクリプト向け）。
+        tags は「仕事 AND NOT SNS」のようなタグ式。
+        """
+        tag_mask = self.tag_index.query(tags) if tags else None
+        result: list[Record] = []
+        for step in self.filter_steps(keyword, fuzzy, tag_mask, order):
+            if step is not None:
+                result = step[0]
+        return result
+
+    def find(self, query: str, tags: str | None = None) -> list[Record]:
+        """
+        1件を取り出すための検索（CLI の get・エージェント向け）。
+        サイト名の完全一致 → 部分一致 → あいまい検索の最上位、の順に探す。
+        完全一致は全件をなめるだけで済ませる（検索索引は作らない）。
+        """
+        wanted = query.casefold()
+        find_site = getattr(self.store, "find_site", None)
+        if self._deferred and find_site is not None and not tags:
+            # まだ items を読んでいなければ、サイト名の索引で該当行だけを復号する
+            matches = find_site(query)
+            if matches:
+                return matches
+        matches = [r for r in self.items if str(r.get("site", "")).casefold() == wanted]
+        if matches and tags:
+            matches = list(filter(self.tag_index.matcher(self.tag_index.query(tags)), matches))
+        if not matches:
+            matches = self.query(query, tags=tags)
+        if not matches:
+            matches = self.query(query, fuzzy=True, tags=tags)[:1]
+        return matches
+
+    def lookup(self, query: str, tags: str | None = None, field: str = "pw", matches: list[Record] | None = None) -> dict:
+        """
+        find() の結果を返す形にする。1件に絞れたときだけ value（pw または id）を入れる。
+            {"matches": [summarize() の dict, ...], "value": str | None}
+        matches を渡すと find() を省く（エージェントが覚えておいた結果を使う）。
+        """
+        if field not in ("pw", "id"):
+            raise ValueError(f"未知のフィールドです: {field}")
+        if matches is None:
+            matches = self.find(query, tags)
+        value = None
+        if len(matches) == 1:
+            record = matches[0]
+            value = record.get("id", "") if field == "id" else self.reveal(record)
+        return {"matches": [summarize(r) for r in matches], "value": value}
+
+    # ---- 変更 ----
+    def add(self, site: str, user_id: str, pw: str, tags: Iterable[str] = ()) -> Record:
+        now = time.time()
+        uid = uuid.uuid4().hex
+        record = Record(
+            uid=uid,
+            site=site,
+            id=user_id,
+            pw_sealed=self.secrets.seal(pw, uid),
+            tags=list(tags),
+            created_at=now,
+            updated_at=now,
+        )
+        if self._deferred:
+            # items を読まずに開いた（SQLite の CLI の追加など）。全件は復号せず、保存先で1行足すだけ
+            self._deferred_adds.append(record)
+            self._record_op({"op": "add", "item": record})
+            return record
+        self.items.append(record)
+        self.records[record["uid"]] = record
+        for ix in self._built_indexes():
+            ix.add(record)
+        self._record_op({"op": "add", "item": record})
+        return record
+
+    def update(
+        self,
+        uid: str,
+        site: str | None = None,
+        user_id: str | None = None,
+        pw: str | None = None,
+        tags: Iterable[str] | None = None,
+    ) -> Record:
+        """指定したフィールドだけを差し替えた record を作る（uid と作成日時は引き継ぐ）"""
+        current = self._require(uid)
+        changes: dict[str, Any] = {"updated_at": time.time()}
+        if site is not None:
+            changes["site"] = site
+        if user_id is not None:
+            changes["id"] = user_id
+        if pw is not None:
+            changes["pw_sealed"] = self.secrets.seal(pw, uid)
+        if tags is not None:
+            changes["tags"] = list(tags)
+        record = current.replace(**changes)
+
+        index = self._position_of(current)
+        self.items[index] = record
+        self.records[uid] = record
+        for ix in self._built_indexes():
+            ix.replace(current, record)
+        self._record_op({"op": "update", "index": index, "item": record})
+        return record
+
+    def delete(self, uid: str) -> Record:
+        record = self._require(uid)
+        index = self._position_of(record)
+        for ix in self._built_indexes():
+            ix.remove(record)
+        del self.items[index]
+        del self.records[uid]
+        self._record_op({"op": "delete", "index": index})
+        return record
+
+    def set_setting(self, key: str, value: Any):
+        self.settings[key] = value
+        self._record_op({"op": "settings", "settings": dict(self.settings)})
+
+    def _require(self, uid: str) -> Record:
+        record = self.records.get(uid)
+        if record is None:
+            raise ValueError(f"エントリが見つかりません: {uid}")
+        return record
+
+    def _position_of(self, record: Record) -> int:
+        """record の保存順での位置（ジャーナルの位置指定用。変更操作のときだけ使う）"""
+        return next(i for i, x in enumerate(self.items) if x is record)
+
+    def _record_op(self, op: dict):
+        if self._ops is not None:
+            self._ops.append(op)
+
+    # ---- 保存 ----
+    def payload(self) -> dict:
+        """
+        保存用のpayloadを作る。
+        itemsは浅いコピーで、各recordは書き換えずに差し替える運用なので
+        中身は保存済みスナップショットと共有される。
+        """
+        return {
+            "items": list(self.items),
+            "settings": dict(self.settings),
+            "schema": SCHEMA_VERSION,
+        }
+
+    def take_ops(self) -> list[dict] | None:
+        """溜まっている操作を取り出す（None なら全体保存が必要）"""
+        ops, self._ops = self._ops, []
+        self._deferred_adds = []  # 追加の操作ごと保存先に渡したので、以後は保存先から読む
+        return ops
+
+    def save(self):
+        """
+        溜まっている変更をこの場で保存する（GUIは書き込みスレッド経由で保存する）。
+        ほかのプロセスの変更と合わせて書いたときは、合わせた内容をすぐ取り込む（次の保存でまた合わせないように）。
+        """
+        if self._deferred:
+            # items を読まないまま保存する。payload は追加した分だけ（保存先は操作だけを書き、items は覚えない）
+            payload = {"items": list(self._deferred_adds), "settings": dict(self.settings), "schema": SCHEMA_VERSION}
+        else:
+            payload = self.payload()
+        self.store.commit(payload, self.take_ops())
+        self.refresh()
+
+    def export_plain(self, payload: dict | None = None) -> dict:
+        """パスワードを平文に戻した payload（バックアップ・エクスポート用）"""
+        payload = self.payload() if payload is None else payload
+        items = []
+        for item in payload["items"]:
+            plain = {k: v for k, v in item.items() if k != "pw_sealed"}
+            plain["pw"] = self.reveal(item)
+            items.append(plain)
+        return {**payload, "items": items}